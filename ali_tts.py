@@ -1,15 +1,26 @@
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
-import dashscope
-from dashscope.audio.tts_v2 import VoiceEnrollmentService, SpeechSynthesizer
-import json
 import threading
 import tempfile
 import platform
 import subprocess
 from datetime import datetime
 import re
+from tts_audio import DEFAULT_SAMPLE_RATE, ENCODINGS, encoding_from_label, encoding_label, file_extension, to_file_bytes
+from tts_backend import CosyVoiceBackend, RemoteBackend, SynthesisOptions
+from tts_engine import SynthesisEngine
+from tts_breaker import CircuitBreaker
+from tts_config import ConfigStore
+from tts_cuelist import CACHED, DONE, FAILED, SKIPPED, CueListView
+from tts_enroll import EnrollmentManager, EnrollmentRegistry
+from tts_hedge import HedgePolicy
+from tts_log import LogSink
+from tts_metrics import format_rollup
+from tts_postprocess import PostProcessor
+from tts_progress import ProgressModel, ProgressView
+from tts_quota import QuotaLedger, QuotaScheduler, format_estimate
+from tts_subtitle import clean_subtitle_text, parse_srt, split_cue_paragraphs, split_paragraphs
 
 class VoiceSynthesisApp:
     def __init__(self, root):
@@ -25,21 +36,70 @@ class VoiceSynthesisApp:
         self.api_key = ""
         self.voice_id = ""  # 保留内部使用，不显示在界面
         self.voice_ids = {}  # 存储音色名称到ID的映射 {name: voice_id}
-        self.config_file = "config.json"
         self.temp_audio_file = None
         self.audio_data = None
+        self.audio_encoding = "mp3"  # 当前音频数据的编码
+        self.audio_sample_rate = DEFAULT_SAMPLE_RATE
+        self.encoding = "mp3"  # 输出格式
         self.volume = 5.0  # 保留配置
         self.speech_rate = 1.0  # 保留配置
         self.synthesis_mode = tk.StringVar(value="text")
+        self.subtitle_cues = []  # 已加载的SRT字幕条目，字幕模式下按条目合成
+        self.progress_model = ProgressModel()  # 工作线程更新，界面按固定帧率采样
+        self.postprocessor = PostProcessor()  # 拼接前的静音裁剪、响度归一化与淡入淡出
         
         # Voice ID相关变量（仅内部使用）
         self.voice_id_var = tk.StringVar()
         
+        # 声音复刻登记表（同一参考音频对同一模型只复刻一次），复刻任务在后台执行
+        self.enrollment = EnrollmentManager(
+            EnrollmentRegistry("voice_registry.json"),
+            self._enroll_voice,
+            on_status=self._on_enrollment_status,
+            log=self.log_message
+        )
+        
         # 延迟初始化对话框
         self.api_dialog = None
         self.voice_dialog = None
         self.log_text = None
         
+        # 日志管道（任意线程写入，主线程定时批量刷新到界面；设置TTS_LOG_FILE可同时写入滚动文件）
+        self.log_sink = LogSink(root, max_widget_lines=50, log_file=os.environ.get("TTS_LOG_FILE"))
+        
+        # 配置写入config.json的cosyvoice命名空间；频繁改动合并为一次延迟写入，退出时写入未保存的改动
+        self.config_store = ConfigStore("config.json", log=self.log_message)
+        
+        # 合成引擎（会话池复用WebSocket连接，有界并发，超时调用会被取消并计数）
+        # 设置TTS_SERVICE_URL时作为本地合成服务的客户端，连接、缓存和并发由服务统一管理
+        # 字符配额：按API密钥统计用量，设置了窗口上限时超出的请求等待下一个窗口；
+        # 作为服务客户端时由服务统一记账和限流，客户端不再重复统计
+        # 对冲请求（默认关闭）：耗时超过近期延迟高分位的请求再发一份，先返回的为准
+        # 熔断：服务商连续失败时暂停任务，探测到恢复后自动继续
+        self.quota = QuotaScheduler(ledger=QuotaLedger("quota_usage.json"), log=self.log_message)
+        self.hedge = HedgePolicy(enabled=False)
+        breaker = CircuitBreaker("DashScope", log=self.log_message)
+        service_url = os.environ.get("TTS_SERVICE_URL")
+        if service_url:
+            self.engine = SynthesisEngine(
+                RemoteBackend(service_url, backend="cosyvoice"),
+                max_workers=2,
+                timeout=300,
+                log=self.log_message,
+                breaker=breaker
+            )
+        else:
+            self.engine = SynthesisEngine(
+                CosyVoiceBackend(model='cosyvoice-v2', log=self.log_message),
+                max_workers=2,
+                timeout=30,
+                max_retries=1,
+                log=self.log_message,
+                quota=self.quota,
+                hedge=self.hedge,
+                breaker=breaker
+            )
+        
         # 加载配置
         self.load_config()
         
@@ -48,6 +108,17 @@ class VoiceSynthesisApp:
         
         # 绑定窗口大小变化事件
         self.root.bind("<Configure>", self.on_resize)
+        
+        # 窗口显示后在后台预加载DashScope SDK，首次合成不再付出导入开销
+        threading.Thread(target=self.preload_sdk, daemon=True).start()
+    
+    def preload_sdk(self):
+        """后台导入DashScope SDK"""
+        try:
+            import dashscope  # noqa: F401
+            from dashscope.audio.tts_v2 import SpeechSynthesizer  # noqa: F401
+        except ImportError:
+            self.log_message("警告：未安装dashscope库，无法进行语音合成")
     
     def font_config(self):
         """配置中文字体支持"""
@@ -55,36 +126,41 @@ class VoiceSynthesisApp:
         self.root.option_add("*Font", default_font)
     
     def load_config(self):
-        """从配置文件加载"""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    self.api_key = config.get('api_key', '')
-                    self.voice_id = config.get('voice_id', '')
-                    self.voice_ids = config.get('voice_ids', {})
-                    self.volume = max(0.1, min(10.0, config.get('volume', 5.0)))
-                    self.speech_rate = max(0.5, min(2.0, config.get('speech_rate', 1.0)))
-                    self.voice_id_var.set(self.voice_id)
-            except Exception as e:
-                messagebox.showerror("配置加载错误", f"加载配置文件失败: {str(e)}")
-    
-    def save_config(self):
-        """保存配置（内部自动调用，不通过界面按钮）"""
+        """从配置文件加载（旧版本的平铺配置按其中的本应用字段识别后迁移）"""
+        config = self.config_store.section("cosyvoice", legacy_keys=("speech_rate", "voice_ids"))
+        if config is None:
+            return
         try:
-            self.voice_id = self.voice_id_var.get().strip()
-            config = {
-                'api_key': self.api_key,
-                'voice_id': self.voice_id,
-                'voice_ids': self.voice_ids,
-                'volume': self.volume,
-                'speech_rate': self.speech_rate
-            }
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-            self.log_message("配置已自动保存")
+            self.api_key = config.get('api_key', '')
+            self.voice_id = config.get('voice_id', '')
+            self.voice_ids = config.get('voice_ids', {})
+            self.volume = max(0.1, min(10.0, config.get('volume', 5.0)))
+            self.speech_rate = max(0.5, min(2.0, config.get('speech_rate', 1.0)))
+            if config.get('encoding') in ENCODINGS:
+                self.encoding = config['encoding']
+            self.quota.limit = int(config.get('quota_chars', 0))
+            self.quota.window = float(config.get('quota_window', 60))
+            self.postprocessor.configure(config)
+            self.hedge.configure(config)
+            self.voice_id_var.set(self.voice_id)
         except Exception as e:
-            messagebox.showerror("配置保存错误", f"保存配置文件失败: {str(e)}")
+            messagebox.showerror("配置加载错误", f"加载配置文件失败: {str(e)}")
+    
+    def save_config(self):
+        """保存配置（内部自动调用，不通过界面按钮；延迟合并写入，失败时记录到日志）"""
+        self.voice_id = self.voice_id_var.get().strip()
+        self.config_store.update("cosyvoice", {
+            'api_key': self.api_key,
+            'voice_id': self.voice_id,
+            'voice_ids': self.voice_ids,
+            'volume': self.volume,
+            'speech_rate': self.speech_rate,
+            'encoding': self.encoding,
+            'quota_chars': self.quota.limit,
+            'quota_window': self.quota.window,
+            **self.postprocessor.config(),
+            **self.hedge.config()
+        })
     
     def create_widgets(self):
         """创建界面组件"""
@@ -114,6 +190,8 @@ class VoiceSynthesisApp:
         self.settings_btn.config(menu=self.settings_menu)
         self.settings_menu.add_command(label="API 密钥设置", command=self.show_api_settings)
         self.settings_menu.add_command(label="语音复刻设置", command=self.show_voice_settings)
+        self.settings_menu.add_separator()
+        self.settings_menu.add_command(label="导出性能指标", command=self.export_metrics)
         
         # 1. 语音控制区域
         self.control_frame = tk.LabelFrame(self.main_frame, text="语音参数控制", padx=5, pady=5)
@@ -213,10 +291,10 @@ class VoiceSynthesisApp:
         )
         self.browse_subtitle_btn.grid(row=0, column=2, padx=5, pady=5)
         
-        # 添加"加载字幕到文本框"按钮
+        # 添加"加载字幕"按钮（SRT加载到字幕列表，其他格式提取文本到文本框）
         self.load_subtitle_btn = tk.Button(
             self.subtitle_frame, 
-            text="加载字幕到文本框", 
+            text="加载字幕", 
             command=self.load_subtitle_to_textbox
         )
         self.load_subtitle_btn.grid(row=1, column=0, padx=5, pady=5)
@@ -225,6 +303,9 @@ class VoiceSynthesisApp:
         self.subtitle_status = tk.Label(self.subtitle_frame, text="", fg="blue", font=('SimHei', 9))
         self.subtitle_status.grid(row=1, column=1, sticky=tk.W, pady=5, padx=5)
         
+        # 字幕条目列表（只渲染可见行，合成状态实时更新），加载SRT后显示
+        self.cue_list = CueListView(self.subtitle_frame, height=5)
+        
         # 4. 文本输入区域
         self.text_frame = tk.LabelFrame(self.main_frame, text="合成文本", padx=5, pady=5)
         self.text_frame.grid(row=4, column=0, sticky=tk.NSEW, pady=(0, 10))
@@ -286,6 +367,26 @@ class VoiceSynthesisApp:
         )
         self.save_btn.pack(side=tk.LEFT, padx=3)
         
+        # 合成进度（字幕模式）
+        self.progress = ttk.Progressbar(self.output_frame, orient=tk.HORIZONTAL, mode="determinate")
+        self.progress.grid(row=1, column=0, columnspan=2, sticky=tk.EW, pady=(5, 0), padx=5)
+        self.progress_label = tk.Label(self.output_frame, text="", font=('SimHei', 9))
+        self.progress_label.grid(row=1, column=2, columnspan=2, sticky=tk.W, pady=(5, 0), padx=5)
+        self.progress_view = ProgressView(self.root, self.progress_model, self.progress, self.progress_label)
+        
+        # 输出格式
+        tk.Label(self.output_frame, text="输出格式:", width=10).grid(
+            row=2, column=0, sticky=tk.W, pady=5, padx=(5, 10))
+        self.encoding_combobox = ttk.Combobox(
+            self.output_frame,
+            state="readonly",
+            width=16,
+            values=[label for label, _ in ENCODINGS.values()]
+        )
+        self.encoding_combobox.set(encoding_label(self.encoding))
+        self.encoding_combobox.grid(row=2, column=1, sticky=tk.W, pady=5, padx=5)
+        self.encoding_combobox.bind("<<ComboboxSelected>>", self.on_encoding_selected)
+        
         # 6. 日志区域
         self.log_frame = tk.LabelFrame(self.main_frame, text="操作日志", padx=5, pady=5)
         self.log_frame.grid(row=6, column=0, sticky=tk.NSEW, pady=(0, 10))
@@ -314,6 +415,8 @@ class VoiceSynthesisApp:
         self.clear_log_btn = tk.Button(log_ctrl_frame, text="清空日志", command=self.clear_log)
         self.clear_log_btn.grid(row=0, column=1, sticky=tk.E, padx=5)
         
+        self.log_sink.attach(self.log_text, auto_scroll=self.auto_scroll_var.get)
+        
         # 初始化UI
         self.update_mode_ui()
         self.refresh_voice_combobox()  # 初始化音色列表
@@ -409,25 +512,8 @@ class VoiceSynthesisApp:
             self.log_message(f"更新语速失败: {str(e)}")
     
     def log_message(self, message):
-        """日志显示"""
-        if self.log_text is None:
-            return
-            
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        full_message = f"[{timestamp}] {message}"
-        
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, full_message + "\n")
-        
-        # 限制日志行数
-        line_count = int(self.log_text.index('end-1c').split('.')[0])
-        if line_count > 50:
-            self.log_text.delete(1.0, 2.0)
-            
-        if self.auto_scroll_var.get():
-            self.log_text.see(tk.END)
-            
-        self.log_text.config(state=tk.DISABLED)
+        """日志显示（可在任意线程调用，由日志管道批量刷新到界面）"""
+        self.log_sink.write(message)
     
     def create_api_settings_dialog(self):
         """创建API设置对话框"""
@@ -503,18 +589,14 @@ class VoiceSynthesisApp:
         self.voice_name_entry.grid(row=2, column=1, sticky=tk.W, pady=5, padx=5)
         self.voice_name_entry.insert(0, "我的声音")
         
-        self.reuse_voice_var = tk.BooleanVar(value=True if self.voice_id else False)
-        self.reuse_checkbox = tk.Checkbutton(
-            create_frame, 
-            text="复用现有Voice ID（避免重复创建）", 
-            variable=self.reuse_voice_var
-        )
-        self.reuse_checkbox.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=5, padx=5)
+        # 复刻任务状态（相同音频已复刻过时直接复用登记的Voice ID）
+        self.enroll_status_label = tk.Label(create_frame, text="相同的参考音频不会重复复刻", fg="gray")
+        self.enroll_status_label.grid(row=3, column=0, columnspan=3, sticky=tk.W, pady=5, padx=5)
         
         self.create_voice_btn = tk.Button(
             create_frame, 
             text="创建/更新语音", 
-            command=self.start_create_voice_thread
+            command=self.create_voice
         )
         self.create_voice_btn.grid(row=3, column=3, padx=5, pady=5)
         
@@ -698,6 +780,7 @@ class VoiceSynthesisApp:
             
             if messagebox.askyesno("确认", f"确定要删除音色 '{selected_name}' 吗？"):
                 del self.voice_ids[selected_name]
+                self.enrollment.registry.forget_voice(selected_id)
                 
                 # 如果删除的是当前默认语音，清空默认设置
                 if selected_id == self.voice_id:
@@ -731,6 +814,8 @@ class VoiceSynthesisApp:
         new_api_key = self.api_entry.get().strip()
         if new_api_key:
             self.api_key = new_api_key
+            if hasattr(self.engine.backend, 'pool'):
+                self.engine.backend.pool.clear()  # 旧密钥建立的会话不再复用
             self.save_config()
             self.log_message("API密钥已更新")
             messagebox.showinfo("成功", "API密钥已保存")
@@ -785,7 +870,7 @@ class VoiceSynthesisApp:
             self.subtitle_status.config(text=f"解析错误: {str(e)}", fg="red")
     
     def load_subtitle_to_textbox(self):
-        """加载字幕到文本框，过滤时间戳和数字"""
+        """加载字幕：SRT文件解析为条目显示在字幕列表中，其他格式过滤时间戳和数字后放入文本框"""
         subtitle_path = self.subtitle_path_entry.get().strip()
         if not subtitle_path or not os.path.exists(subtitle_path):
             messagebox.showerror("错误", "请选择有效的字幕文件")
@@ -798,8 +883,18 @@ class VoiceSynthesisApp:
             with open(subtitle_path, 'r', encoding='utf-8', errors='ignore') as f:
                 subtitle_text = f.read()
             
+            # SRT文件按条目显示，合成时直接使用条目文本，不把全文放入文本框
+            self.subtitle_cues = parse_srt(subtitle_text)
+            self.cue_list.load(self.subtitle_cues)
+            if self.subtitle_cues:
+                self.cue_list.frame.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5, padx=5)
+                self.log_message(f"字幕加载完成，共 {len(self.subtitle_cues)} 条字幕")
+                self.subtitle_status.config(text=f"已加载 {len(self.subtitle_cues)} 条字幕，按字幕列表合成", fg="green")
+                return
+            self.cue_list.frame.grid_remove()
+            
             # 解析并过滤字幕内容
-            clean_text = self.parse_and_clean_subtitle(subtitle_text)
+            clean_text = clean_subtitle_text(subtitle_text)
             
             if not clean_text:
                 self.log_message("未从字幕文件中提取到有效文本")
@@ -821,48 +916,6 @@ class VoiceSynthesisApp:
             self.subtitle_status.config(text=error_msg, fg="red")
             messagebox.showerror("错误", error_msg)
     
-    def parse_and_clean_subtitle(self, subtitle_text):
-        """解析字幕并过滤时间戳和数字"""
-        lines = subtitle_text.splitlines()
-        clean_lines = []
-        skip_next_empty = False  # 用于跳过字幕块之间的空行
-        
-        for line in lines:
-            stripped_line = line.strip()
-            
-            # 过滤SRT格式的序号（纯数字）
-            if stripped_line.isdigit():
-                skip_next_empty = True
-                continue
-                
-            # 过滤时间戳（包含 --> 标记）
-            if '-->' in stripped_line:
-                skip_next_empty = True
-                continue
-                
-            # 跳过字幕块之间的空行
-            if not stripped_line:
-                if skip_next_empty:
-                    skip_next_empty = False
-                    continue
-                else:
-                    # 保留文本段落之间的空行
-                    clean_lines.append('')
-                    continue
-            
-            # 重置跳过标记
-            skip_next_empty = False
-            
-            # 处理包含数字的行（只移除纯数字，保留包含数字的文本）
-            if stripped_line.isdigit():
-                continue
-                
-            # 保留有效文本行
-            clean_lines.append(stripped_line)
-        
-        # 合并为极文，使用空行分隔段落
-        return '\n'.join(clean_lines)
-    
     def browse_output_dir(self):
         """浏览输出目录"""
         directory = filedialog.askdirectory()
@@ -870,104 +923,94 @@ class VoiceSynthesisApp:
             self.output_dir_entry.delete(0, tk.END)
             self.output_dir_entry.insert(0, directory)
     
-    def start_create_voice_thread(self):
-        """启动创建语音的线程"""
+    def create_voice(self):
+        """提交语音复刻任务（后台执行，完成后自动加入语音列表）"""
+        # 检查API密钥
         if not self.api_key:
             messagebox.showwarning("提示", "请先在设置中配置API密钥")
             self.show_api_settings()
             return
-            
-        # 禁用按钮防止重复点击
-        self.create_voice_btn.config(state=tk.DISABLED)
         
-        # 启动创建语音线程
-        threading.Thread(
-            target=self.create_voice,
-            daemon=True
-        ).start()
-    
-    def create_voice(self):
-        """创建语音复刻"""
-        try:
-            self.log_message("开始创建语音复刻...")
-            
-            # 检查API密钥
-            if not self.api_key:
-                messagebox.showerror("错误", "请先在设置中配置API密钥")
-                self.log_message("创建失败：未设置API密钥")
-                return
+        # 获取参数
+        url_or_path = self.audio_url_entry.get().strip()
+        prefix = self.prefix_entry.get().strip()
+        target_model = "cosyvoice-v2"
+        voice_name = self.voice_name_entry.get().strip() or f"语音_{datetime.now().strftime('%H%M%S')}"
         
-            # 检查是否复用现有voice_id
-            if self.reuse_voice_var.get() and self.voice_id:
-                self.log_message(f"复用现有Voice ID: {self.voice_id}")
-                messagebox.showinfo("信息", f"已复用现有Voice ID: {self.voice_id}")
-                return
+        if not url_or_path or url_or_path == "https://your-audio-file-url":
+            messagebox.showerror("错误", "请输入有效的音频文件URL或选择本地文件")
+            self.log_message("创建失败：音频文件URL无效")
+            return
         
-            # 获取参数
-            url_or_path = self.audio_url_entry.get().strip()
-            prefix = self.prefix_entry.get().strip()
-            target_model = "cosyvoice-v2"
-            voice_name = self.voice_name_entry.get().strip() or f"语音_{datetime.now().strftime('%H%M%S')}"
-            
-            if not url_or_path or url_or_path == "https://your-audio-file-url":
-                messagebox.showerror("错误", "请输入有效的音频文件URL或选择本地文件")
-                self.log_message("创建失败：音频文件URL无效")
-                return
-            
-            if not prefix:
-                messagebox.showerror("错误", "请输入前缀")
-                self.log_message("创建失败：未输入前缀")
-                return
-            
-            # 设置API密钥
-            dashscope.api_key = self.api_key
-            
-            # 创建语音注册服务实例
-            service = VoiceEnrollmentService()
-            
-            # 判断是URL还是本地文件路径
-            if os.path.exists(url_or_path):
-                self.log_message("警告：使用本地文件路径，需要确保文件可公开访问")
-                url = url_or_path
-            else:
-                url = url_or_path
-            
-            # 调用create_voice方法复刻声音，并生成voice_id
-            self.log_message("正在创建语音，请稍候...")
-            # 获取原始voice_id
-            raw_voice_id = service.create_voice(
-                target_model=target_model, 
-                prefix=prefix, 
-                url=url
-            )
-            
-            # 构建完整的voice_id，确保包含模型前缀
-            if not raw_voice_id.startswith(f"{target_model}-"):
-                self.voice_id = f"{target_model}-{raw_voice_id}"
-            else:
-                self.voice_id = raw_voice_id
-            
-            # 更新界面显示
-            self.root.after(0, lambda: self.voice_id_var.set(self.voice_id))
-            
-            # 自动保存到语音列表
-            self.voice_ids[voice_name] = self.voice_id
-            
-            # 保存配置
-            self.save_config()
-            self.root.after(0, self.refresh_voice_list)
-            self.root.after(0, self.refresh_voice_combobox)
-            
-            self.log_message(f"语音创建成功，Voice ID: {self.voice_id}")
-            self.log_message(f"Request ID: {service.get_last_request_id()}")
-            messagebox.showinfo("成功", f"语音创建成功\nVoice ID: {self.voice_id}")
-            
-        except Exception as e:
-            error_msg = f"创建语音失败: {str(e)}"
+        if not prefix:
+            messagebox.showerror("错误", "请输入前缀")
+            self.log_message("创建失败：未输入前缀")
+            return
+        
+        # 判断是URL还是本地文件路径
+        if os.path.exists(url_or_path):
+            self.log_message("警告：使用本地文件路径，需要确保文件可公开访问")
+        
+        self.enrollment.submit(url_or_path, target_model, prefix, voice_name)
+        self.log_message(f"已提交语音复刻任务: {voice_name}")
+        self.refresh_enrollment_status()
+    
+    def _enroll_voice(self, target_model, prefix, url):
+        """调用DashScope复刻声音，返回完整的Voice ID（在复刻线程中执行）"""
+        import dashscope
+        from dashscope.audio.tts_v2 import VoiceEnrollmentService
+        dashscope.api_key = self.api_key
+        
+        # 创建语音注册服务实例
+        service = VoiceEnrollmentService()
+        self.log_message("正在创建语音，请稍候...")
+        raw_voice_id = service.create_voice(
+            target_model=target_model, 
+            prefix=prefix, 
+            url=url
+        )
+        self.log_message(f"Request ID: {service.get_last_request_id()}")
+        
+        # 构建完整的voice_id，确保包含模型前缀
+        if not raw_voice_id.startswith(f"{target_model}-"):
+            return f"{target_model}-{raw_voice_id}"
+        return raw_voice_id
+    
+    def _on_enrollment_status(self, job):
+        """复刻任务状态变化（在后台线程中回调）"""
+        if job.status == "enrolling":
+            self.log_message(f"参考音频未复刻过，开始复刻: {job.name}")
+        elif job.status in ("done", "reused"):
+            action = "语音创建成功" if job.status == "done" else "该参考音频已复刻过，直接复用"
+            self.log_message(f"{action}，Voice ID: {job.voice_id}（耗时 {job.elapsed:.1f} 秒）")
+            self.root.after(0, lambda: self._apply_enrolled_voice(job))
+        elif job.status == "failed":
+            error_msg = f"创建语音失败: {job.error}"
             self.log_message(error_msg)
-            messagebox.showerror("错误", error_msg)
-        finally:
-            self.root.after(0, lambda: self.create_voice_btn.config(state=tk.NORMAL))
+            self.root.after(0, lambda: messagebox.showerror("错误", error_msg))
+        self.root.after(0, self.refresh_enrollment_status)
+    
+    def _apply_enrolled_voice(self, job):
+        """把复刻得到的Voice ID设为当前音色并加入语音列表"""
+        self.voice_id = job.voice_id
+        self.voice_id_var.set(self.voice_id)
+        if job.voice_id not in self.voice_ids.values():
+            self.voice_ids[job.name] = job.voice_id
+        self.save_config()
+        self.refresh_voice_list()
+        self.refresh_voice_combobox()
+        messagebox.showinfo("成功", f"语音已就绪\nVoice ID: {job.voice_id}")
+    
+    def refresh_enrollment_status(self):
+        """刷新复刻任务状态标签"""
+        if not self.voice_dialog:
+            return
+        counts = self.enrollment.summary()
+        running = counts.get("fingerprinting", 0) + counts.get("enrolling", 0)
+        self.enroll_status_label.config(
+            text=f"复刻任务：进行中 {running}，新建 {counts.get('done', 0)}，"
+                 f"复用 {counts.get('reused', 0)}，失败 {counts.get('failed', 0)}"
+        )
     
     def start_synthesize_based_on_mode(self):
         """根据当前模式启动合成"""
@@ -982,6 +1025,7 @@ class VoiceSynthesisApp:
             return
         
         mode = self.synthesis_mode.get()
+        self.engine.backend.api_key = self.api_key
         
         # 禁用按钮防止重复点击
         self.synthesize_btn.config(state=tk.DISABLED)
@@ -997,69 +1041,37 @@ class VoiceSynthesisApp:
             threading.Thread(target=self.synthesize_text, args=(text,), daemon=True).start()
         else:
             text = self.text_input.get("1.0", tk.END).strip()
-            if not text:
-                messagebox.showerror("错误", "请先加载字幕到文本框")
+            if not text and not self.subtitle_cues:
+                messagebox.showerror("错误", "请先加载字幕")
                 self.synthesize_btn.config(state=tk.NORMAL)
                 return
-            threading.Thread(target=self.synthesize_subtitle, args=(text,), daemon=True).start()
+            self.progress_model.begin(0)
+            self.progress_view.start()
+            self.cue_list.reset()
+            self.cue_list.start()
+            threading.Thread(target=self.synthesize_subtitle, args=(text, self.subtitle_cues), daemon=True).start()
     
     def synthesize_text(self, text):
         """合成文本语音"""
         try:
             self.log_message("开始文本语音合成...")
-            dashscope.api_key = self.api_key
-            
-            synthesizer = SpeechSynthesizer(
-                model='cosyvoice-v2',
-                voice=self.voice_id_var.get()
-            )
             
             # 执行合成
             self.log_message("正在调用API进行语音合成...")
-            result = synthesizer.call(text=text)
+            job = self.engine.new_job("text")
+            try:
+                result = self.engine.synthesize(text, self._synthesis_options(), job=job)
+            finally:
+                self.engine.metrics.end_job(job)
+                self.log_message(format_rollup(self.engine.metrics.rollup(job)))
+            self.audio_data = result.audio
+            self.audio_encoding, self.audio_sample_rate = result.encoding, result.sample_rate
+            self.write_temp_audio()
             
-            # 检查API返回结果类型
-            if isinstance(result, bytes):
-                # 如果返回的是字节流，直接作为音频数据处理
-                self.audio_data = result
-                
-                # 创建临时文件存储合成结果
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as f:
-                    f.write(self.audio_data)
-                    self.temp_audio_file = f.name
-                
-                self.log_message("语音合成成功")
-                self.root.after(0, lambda: self.play_btn.config(state=tk.NORMAL))
-                self.root.after(0, lambda: self.save_btn.config(state=tk.NORMAL))
-                self.log_message(f"合成语音已保存到临时文件: {self.temp_audio_file}")
-                
-            elif isinstance(result, dict):
-                # 如果返回的是字典，按之前的方式处理
-                if result.get('status_code') == 200:
-                    self.audio_data = result.get('audio') or result.get('audio_data')
-                    
-                    if self.audio_data:
-                        # 创建临时文件存储合成结果
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as f:
-                            f.write(self.audio_data)
-                            self.temp_audio_file = f.name
-                        
-                        self.log_message("语音合成成功")
-                        self.root.after(0, lambda: self.play_btn.config(state=tk.NORMAL))
-                        self.root.after(0, lambda: self.save_btn.config(state=tk.NORMAL))
-                        self.log_message(f"合成语音已保存到临时文件: {self.temp_audio_file}")
-                    else:
-                        error_msg = "合成成功但未获取到音频数据"
-                        self.log_message(error_msg)
-                        messagebox.showerror("合成失败", error_msg)
-                else:
-                    error_msg = f"合成失败: {result.get('message', '未知错误')}"
-                    self.log_message(error_msg)
-                    messagebox.showerror("合成失败", error_msg)
-            else:
-                error_msg = f"合成失败: 未知的API返回格式 {type(result)}"
-                self.log_message(error_msg)
-                messagebox.showerror("合成失败", error_msg)
+            self.log_message("语音合成成功" + ("（缓存）" if result.cached else ""))
+            self.root.after(0, lambda: self.play_btn.config(state=tk.NORMAL))
+            self.root.after(0, lambda: self.save_btn.config(state=tk.NORMAL))
+            self.log_message(f"合成语音已保存到临时文件: {self.temp_audio_file}")
                     
         except Exception as e:
             error_msg = f"合成过程出错: {str(e)}"
@@ -1068,35 +1080,19 @@ class VoiceSynthesisApp:
         finally:
             self.root.after(0, lambda: self.synthesize_btn.config(state=tk.NORMAL))
     
-    def synthesize_subtitle(self, text):
-        """合成长字幕语音（支持大文件分块处理）"""
+    def synthesize_subtitle(self, text, cues=None):
+        """合成长字幕语音（支持大文件分块处理）；cues为已加载的SRT条目时按条目合成"""
         try:
             self.log_message("开始处理字幕文本...")
             
-            # 将文本分成多个段落，每段不超过200字（避免API限制）
-            paragraphs = []
-            current_paragraph = []
-            current_length = 0
-            
-            for line in text.splitlines():
-                stripped_line = line.strip()
-                if not stripped_line:  # 保留段落分隔
-                    if current_paragraph:
-                        paragraphs.append(" ".join(current_paragraph))
-                        current_paragraph = []
-                        current_length = 0
-                    continue
-                    
-                if current_length + len(stripped_line) > 200:
-                    paragraphs.append(" ".join(current_paragraph))
-                    current_paragraph = [stripped_line]
-                    current_length = len(stripped_line)
-                else:
-                    current_paragraph.append(stripped_line)
-                    current_length += len(stripped_line)
-            
-            if current_paragraph:
-                paragraphs.append(" ".join(current_paragraph))
+            # 将文本分成多个段落，每段不超过200字（避免API限制）；按条目合并时记录每段包含的条目
+            if cues:
+                paragraphs, members = split_cue_paragraphs(cues, max_chars=200)
+                for cue in cues:
+                    if not cue['text'].strip():
+                        self.cue_list.mark(cue, SKIPPED)
+            else:
+                paragraphs, members = split_paragraphs(text, max_chars=200), None
             
             if not paragraphs:
                 self.log_message("没有可合成的字幕文本")
@@ -1105,49 +1101,63 @@ class VoiceSynthesisApp:
             
             self.log_message(f"字幕文本已分段，共分为 {len(paragraphs)} 段进行合成")
             
-            # 处理所有段落并合并音频
-            all_audio_data = []
-            for i, para in enumerate(paragraphs):
-                self.log_message(f"正在合成第 {i+1}/{len(paragraphs)} 段...")
-                
-                # 为每个段落合成语音，添加超时控制
-                para_audio = self.synthesize_text_segment(para)
-                if not para_audio:
-                    self.log_message(f"第 {i+1} 段合成失败，中止处理")
-                    return
-                    
-                all_audio_data.append(para_audio)
+            # 并发合成所有段落
+            failed_cues = set()  # 超长字幕会分成多段，任一段失败即标记该条失败
+            errors = []
             
-            # 合并所有音频片段（需要安装pydub库）
+            def on_item(index, result, error):
+                if error is not None:
+                    errors.append(index)
+                if members is not None:
+                    for position in members[index]:
+                        if error is not None:
+                            failed_cues.add(position)
+                        if position in failed_cues:
+                            self.cue_list.mark(cues[position], FAILED)
+                        elif result is None:
+                            self.cue_list.mark(cues[position], SKIPPED)
+                        else:
+                            self.cue_list.mark(cues[position], CACHED if result.cached else DONE)
+                if error is not None:
+                    self.log_message(f"第 {index+1} 段合成失败: {str(error)}")
+                elif result is None:
+                    self.log_message(f"第 {index+1} 段没有可合成的文本，已跳过")
+                else:
+                    self.log_message(f"已完成第 {index+1}/{len(paragraphs)} 段")
+            
+            options = self._synthesis_options()
+            self.log_message(format_estimate(self.engine.estimate(paragraphs, options, dedupe=True)))
+            job = self.engine.new_job("subtitle")
             try:
-                from pydub import AudioSegment
-                from io import BytesIO
-                
-                combined = AudioSegment.empty()
-                for audio_data in all_audio_data:
-                    segment = AudioSegment.from_file(BytesIO(audio_data), format="mp3")
-                    combined += segment
-                
-                # 保存合并后的音频
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as f:
-                    combined.export(f, format="mp3")
-                    self.temp_audio_file = f.name
-                
-                # 保存原始数据用于后续保存
-                self.audio_data = combined.export(BytesIO(), format="mp3").read()
+                results = self.engine.synthesize_many(
+                    paragraphs, options, on_item, job=job, progress=self.progress_model,
+                    dedupe=True
+                )
+            finally:
+                self.engine.metrics.end_job(job)
+            self.log_message(format_rollup(self.engine.metrics.rollup(job)))
+            if errors:
+                self.log_message("存在合成失败的段落，中止处理")
+                return
+            results = [result for result in results if result is not None]  # 去掉跳过的空段落
+            if not results:
+                self.log_message("没有可合成的字幕文本")
+                return
+            
+            if self.postprocessor.should_process(options.encoding, self.log_message):
+                results = self.postprocessor.process_results(results)
+                self.log_message(f"音频后处理完成：{len(results)} 段")
+            
+            # 按顺序合并所有音频片段
+            try:
+                self.audio_data = self.engine.merge(results)
+                self.audio_encoding, self.audio_sample_rate = results[0].encoding, results[0].sample_rate
+                self.write_temp_audio()
                 
                 self.log_message("字幕语音合成成功")
                 self.root.after(0, lambda: self.play_btn.config(state=tk.NORMAL))
                 self.root.after(0, lambda: self.save_btn.config(state=tk.NORMAL))
                 
-            except ImportError:
-                self.log_message("警告：未安装pydub库，无法合并音频，仅保存最后一段")
-                self.audio_data = all_audio_data[-1]
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as f:
-                    f.write(self.audio_data)
-                    self.temp_audio_file = f.name
-                self.root.after(0, lambda: self.play_btn.config(state=tk.NORMAL))
-                self.root.after(0, lambda: self.save_btn.config(state=tk.NORMAL))
             except Exception as e:
                 self.log_message(f"音频合并失败: {str(e)}")
                 messagebox.showerror("错误", f"音频合并失败: {str(e)}")
@@ -1157,52 +1167,25 @@ class VoiceSynthesisApp:
             self.log_message(error_msg)
             messagebox.showerror("错误", error_msg)
         finally:
+            self.root.after(0, self.progress_view.stop)
+            self.root.after(0, self.cue_list.stop)
             self.root.after(0, lambda: self.synthesize_btn.config(state=tk.NORMAL))
 
-    def synthesize_text_segment(self, text, timeout=30):
-        """合成文本片段，带超时控制"""
-        try:
-            # 设置超时机制
-            import threading
-            result = [None]
-            error = [None]
-            
-            def synthesis_task():
-                try:
-                    dashscope.api_key = self.api_key
-                    synthesizer = SpeechSynthesizer(
-                        model='cosyvoice-v2',
-                        voice=self.voice_id_var.get()
-                    )
-                    res = synthesizer.call(text=text)
-                    result[0] = res
-                except Exception as e:
-                    error[0] = e
-            
-            thread = threading.Thread(target=synthesis_task)
-            thread.start()
-            thread.join(timeout)
-            
-            if thread.is_alive():
-                self.log_message(f"合成超时（{timeout}秒）")
-                return None
-                
-            if error[0]:
-                self.log_message(f"合成片段出错: {str(error[0])}")
-                return None
-                
-            res = result[0]
-            if isinstance(res, bytes):
-                return res
-            elif isinstance(res, dict) and res.get('status_code') == 200:
-                return res.get('audio') or res.get('audio_data')
-            else:
-                self.log_message(f"片段合成失败: {res.get('message', '未知错误') if isinstance(res, dict) else str(res)}")
-                return None
-                
-        except Exception as e:
-            self.log_message(f"处理片段时出错: {str(e)}")
-            return None
+    def _synthesis_options(self):
+        """当前界面对应的合成参数"""
+        return SynthesisOptions(self.voice_id_var.get(), model='cosyvoice-v2', encoding=self.encoding)
+    
+    def on_encoding_selected(self, event=None):
+        """切换输出格式"""
+        self.encoding = encoding_from_label(self.encoding_combobox.get())
+        self.save_config()
+        self.log_message(f"输出格式已切换为: {encoding_label(self.encoding)}")
+    
+    def write_temp_audio(self):
+        """把当前音频写入临时文件（供试听）"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension(self.audio_encoding)) as f:
+            f.write(to_file_bytes(self.audio_data, self.audio_encoding, self.audio_sample_rate))
+            self.temp_audio_file = f.name
     
     def play_audio(self):
         """播放合成的语音"""
@@ -1246,13 +1229,13 @@ class VoiceSynthesisApp:
                 return
         
         # 生成默认文件名
-        default_filename = f"tts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
+        default_filename = f"tts_{datetime.now().strftime('%Y%m%d_%H%M%S')}{file_extension(self.audio_encoding)}"
         save_path = os.path.join(output_dir, default_filename)
         
         try:
-            # 直接使用API返回的音频数据保存
+            # 直接使用API返回的音频数据保存（裸PCM封装为WAV）
             with open(save_path, 'wb') as f:
-                f.write(self.audio_data)
+                f.write(to_file_bytes(self.audio_data, self.audio_encoding, self.audio_sample_rate))
             
             self.log_message(f"音频已保存到: {save_path}")
             messagebox.showinfo("成功", f"音频已保存到:\n{save_path}")
@@ -1261,11 +1244,28 @@ class VoiceSynthesisApp:
             self.log_message(error_msg)
             messagebox.showerror("错误", error_msg)
     
+    def export_metrics(self):
+        """导出请求计时指标（JSON Lines + Prometheus文本格式）"""
+        if not self.engine.metrics.jobs():
+            messagebox.showinfo("提示", "暂无指标数据")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("所有文件", "*.*")],
+            title="导出性能指标"
+        )
+        if file_path:
+            try:
+                prom_path = self.engine.metrics.export(file_path)
+                self.log_message(f"指标已导出到: {file_path} 和 {prom_path}")
+            except Exception as e:
+                error_msg = f"导出指标失败: {str(e)}"
+                self.log_message(error_msg)
+                messagebox.showerror("错误", error_msg)
+    
     def clear_log(self):
         """清空日志"""
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
+        self.log_sink.clear()
         self.log_message("日志已清空")
     
     def on_resize(self, event):
@@ -0,0 +1,27 @@
+from tts_audio import merge_audio, mp3_duration_ms, strip_mp3_tags
+
+HEADER = b'\xff\xfb\x90\xc0'  # MPEG-1 Layer III，128kbps，44.1kHz，单声道
+FRAME_BYTES = 417
+
+
+def frame(payload=b''):
+    return (HEADER + payload).ljust(FRAME_BYTES, b'\x00')
+
+
+def segment(frames):
+    id3v2 = b'ID3\x03\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10
+    info = frame(b'\x00' * 17 + b'Info')  # 单声道MPEG-1的边信息为17字节
+    id3v1 = b'TAG'.ljust(128, b'\x00')
+    return id3v2 + info + frame() * frames + id3v1
+
+
+def test_strip_mp3_tags_keeps_only_audio_frames():
+    assert strip_mp3_tags(segment(2)) == frame() * 2
+    assert strip_mp3_tags(frame() * 2) == frame() * 2
+
+
+def test_merged_mp3_has_no_per_segment_headers():
+    merged = merge_audio([segment(2), segment(3)], 'mp3')
+    assert merged == frame() * 5
+    assert b'Info' not in merged and b'ID3' not in merged and b'TAG' not in merged
+    assert mp3_duration_ms(merged) == 5 * 1152 * 1000 // 44100
@@ -0,0 +1,65 @@
+import pytest
+
+from tts_backend import BackendError, FakeBackend, SynthesisOptions
+from tts_breaker import CircuitBreaker
+from tts_engine import SynthesisEngine
+
+
+def test_opens_after_threshold_and_success_closes():
+    breaker = CircuitBreaker("test", threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and breaker.stats()["trips"] == 1
+    breaker.record_success()
+    assert not breaker.is_open and breaker.failures == 0
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker("test", threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_probe_closes_half_open_and_next_failure_reopens():
+    breaker = CircuitBreaker("test", threshold=3, probe_interval=0)
+    for _ in range(3):
+        breaker.record_failure()
+    breaker.wait(probe=lambda: True)
+    assert not breaker.is_open and breaker.probes == 1
+    breaker.record_failure()  # 半开状态：一次失败即重新打开
+    assert breaker.is_open and breaker.trips == 2
+
+
+def test_failed_probe_backs_off():
+    breaker = CircuitBreaker("test", threshold=1, probe_interval=0.05, max_probe_interval=0.15)
+    breaker.record_failure()
+    outcomes = iter([False, False, True])
+    breaker.wait(probe=lambda: next(outcomes))
+    assert breaker.probes == 3 and not breaker.is_open
+    assert breaker._interval == 0.15  # 0.05 -> 0.1 -> 0.15（上限）
+
+
+class BrokenBackend(FakeBackend):
+    """服务商可达（探测通过），但这条请求总是失败"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def synthesize(self, text, options, token=None):
+        self.calls += 1
+        raise BackendError("模拟5xx", retryable=True)
+
+
+def test_outage_resends_are_capped():
+    backend = BrokenBackend()
+    breaker = CircuitBreaker("fake", threshold=1, probe_interval=0)
+    engine = SynthesisEngine(backend, timeout=5, breaker=breaker, max_retries=1, retry_backoff=0,
+                             max_resends=2)
+    with pytest.raises(BackendError):
+        engine.synthesize("你好", SynthesisOptions("v"))
+    assert backend.calls == 1 + 2 + 1  # 首次请求 + 故障恢复后重发 + 普通重试
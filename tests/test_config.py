@@ -0,0 +1,78 @@
+import json
+import os
+import stat
+import time
+
+from tts_config import CONFIG_VERSION, ConfigStore
+
+
+def count_writes(store):
+    writes = []
+    write = store._write
+
+    def counted(changes):
+        writes.append(changes)
+        write(changes)
+
+    store._write = counted
+    return writes
+
+
+def test_rapid_changes_are_written_once(tmp_path):
+    path = str(tmp_path / "config.json")
+    store = ConfigStore(path, delay=0.1, max_delay=5)
+    writes = count_writes(store)
+    for speed in range(10):
+        store.update("volcano", {"speed": speed})
+    assert not os.path.exists(path)
+    time.sleep(0.4)
+    assert len(writes) == 1
+    assert json.load(open(path, encoding="utf-8"))["volcano"] == {"speed": 9}
+
+
+def test_continuous_changes_are_written_by_max_delay(tmp_path):
+    path = str(tmp_path / "config.json")
+    store = ConfigStore(path, delay=0.2, max_delay=0.3)
+    writes = count_writes(store)
+    deadline = time.monotonic() + 0.6
+    while time.monotonic() < deadline and not writes:
+        store.update("volcano", {"speed": time.monotonic()})
+        time.sleep(0.05)
+    assert writes  # 持续改动时不会无限推迟
+    store.flush()
+
+
+def test_write_is_atomic_private_and_keeps_other_sections(tmp_path):
+    path = str(tmp_path / "config.json")
+    volcano, cosyvoice = ConfigStore(path), ConfigStore(path)
+    volcano.update("volcano", {"api_key": "a"})
+    cosyvoice.update("cosyvoice", {"api_key": "b"})
+    assert volcano.flush() and cosyvoice.flush()
+    data = json.load(open(path, encoding="utf-8"))
+    assert data == {"version": CONFIG_VERSION, "volcano": {"api_key": "a"}, "cosyvoice": {"api_key": "b"}}
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(tmp_path) == ["config.json"]
+
+
+def test_legacy_config_is_claimed_by_matching_section(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"voice_id": "S_1", "speed": 1.2}), encoding="utf-8")
+    store = ConfigStore(str(path))
+    assert store.section("cosyvoice", legacy_keys=("voice_id_var",)) is None
+    legacy = store.section("volcano", legacy_keys=("voice_id",))
+    assert legacy == {"voice_id": "S_1", "speed": 1.2}
+    store.update("volcano", legacy)
+    store.flush()
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert "legacy" not in data and data["volcano"]["voice_id"] == "S_1"
+
+
+def test_failed_write_is_retried(tmp_path):
+    path = str(tmp_path / "missing" / "config.json")
+    messages = []
+    store = ConfigStore(path, log=messages.append)
+    store.update("volcano", {"speed": 1})
+    assert not store.flush() and messages
+    os.mkdir(tmp_path / "missing")
+    assert store.flush()
+    assert json.load(open(path, encoding="utf-8"))["volcano"] == {"speed": 1}
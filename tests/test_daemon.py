@@ -0,0 +1,48 @@
+import json
+import os
+import time
+
+from tts_backend import FakeBackend, SynthesisOptions
+from tts_daemon import DirectoryWatcher, WatchDaemon, status_path
+from tts_engine import SynthesisEngine
+
+SRT = "1\n00:00:00,000 --> 00:00:01,000\n你好\n\n2\n00:00:01,000 --> 00:00:02,000\n再见\n\n"
+
+
+def test_initial_scan_waits_for_files_still_being_written(tmp_path):
+    done, writing = tmp_path / "done.srt", tmp_path / "writing.srt"
+    done.write_text(SRT, encoding="utf-8")
+    old = time.time() - 60
+    os.utime(done, (old, old))
+    writing.write_text(SRT[:20], encoding="utf-8")
+    ready = []
+    watcher = DirectoryWatcher(str(tmp_path), lambda path, mtime, size: ready.append(path),
+                               interval=10, use_inotify=False)
+    watcher.scan(initial=True)
+    assert ready == [str(done)]
+    writing.write_text(SRT, encoding="utf-8")  # 写入仍在继续
+    watcher.scan()
+    assert str(writing) not in ready
+    watcher.scan()  # 两次扫描间未变化，视为已写完
+    assert str(writing) in ready
+
+
+def test_merge_is_bounded_by_job_timeout(tmp_path):
+    path = tmp_path / "slow.srt"
+    path.write_text(SRT, encoding="utf-8")
+    engine = SynthesisEngine(FakeBackend(), timeout=5)
+    daemon = WatchDaemon(str(tmp_path), engine, SynthesisOptions("v", encoding="wav"),
+                         use_inotify=False, job_timeout=0.5)
+    daemon.engine.merge = lambda results: time.sleep(2) or b""
+    daemon.queue.enqueue(str(path), 0, 0)
+    start = time.monotonic()
+    try:
+        daemon._process(daemon.queue.claim())
+    finally:
+        daemon._merger.shutdown(wait=False)
+        daemon.queue.close()
+        engine.close()
+    assert time.monotonic() - start < 1.5
+    status = json.load(open(status_path(str(path)), encoding="utf-8"))
+    assert status["status"] == "failed" and "超时" in status["error"]
+    assert not (tmp_path / "slow.wav").exists()
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import Future
+
+from tts_backend import FakeBackend, SynthesisOptions
+from tts_engine import SynthesisEngine
+from tts_executor import SynthesisTimeout
+
+
+class HangingBackend(FakeBackend):
+    """文本为“卡住”的请求一直不返回（被取消时结束），其余请求很快完成"""
+
+    def synthesize(self, text, options, token=None):
+        if text == "卡住":
+            token.wait(5)
+            token.raise_if_cancelled()
+        else:
+            time.sleep(0.05)
+        return super().synthesize(text, options, token)
+
+
+def test_hung_request_expires_while_others_keep_finishing():
+    engine = SynthesisEngine(HangingBackend(), max_workers=2, timeout=0.3)
+    texts = ["卡住"] + [f"第{i}句" for i in range(40)]
+    finished = {}
+    started = time.monotonic()
+
+    def on_item(index, result, error):
+        finished[index] = (time.monotonic() - started, error)
+
+    try:
+        results = engine.synthesize_many(texts, SynthesisOptions("v"), on_item)
+    finally:
+        engine.close()
+    elapsed, error = finished[0]
+    assert results[0] is None and isinstance(error, SynthesisTimeout)
+    assert elapsed < 1.0  # 其余40条约需2秒，卡住的请求不必等它们全部完成
+    assert all(result is not None for result in results[1:])
+
+
+def test_expire_skips_requests_with_paused_timer():
+    engine = SynthesisEngine(FakeBackend(), timeout=0.1)
+    running = {0: {'index': 0, 'started': None, 'future': Future(), 'token': None}}
+    try:
+        assert engine._expire(running) == []
+    finally:
+        engine.close()
+    assert 0 in running
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from tts_backend import FakeBackend, SynthesisOptions
+from tts_engine import SynthesisEngine
+from tts_hedge import HedgePolicy
+
+
+class StallingBackend(FakeBackend):
+    """第一次调用耗时1秒（被取消时提前结束），之后的调用立即返回"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def synthesize(self, text, options, token=None):
+        with self._calls_lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            token.wait(1)
+            token.raise_if_cancelled()
+        return super().synthesize(text, options, token)
+
+
+def make_engine(max_workers, **hedge):
+    policy = HedgePolicy(min_samples=0, min_delay=0.05, **hedge)
+    return SynthesisEngine(StallingBackend(), max_workers=max_workers, timeout=3, hedge=policy)
+
+
+def test_hedge_runs_on_an_idle_worker_and_wins():
+    engine = make_engine(max_workers=2)
+    result = engine.synthesize("你好", SynthesisOptions("v"))
+    assert result.audio
+    assert engine.hedge.stats()["wins"] == 1
+    assert engine.backend.calls == 2
+
+
+def test_no_hedge_when_executor_is_saturated():
+    engine = make_engine(max_workers=1)
+    engine.synthesize("你好", SynthesisOptions("v"))  # 唯一的工作线程被占用，原请求等满1秒
+    stats = engine.hedge.stats()
+    assert stats["hedged"] == 0 and stats["in_flight"] == 0
+    assert engine.backend.calls == 1
+
+
+def test_hedges_in_flight_are_capped():
+    policy = HedgePolicy(min_samples=0, burst=10, max_in_flight=1)
+    assert policy.acquire()
+    assert not policy.acquire()
+    policy.release()
+    assert policy.acquire()
+    policy.release(launched=False)
+    assert policy.stats()["hedged"] == 1
+
+
+class UninterruptibleBackend(FakeBackend):
+    """记录同时进行的调用数；slow中的文本第一次调用耗时0.3秒且不响应取消（如火山的POST）"""
+
+    def __init__(self, slow):
+        super().__init__()
+        self.slow = set(slow)
+        self.active = 0
+        self.peak = 0
+        self._active_lock = threading.Lock()
+
+    def synthesize(self, text, options, token=None):
+        with self._active_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            first = text in self.slow
+            self.slow.discard(text)
+        try:
+            time.sleep(0.3 if first else 0.01)
+            return super().synthesize(text, options, token)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+def test_hedging_keeps_backend_calls_within_max_workers():
+    # 每个请求都对冲且对冲先返回，输掉的原请求不能中断，必须等它返回后才算结束
+    texts = [f"第{i}句" for i in range(4)]
+    backend = UninterruptibleBackend(slow=texts)
+    policy = HedgePolicy(min_samples=0, min_delay=0.02, budget=1.0, burst=10)
+    engine = SynthesisEngine(backend, max_workers=2, timeout=5, hedge=policy)
+    for text in texts:
+        assert engine.synthesize(text, SynthesisOptions("v")).audio
+    assert policy.stats()["wins"] == len(texts)
+    assert backend.peak <= 2
+    assert policy.stats()["in_flight"] == 0
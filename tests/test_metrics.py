@@ -0,0 +1,30 @@
+from tts_metrics import MetricsCollector, RequestMetrics
+
+
+def record_jobs(collector, count, backend="fake"):
+    for number in range(count):
+        job = f"job-{number}"
+        collector.begin_job(job)
+        metrics = RequestMetrics(job, backend, 1)
+        metrics.ok, metrics.total, metrics.chars = True, 0.1, 3
+        collector.record(metrics)
+        collector.end_job(job)
+
+
+def test_prometheus_export_has_no_per_job_series():
+    collector = MetricsCollector(max_jobs=2)
+    record_jobs(collector, 5)
+    text = collector.to_prometheus()
+    assert "job=" not in text
+    series = [line for line in text.splitlines() if not line.startswith("#")]
+    record_jobs(collector, 50)
+    assert len([line for line in collector.to_prometheus().splitlines() if not line.startswith("#")]) == len(series)
+
+
+def test_counters_survive_job_eviction():
+    collector = MetricsCollector(max_jobs=2)
+    record_jobs(collector, 5)
+    text = collector.to_prometheus()
+    assert 'tts_requests_total{backend="fake",status="ok"} 5' in text
+    assert 'tts_chars_total{backend="fake"} 15' in text
+    assert 'tts_request_seconds_count{backend="fake",phase="total"} 5' in text
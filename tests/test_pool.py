@@ -0,0 +1,64 @@
+import sys
+import types
+
+import tts_backend
+from tts_backend import CosyVoiceBackend, SynthesisOptions, dashscope_session_healthy
+from tts_executor import CancelToken
+from tts_pool import SynthesizerPool
+
+
+class FakeSynthesizer:
+    def __init__(self, connected=True):
+        self.ws = types.SimpleNamespace(sock=types.SimpleNamespace(connected=connected))
+        self.cancelled = 0
+        self.closed = False
+
+    def call(self, text):
+        return b"audio"
+
+    def streaming_cancel(self):
+        self.cancelled += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_unhealthy_sessions_are_not_reused():
+    made = []
+
+    def factory(model, voice, audio_format):
+        made.append(FakeSynthesizer())
+        return made[-1]
+
+    pool = SynthesizerPool(factory, health_check=dashscope_session_healthy)
+    pool.run("m", "v", lambda s: s.call("a"))
+    pool.run("m", "v", lambda s: s.call("b"))
+    assert len(made) == 1 and pool.reused == 1
+    made[0].ws.sock.connected = False  # 服务端关闭了空闲连接
+    pool.run("m", "v", lambda s: s.call("c"))
+    assert len(made) == 2 and made[0].closed
+
+
+def test_sessions_are_not_shared_across_api_keys():
+    pool = SynthesizerPool(lambda m, v, f: FakeSynthesizer(), idle_timeout=0)
+    pool.run("m", "v", lambda s: s.call("a"), tenant="key-a")
+    pool.run("m", "v", lambda s: s.call("a"), tenant="key-b")
+    assert pool.created == 2 and pool.reused == 0
+
+
+def test_cosyvoice_default_pool_checks_health():
+    assert CosyVoiceBackend().pool._health_check is dashscope_session_healthy
+
+
+def test_cancel_after_release_does_not_touch_pooled_session(monkeypatch):
+    monkeypatch.setitem(sys.modules, "dashscope", types.ModuleType("dashscope"))
+    monkeypatch.setattr(tts_backend, "_DASHSCOPE_KEYS", tts_backend._ApiKeyGate())
+    synthesizer = FakeSynthesizer()
+    pool = SynthesizerPool(lambda m, v, f: synthesizer, idle_timeout=0)
+    backend = CosyVoiceBackend(api_key="key", pool=pool)
+    token = CancelToken()
+    result = backend.synthesize("你好", SynthesisOptions("v", encoding="mp3"), token)
+    assert result.audio == b"audio"
+    token.cancel()  # 会话已归还池中，可能正被其他请求使用
+    assert synthesizer.cancelled == 0
+    assert pool.stats()["idle"] == 1
@@ -0,0 +1,17 @@
+from tts_postprocess import PostProcessor
+
+
+def test_skip_reason_is_logged_once():
+    processor = PostProcessor()
+    messages = []
+    assert not processor.should_process("mp3", messages.append)
+    assert not processor.should_process("mp3", messages.append)
+    assert len(messages) == 1 and "MP3" in messages[0]
+    assert processor.should_process("wav", messages.append)
+    assert len(messages) == 1
+
+
+def test_disabled_processor_is_silent():
+    messages = []
+    assert not PostProcessor(enabled=False).should_process("mp3", messages.append)
+    assert messages == []
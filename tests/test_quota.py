@@ -0,0 +1,186 @@
+import json
+import time
+
+import pytest
+
+from tts_backend import BackendError, FakeBackend, SynthesisOptions
+from tts_breaker import CircuitBreaker
+from tts_engine import SynthesisEngine
+from tts_hedge import HedgePolicy
+from tts_quota import QuotaLedger, QuotaScheduler, key_id
+
+
+def test_ledgers_sharing_a_file_merge_usage(tmp_path):
+    path = str(tmp_path / "quota_usage.json")
+    first, second = QuotaLedger(path), QuotaLedger(path)
+    first.record("key", "job-a", 10, window_start=60)
+    first.save()
+    second.record("key", "job-b", 5, window_start=60)
+    first.record("key", "job-a", 3, window_start=60)
+    second.save()
+    first.save()
+    entry = json.load(open(path, encoding="utf-8"))[key_id("key")]
+    assert entry["total"] == 18
+    assert entry["jobs"] == {"job-b": 5, "job-a": 13}
+    assert entry["window"] == [60, 18]
+    # 保存时同步其他进程已写入的用量（second保存时已包含first先保存的10个字符）
+    assert second.usage("key")["total"] == 15
+    assert first.usage("key")["total"] == 18
+    assert QuotaLedger(path).window_usage("key", 60) == 18
+
+
+def test_ledger_keeps_newer_window(tmp_path):
+    path = str(tmp_path / "quota_usage.json")
+    old, new = QuotaLedger(path), QuotaLedger(path)
+    new.record("key", "job", 4, window_start=120)
+    new.save()
+    old.record("key", "job", 7, window_start=60)
+    old.save()
+    assert QuotaLedger(path).window_usage("key", 120) == 4
+    assert QuotaLedger(path).usage("key")["total"] == 11
+
+
+class FlakyBackend(FakeBackend):
+    """前failures次调用返回可重试的错误"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.calls = 0
+
+    def synthesize(self, text, options, token=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise BackendError("模拟失败", retryable=True)
+        return super().synthesize(text, options, token)
+
+
+class CountingQuota(QuotaScheduler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reserved = 0
+
+    def try_acquire(self, api_key, chars):
+        window = super().try_acquire(api_key, chars)
+        if window is not None:
+            self.reserved += 1
+        return window
+
+    def acquire(self, api_key, chars, token=None):
+        self.reserved += 1
+        return super().acquire(api_key, chars, token)
+
+
+def test_each_retry_reserves_quota():
+    quota = CountingQuota()
+    engine = SynthesisEngine(FlakyBackend(failures=1), max_retries=1, retry_backoff=0, quota=quota)
+    try:
+        engine.synthesize("你好", SynthesisOptions("v"))
+    finally:
+        engine.close()
+    assert quota.reserved == 2
+    assert quota.ledger.usage("")["total"] == 2  # 失败的那次已退还
+
+
+def test_quota_wait_does_not_count_against_timeout():
+    breaker = CircuitBreaker("fake", threshold=1)
+    quota = QuotaScheduler(limit=2, window=1.0)
+    engine = SynthesisEngine(FakeBackend(), timeout=0.3, quota=quota, breaker=breaker)
+    try:
+        engine.synthesize("你好", SynthesisOptions("v"))
+        started = time.monotonic()
+        engine.synthesize("再见", SynthesisOptions("v"))  # 等下一个配额窗口
+        assert time.monotonic() - started <= 1.5
+    finally:
+        engine.close()
+    assert not breaker.is_open
+    assert breaker.failures == 0
+
+
+def test_provider_timeout_is_recorded():
+    breaker = CircuitBreaker("fake", threshold=1)
+    engine = SynthesisEngine(FakeBackend(latency=1.0), timeout=0.2, breaker=breaker)
+    try:
+        with pytest.raises(Exception) as info:
+            engine.synthesize("你好", SynthesisOptions("v"))
+    finally:
+        engine.close()
+    assert type(info.value).__name__ == "SynthesisTimeout"
+    assert breaker.is_open
+
+
+def test_ledger_save_failure_does_not_fail_requests(tmp_path):
+    path = str(tmp_path / "quota_usage.json")
+    messages = []
+    ledger = QuotaLedger(path, save_interval=0.01)
+    quota = QuotaScheduler(ledger=ledger, log=messages.append)
+
+    def locked():
+        raise TimeoutError("等待文件锁超时")
+
+    ledger.save = locked
+    engine = SynthesisEngine(FakeBackend(), quota=quota)
+    try:
+        for text in ("你好", "再见"):
+            assert engine.synthesize(text, SynthesisOptions("v")).audio
+        time.sleep(0.1)
+    finally:
+        engine.close()
+    assert ledger.usage("")["total"] == 4
+    assert any("保存配额统计失败" in message for message in messages)
+    del ledger.save  # 恢复后下次保存写入全部用量
+    assert ledger.flush()
+    assert QuotaLedger(path).usage("")["total"] == 4
+
+
+class BrokenCommitQuota(QuotaScheduler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.refunded = 0
+
+    def commit(self, api_key, job, chars, window_start):
+        raise OSError("磁盘已满")
+
+    def refund(self, api_key, chars, window_start):
+        self.refunded += 1
+        super().refund(api_key, chars, window_start)
+
+
+def test_commit_failure_keeps_successful_result():
+    messages = []
+    quota = BrokenCommitQuota()
+    engine = SynthesisEngine(FakeBackend(), quota=quota, log=messages.append)
+    try:
+        assert engine.synthesize("你好", SynthesisOptions("v")).audio
+    finally:
+        engine.close()
+    assert quota.refunded == 0  # 已计费的请求不退还配额
+    assert any("配额记账失败" in message for message in messages)
+
+
+class SlowFirstBackend(FakeBackend):
+    """第一次调用耗时1秒（被取消时提前结束），之后的调用立即返回"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def synthesize(self, text, options, token=None):
+        self.calls += 1
+        if self.calls == 1:
+            token.wait(1)
+            token.raise_if_cancelled()
+        return super().synthesize(text, options, token)
+
+
+def test_commit_failure_in_winning_hedge_keeps_result():
+    quota = BrokenCommitQuota()
+    hedge = HedgePolicy(min_samples=0, min_delay=0.05)
+    engine = SynthesisEngine(SlowFirstBackend(), max_workers=2, timeout=5, quota=quota, hedge=hedge)
+    try:
+        started = time.monotonic()
+        assert engine.synthesize("你好", SynthesisOptions("v")).audio
+        assert time.monotonic() - started < 0.9
+    finally:
+        engine.close()
+    assert hedge.stats()["wins"] == 1
@@ -0,0 +1,84 @@
+import threading
+
+from tts_backend import FakeBackend, SynthesisOptions
+from tts_engine import SynthesisEngine
+from tts_schedule import CueScheduler
+
+
+def make_cues(count):
+    return [{'index': str(i + 1), 'start': i * 1000, 'end': i * 1000 + 900, 'text': f"第{i}句"}
+            for i in range(count)]
+
+
+def drain_order(scheduler):
+    order = []
+    while True:
+        index = scheduler.pop()
+        if index is None:
+            return order
+        order.append(index)
+
+
+def bind_all(scheduler, count):
+    scheduler.bind([[i] for i in range(count)], range(count))
+
+
+def test_earliest_deadline_after_playhead_first():
+    scheduler = CueScheduler(make_cues(10))
+    bind_all(scheduler, 10)
+    scheduler.move(5500)  # 第5条正在播放
+    assert drain_order(scheduler) == [5, 6, 7, 8, 9, 0, 1, 2, 3, 4]
+
+
+def test_backward_jump_reorders_pending_requests():
+    scheduler = CueScheduler(make_cues(10))
+    bind_all(scheduler, 10)
+    scheduler.move(7500)
+    assert scheduler.pop() == 7
+    scheduler.move(2500)
+    assert drain_order(scheduler) == [2, 3, 4, 5, 6, 8, 9, 0, 1]
+
+
+def test_behind_cues_fill_in_once_lookahead_is_covered():
+    scheduler = CueScheduler(make_cues(10), lookahead_ms=1500)
+    bind_all(scheduler, 10)
+    scheduler.move(5500)
+    assert drain_order(scheduler) == [5, 6, 0, 1, 2, 3, 4, 7, 8, 9]
+
+
+def test_duplicate_text_follows_its_nearest_occurrence():
+    scheduler = CueScheduler(make_cues(10))
+    scheduler.bind({0: [0, 9], 1: [5]}, [0, 1])
+    scheduler.move(8500)
+    assert drain_order(scheduler) == [0, 1]
+
+
+def test_drain_returns_unsent_requests():
+    scheduler = CueScheduler(make_cues(4))
+    bind_all(scheduler, 4)
+    assert scheduler.pop() == 0
+    assert scheduler.drain() == [1, 2, 3]
+    assert len(scheduler) == 0 and scheduler.pop() is None
+
+
+class RecordingBackend(FakeBackend):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+        self._texts_lock = threading.Lock()
+
+    def synthesize(self, text, options, token=None):
+        with self._texts_lock:
+            self.texts.append(text)
+        return super().synthesize(text, options, token)
+
+
+def test_engine_sends_requests_in_scheduler_order():
+    cues = make_cues(6)
+    backend = RecordingBackend()
+    engine = SynthesisEngine(backend, max_workers=1, timeout=5)
+    scheduler = CueScheduler(cues)
+    scheduler.move(3500)
+    segments = engine.synthesize_cues(cues, SynthesisOptions("v"), scheduler=scheduler)
+    assert len(segments) == 6
+    assert backend.texts == [cues[i]['text'] for i in (3, 4, 5, 0, 1, 2)]
@@ -0,0 +1,73 @@
+import json
+import sys
+import threading
+import time
+import types
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import tts_backend
+from tts_service import SynthesisService, make_handler
+
+
+@pytest.fixture
+def server():
+    service = SynthesisService(concurrency=2)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def _post(url, payload):
+    request = Request(url, data=json.dumps(payload).encode("utf-8"), method="POST",
+                      headers={"Content-Type": "application/json"})
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_bad_wait_returns_400(server):
+    job = _post(f"{server}/v1/jobs", {"backend": "fake", "voice": "v", "texts": ["你好"]})
+    with pytest.raises(HTTPError) as info:
+        urlopen(f"{server}/v1/jobs/{job['id']}?wait=abc")
+    assert info.value.code == 400
+    with urlopen(f"{server}/v1/jobs/{job['id']}?wait=5") as response:
+        assert json.loads(response.read())["status"] == "done"
+
+
+def test_dashscope_key_gate_does_not_interleave_keys(monkeypatch):
+    fake = types.ModuleType("dashscope")
+    fake.api_key = None
+    monkeypatch.setitem(sys.modules, "dashscope", fake)
+    gate = tts_backend._ApiKeyGate()
+    seen = []
+    entered = threading.Event()
+
+    def hold(key, delay):
+        with gate.use(key):
+            entered.set()
+            time.sleep(delay)
+            seen.append((key, fake.api_key))
+
+    first = threading.Thread(target=hold, args=("key-a", 0.3))
+    first.start()
+    entered.wait()
+    second = threading.Thread(target=hold, args=("key-b", 0))
+    second.start()
+    third = threading.Thread(target=hold, args=("key-a", 0))  # 有请求等待切换时，同一密钥的新请求也排队
+    time.sleep(0.05)
+    third.start()
+    for thread in (first, second, third):
+        thread.join()
+    assert seen[0] == ("key-a", "key-a")
+    assert all(key == current for key, current in seen)
+
+
+def test_gate_without_key_does_not_import_sdk(monkeypatch):
+    monkeypatch.setitem(sys.modules, "dashscope", None)  # 导入时抛出ImportError
+    with tts_backend._ApiKeyGate().use(""):
+        pass
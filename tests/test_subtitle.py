@@ -0,0 +1,42 @@
+from tts_backend import FakeBackend, SynthesisOptions
+from tts_engine import SynthesisEngine
+from tts_subtitle import dedupe_texts, normalize_text, parse_srt, split_cue_paragraphs
+
+
+def test_dedupe_merges_normalized_duplicates():
+    unique, groups = dedupe_texts(["你好。", "你好", "再见！", "再见!", "  "])
+    assert unique == ["你好", "再见!"]
+    assert groups == [[0, 1], [2, 3]]
+
+
+def test_dedupe_keeps_punctuation_only_text():
+    assert normalize_text("……") == ""
+    unique, groups = dedupe_texts(["……", "...", "……", "好"])
+    assert unique == ["……", "...", "好"]
+    assert groups == [[0, 2], [1], [3]]
+
+
+def test_punctuation_only_cues_are_synthesized():
+    srt = "1\n00:00:01,000 --> 00:00:02,000\n……\n\n2\n00:00:03,000 --> 00:00:04,000\n你好。\n\n"
+    cues = parse_srt(srt)
+    engine = SynthesisEngine(FakeBackend(), max_workers=2)
+    try:
+        paragraphs, _ = split_cue_paragraphs(cues)
+        results = engine.synthesize_many(paragraphs, SynthesisOptions("v"), dedupe=True)
+        assert all(result is not None for result in results)
+        segments = engine.synthesize_cues(cues, SynthesisOptions("v"))
+        assert [segment['subtitle']['index'] for segment in segments] == ["1", "2"]
+    finally:
+        engine.close()
+
+
+def test_whitespace_only_items_are_skipped_not_failed():
+    engine = SynthesisEngine(FakeBackend(), max_workers=2)
+    calls = []
+    try:
+        results = engine.synthesize_many(["  ", "好"], SynthesisOptions("v"),
+                                         on_item=lambda i, r, e: calls.append((i, r is None, e)), dedupe=True)
+    finally:
+        engine.close()
+    assert results[0] is None and results[1] is not None
+    assert (0, True, None) in calls
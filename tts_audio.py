@@ -0,0 +1,183 @@
+"""音频字节处理工具：输出编码、WAV封装与多段合并"""
+import io
+import wave
+
+DEFAULT_SAMPLE_RATE = 24000
+
+# 可选的输出编码：编码名 -> (界面显示名称, 保存文件扩展名)
+# pcm为16位单声道裸数据，拼接时间轴无需解码，保存时封装为WAV；ogg_opus体积最小，适合归档与传输
+ENCODINGS = {
+    'mp3': ("MP3", ".mp3"),
+    'wav': ("WAV", ".wav"),
+    'pcm': ("PCM（保存为WAV）", ".wav"),
+    'ogg_opus': ("OGG Opus", ".ogg"),
+}
+
+
+def encoding_label(encoding):
+    """编码的显示名称"""
+    return ENCODINGS.get(encoding, (encoding, ""))[0]
+
+
+def encoding_from_label(label):
+    """由显示名称反查编码，未知时返回mp3"""
+    for encoding, (name, _) in ENCODINGS.items():
+        if name == label:
+            return encoding
+    return 'mp3'
+
+
+def file_extension(encoding):
+    """保存该编码音频时使用的文件扩展名"""
+    return ENCODINGS.get(encoding, (None, ".bin"))[1]
+
+
+def to_file_bytes(audio, encoding, sample_rate=DEFAULT_SAMPLE_RATE):
+    """转换为可直接保存或播放的文件内容（裸PCM封装为WAV，其余原样返回）"""
+    if encoding == 'pcm':
+        return pcm_to_wav(audio, sample_rate)
+    return audio
+
+
+def to_pcm(audio, encoding):
+    """取出16位PCM数据；压缩编码（MP3、Opus）需要解码，返回None"""
+    if encoding == 'pcm':
+        return audio
+    if encoding == 'wav':
+        return read_wav(audio)[0]
+    return None
+
+
+def duration_ms(audio, encoding, sample_rate=DEFAULT_SAMPLE_RATE):
+    """音频时长（毫秒）：PCM/WAV按采样数，MP3逐帧累加，Opus取最后一页的粒度位置；无法解析时返回None"""
+    if encoding == 'pcm':
+        return len(audio) * 1000 // (2 * sample_rate)
+    if encoding == 'wav':
+        pcm, rate, channels, width = read_wav(audio)
+        return len(pcm) * 1000 // (rate * channels * width)
+    if encoding == 'mp3':
+        return mp3_duration_ms(audio)
+    if encoding == 'ogg_opus':
+        return opus_duration_ms(audio)
+    return None
+
+
+# MPEG Layer III帧头表：版本位 -> (采样率表, 码率表kbps, 每帧采样数)
+_MP3_VERSIONS = {
+    3: ((44100, 48000, 32000), (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320), 1152),
+    2: ((22050, 24000, 16000), (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160), 576),
+    0: ((11025, 12000, 8000), (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160), 576),
+}
+
+
+def _mp3_frame(data, position):
+    """解析position处的帧头，返回(帧长字节数, 每帧采样数, 采样率)，不是Layer III帧头时返回None"""
+    if position + 4 > len(data) or data[position] != 0xFF or data[position + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[position + 1] >> 3) & 0x03
+    layer = (data[position + 1] >> 1) & 0x03
+    bitrate_index = data[position + 2] >> 4
+    rate_index = (data[position + 2] >> 2) & 0x03
+    if version not in _MP3_VERSIONS or layer != 1 or rate_index == 3 or bitrate_index in (0, 15):
+        return None
+    rates, bitrates, frame_samples = _MP3_VERSIONS[version]
+    rate = rates[rate_index]
+    padding = (data[position + 2] >> 1) & 0x01
+    return frame_samples // 8 * bitrates[bitrate_index] * 1000 // rate + padding, frame_samples, rate
+
+
+def mp3_duration_ms(data):
+    """逐帧读取MP3帧头累加时长，不解码；不是Layer III时返回None"""
+    data = strip_id3(data)
+    position, samples, rate = 0, 0, None
+    while position + 4 <= len(data):
+        frame = _mp3_frame(data, position)
+        if frame is None:
+            position = data.find(b'\xff', position + 1)
+            if position < 0:
+                break
+            continue
+        length, frame_samples, rate = frame
+        position += length
+        samples += frame_samples
+    if rate is None:
+        return None
+    return samples * 1000 // rate
+
+
+def opus_duration_ms(data):
+    """Ogg Opus时长：最后一页的粒度位置减去OpusHead中的预跳过采样数（48kHz）"""
+    last = data.rfind(b'OggS')
+    head = data.find(b'OpusHead')
+    if last < 0 or head < 0 or last + 14 > len(data) or head + 12 > len(data):
+        return None
+    granule = int.from_bytes(data[last + 6:last + 14], 'little')
+    pre_skip = int.from_bytes(data[head + 10:head + 12], 'little')
+    return max(0, granule - pre_skip) * 1000 // 48000
+
+
+def pcm_to_wav(pcm, sample_rate=DEFAULT_SAMPLE_RATE, channels=1, sample_width=2):
+    """把裸PCM数据封装为WAV"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def read_wav(data):
+    """解析WAV，返回(pcm, sample_rate, channels, sample_width)"""
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        return (wav.readframes(wav.getnframes()), wav.getframerate(),
+                wav.getnchannels(), wav.getsampwidth())
+
+
+def strip_id3(data):
+    """去掉MP3开头的ID3v2标签，便于帧级拼接"""
+    if len(data) > 10 and data[:3] == b'ID3':
+        size = ((data[6] & 0x7f) << 21) | ((data[7] & 0x7f) << 14) | \
+               ((data[8] & 0x7f) << 7) | (data[9] & 0x7f)
+        return data[10 + size:]
+    return data
+
+
+def strip_mp3_tags(data):
+    """去掉MP3的ID3v2、ID3v1标签和首帧的Xing/Info/VBRI信息帧，只留音频帧
+
+    信息帧记录的是单段的帧数和字节数，留在拼接结果中会让播放器算错总时长、拖动时错位。
+    """
+    data = strip_id3(data)
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    frame = _mp3_frame(data, 0)
+    if frame is None:
+        return data
+    mono = data[3] >> 6 == 3
+    if (data[1] >> 3) & 0x03 == 3:  # MPEG-1
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    offset = 4 + (0 if data[1] & 0x01 else 2) + side_info  # 保护位为0时帧头后有2字节CRC
+    if data[offset:offset + 4] in (b'Xing', b'Info') or data[36:40] == b'VBRI':
+        return data[frame[0]:]
+    return data
+
+
+def merge_audio(chunks, encoding):
+    """按顺序合并多段音频
+
+    MP3去掉各段的标签和信息帧后按帧拼接（无需重新编码），WAV合并PCM后重新封装，裸PCM直接拼接；
+    OGG Opus按逻辑流首尾相接（链式Ogg，播放器按顺序解码）。
+    """
+    chunks = [c for c in chunks if c]
+    if not chunks:
+        return b''
+    if encoding == 'wav':
+        pcm, sample_rate, channels, width = read_wav(chunks[0])
+        parts = [pcm] + [read_wav(c)[0] for c in chunks[1:]]
+        return pcm_to_wav(b''.join(parts), sample_rate, channels, width)
+    if encoding == 'mp3':
+        return b''.join(strip_mp3_tags(c) for c in chunks)
+    return b''.join(chunks)
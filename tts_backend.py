@@ -0,0 +1,565 @@
+"""与服务商无关的语音合成后端接口
+
+VolcanoBackend 调用火山引擎HTTP接口，CosyVoiceBackend 调用阿里云DashScope，
+FakeBackend 在本地按文本确定性地生成音频，用于离线调试和基准测试，
+RemoteBackend 把请求转交给本地合成服务（tts_service）。
+服务商SDK在首次使用时才导入，两个应用只需安装各自用到的依赖。
+"""
+import base64
+import hashlib
+import json
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from tts_audio import DEFAULT_SAMPLE_RATE, pcm_to_wav
+
+VOLCANO_TTS_URL = "https://openspeech.bytedance.com/api/v1/tts"
+# 火山引擎单次请求文本的UTF-8字节上限
+VOLCANO_MAX_TEXT_BYTES = 1024
+DASHSCOPE_HOST = "dashscope.aliyuncs.com"
+
+# 当前线程最近一次新建连接的耗时（复用连接时为0）
+_connect_timing = threading.local()
+
+
+class BackendError(Exception):
+    """合成请求失败；retryable表示重试可能成功，raw为服务端原始响应"""
+
+    def __init__(self, message, retryable=False, raw=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.raw = raw
+
+
+class SynthesisOptions:
+    """一次合成请求的参数"""
+
+    def __init__(self, voice, speed=1.0, encoding="mp3", model=None, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.voice = voice
+        self.speed = speed
+        self.encoding = encoding  # mp3 / wav / pcm / ogg_opus，见tts_audio.ENCODINGS
+        self.model = model
+        self.sample_rate = sample_rate
+
+    def cache_key(self, backend_name, text):
+        """缓存键：后端、音色、参数与文本共同决定音频内容"""
+        raw = json.dumps([backend_name, self.model, self.voice, self.speed, self.encoding,
+                          self.sample_rate, text], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SynthesisResult:
+    """合成结果"""
+
+    def __init__(self, audio, encoding, raw=None, cached=False, timings=None, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.audio = audio
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.raw = raw  # 服务端原始响应（若有）
+        self.cached = cached
+        self.timings = timings or {}  # connect/ttfb/decode（秒）与payload_bytes
+
+
+class TTSBackend:
+    """合成后端基类"""
+
+    name = "base"
+
+    def synthesize(self, text, options, token=None):
+        """合成一段文本，成功返回SynthesisResult，失败抛出BackendError"""
+        raise NotImplementedError
+
+    def probe(self, timeout=5.0):
+        """轻量探测服务商是否可达（不计费），供熔断器判断恢复；没有探测手段时返回True，由下一个请求试探"""
+        return True
+
+    def close(self):
+        """释放连接等资源"""
+
+
+class VolcanoBackend(TTSBackend):
+    """火山引擎（豆包）HTTP合成接口"""
+
+    name = "volcano"
+
+    def __init__(self, api_key="", url=VOLCANO_TTS_URL, timeout=30, cluster="volcano_icl",
+                 uid="豆包语音", pool_size=8):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.cluster = cluster
+        self.uid = uid
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """首次使用时才导入requests并建立连接池，避免拖慢启动"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+
+                    # 复用HTTP连接，避免每条字幕重新握手
+                    session = requests.Session()
+                    adapter = _timed_http_adapter(self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def build_request(self, text, options):
+        """构造请求体"""
+        return {
+            "app": {"cluster": self.cluster},
+            "user": {"uid": self.uid},
+            "audio": {
+                "voice_type": options.voice,
+                "encoding": options.encoding,
+                "rate": options.sample_rate,
+                "speed_ratio": options.speed
+            },
+            "request": {
+                "reqid": str(uuid.uuid4()).replace("-", ""),
+                "text": text,
+                "operation": "query"
+            }
+        }
+
+    def synthesize(self, text, options, token=None):
+        import requests
+
+        if token is not None:
+            token.raise_if_cancelled()
+        headers = {
+            "x-api-key": self.api_key,
+            "Content-Type": "application/json"
+        }
+        _connect_timing.value = 0.0
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                url=self.url,
+                headers=headers,
+                json=self.build_request(text, options),
+                timeout=self.timeout,
+                stream=True
+            )
+            ttfb = time.perf_counter() - start
+            raw = response.text  # 读取完整响应体
+        except requests.RequestException as e:
+            raise BackendError(f"请求异常: {str(e)}", retryable=True)
+
+        if response.status_code != 200:
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise BackendError(f"请求失败: 状态码{response.status_code}", retryable=retryable, raw=raw)
+        decode_start = time.perf_counter()
+        try:
+            result = json.loads(raw)
+        except ValueError:
+            raise BackendError("API返回数据不是有效的JSON格式", raw=raw)
+        if result.get("code") != 3000 or result.get("message") != "Success":
+            raise BackendError(f"业务失败: code={result.get('code')}，message={result.get('message')}", raw=raw)
+        data = result.get("data")
+        if not data:
+            raise BackendError("response.data为空，无音频数据", raw=raw)
+        try:
+            audio = base64.b64decode(data)
+        except (ValueError, TypeError):
+            raise BackendError("Base64解码失败，音频数据格式错误", raw=raw)
+        timings = {
+            "connect": _connect_timing.value,
+            "ttfb": ttfb,
+            "decode": time.perf_counter() - decode_start,
+            "payload_bytes": len(raw),
+        }
+        return SynthesisResult(audio, options.encoding, raw=raw, timings=timings,
+                               sample_rate=options.sample_rate)
+
+    def probe(self, timeout=5.0):
+        """向接口地址发GET请求，收到网关错误以外的任何响应即视为可达"""
+        import requests
+
+        try:
+            response = self.session.get(self.url, timeout=timeout)
+        except requests.RequestException:
+            return False
+        return response.status_code not in (502, 503, 504)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+def _timed_http_adapter(pool_size):
+    """构造记录TCP/TLS建连耗时的HTTPAdapter"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            _connect_timing.value = time.perf_counter() - start
+
+    class TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            _connect_timing.value = time.perf_counter() - start
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": TimedHTTPConnectionPool,
+                "https": TimedHTTPSConnectionPool,
+            }
+
+    return TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+
+class CosyVoiceBackend(TTSBackend):
+    """阿里云DashScope CosyVoice合成，通过会话池复用WebSocket连接"""
+
+    name = "cosyvoice"
+
+    def __init__(self, api_key="", model="cosyvoice-v2", pool=None, log=None):
+        from tts_pool import SynthesizerPool
+
+        self.api_key = api_key
+        self.model = model
+        if pool is None:
+            pool = SynthesizerPool(_dashscope_synthesizer, health_check=dashscope_session_healthy, log=log)
+        self.pool = pool
+
+    def synthesize(self, text, options, token=None):
+        def call(synthesizer):
+            if token is None:
+                return synthesizer.call(text=text)
+            # 取消时中断WebSocket会话；会话归还池中之前注销，之后的取消不会中断已租给其他请求的会话
+            interrupt = lambda: cancel_synthesizer(synthesizer)
+            token.on_cancel(interrupt)
+            try:
+                token.raise_if_cancelled()
+                return synthesizer.call(text=text)
+            finally:
+                token.remove_callback(interrupt)
+
+        first_package = {}
+
+        def timed_call(synthesizer):
+            res = call(synthesizer)
+            get_delay = getattr(synthesizer, 'get_first_package_delay', None)
+            if callable(get_delay):
+                try:
+                    first_package['ttfb'] = get_delay() / 1000.0
+                except Exception:
+                    pass
+            return res
+
+        start = time.perf_counter()
+        try:
+            # 会话按API密钥分开复用，请求期间进程全局的dashscope.api_key固定为本后端的密钥
+            with _DASHSCOPE_KEYS.use(self.api_key, token):
+                res = self.pool.run(options.model or self.model, options.voice, timed_call, token=token,
+                                    audio_format=_cosyvoice_format(options), tenant=self.api_key)
+        except Exception as e:
+            if token is not None and token.cancelled:
+                raise
+            raise BackendError(f"合成片段出错: {str(e)}", retryable=True)
+        timings = {
+            "connect": self.pool.last_connect_time(),
+            "ttfb": first_package.get('ttfb', time.perf_counter() - start),
+        }
+
+        if isinstance(res, bytes):
+            timings["payload_bytes"] = len(res)
+            return SynthesisResult(res, options.encoding, timings=timings, sample_rate=options.sample_rate)
+        if isinstance(res, dict) and res.get('status_code') == 200:
+            audio = res.get('audio') or res.get('audio_data')
+            if audio:
+                timings["payload_bytes"] = len(audio)
+                return SynthesisResult(audio, options.encoding, raw=res, timings=timings,
+                                       sample_rate=options.sample_rate)
+            raise BackendError("合成成功但未获取到音频数据", raw=res)
+        message = res.get('message', '未知错误') if isinstance(res, dict) else f"未知的API返回格式 {type(res)}"
+        raise BackendError(f"合成失败: {message}", raw=res)
+
+    def probe(self, timeout=5.0):
+        """与DashScope建立一次TCP连接"""
+        try:
+            socket.create_connection((DASHSCOPE_HOST, 443), timeout).close()
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        self.pool.close()
+
+
+def _cosyvoice_format(options):
+    """输出编码对应的DashScope AudioFormat名称前缀（均为单声道）"""
+    rate = options.sample_rate
+    prefixes = {
+        "mp3": f"MP3_{rate}HZ_MONO",
+        "wav": f"WAV_{rate}HZ_MONO",
+        "pcm": f"PCM_{rate}HZ_MONO",
+        "ogg_opus": f"OGG_OPUS_{rate // 1000}KHZ_MONO",
+    }
+    if options.encoding not in prefixes:
+        raise BackendError(f"不支持的输出格式: {options.encoding}")
+    return prefixes[options.encoding]
+
+
+class _ApiKeyGate:
+    """DashScope SDK从进程全局的dashscope.api_key读取密钥，多个密钥的请求（见tts_service）不能交错
+
+    同一密钥的请求可以并发；换用其他密钥的请求等正在进行的请求全部结束后再切换，
+    有请求在等待切换时，当前密钥的新请求也排队等待，避免一直占用。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._key = None
+        self._active = 0
+        self._waiting = 0
+
+    @contextmanager
+    def use(self, api_key, token=None):
+        with self._cond:
+            if self._active and (self._key != api_key or self._waiting):
+                self._waiting += 1
+                try:
+                    while self._active and (self._key != api_key or self._waiting > 1):
+                        self._cond.wait(0.2)
+                        if token is not None:
+                            token.raise_if_cancelled()
+                finally:
+                    self._waiting -= 1
+            if self._key != api_key:
+                if api_key or self._key:  # 始终未设置密钥时不导入SDK（离线基准测试使用模拟会话）
+                    import dashscope
+                    dashscope.api_key = api_key or None  # 为空时由SDK读取DASHSCOPE_API_KEY环境变量
+                self._key = api_key
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+
+_DASHSCOPE_KEYS = _ApiKeyGate()
+
+
+def _dashscope_synthesizer(model, voice, audio_format=None):
+    """新建DashScope合成会话（首次调用时才导入SDK）"""
+    from dashscope.audio.tts_v2 import AudioFormat, SpeechSynthesizer
+    if audio_format is None:
+        return SpeechSynthesizer(model=model, voice=voice)
+    for fmt in AudioFormat:
+        if fmt.name.startswith(audio_format):
+            return SpeechSynthesizer(model=model, voice=voice, format=fmt)
+    raise ValueError(f"当前DashScope SDK不支持输出格式 {audio_format}")
+
+
+def dashscope_session_healthy(synthesizer):
+    """复用前检查会话的WebSocket连接：已建立过连接但已断开（如服务端关闭空闲连接）的会话不再复用
+
+    尚未建立连接、或SDK未暴露连接对象时视为可用，由SDK在调用时连接。
+    """
+    ws = getattr(synthesizer, 'ws', None)
+    if ws is None:
+        return True
+    sock = getattr(ws, 'sock', None)
+    return bool(sock is not None and getattr(sock, 'connected', False))
+
+
+def cancel_synthesizer(synthesizer):
+    """尽力中断正在进行的DashScope合成会话"""
+    for method in ('streaming_cancel', 'close'):
+        cancel = getattr(synthesizer, method, None)
+        if callable(cancel):
+            try:
+                cancel()
+                return
+            except Exception:
+                continue
+
+
+class FakeBackend(TTSBackend):
+    """本地确定性假后端：同样的文本和参数总是生成同样的音频（请求pcm时返回裸PCM，其余返回WAV）"""
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, failure_rate=0.0, sample_rate=16000, ms_per_char=60, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sample_rate = sample_rate
+        self.ms_per_char = ms_per_char
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def synthesize(self, text, options, token=None):
+        if self.latency:
+            if token is not None:
+                token.wait(self.latency)
+            else:
+                time.sleep(self.latency)
+        if token is not None:
+            token.raise_if_cancelled()
+        if self.failure_rate:
+            with self._lock:
+                failed = self._random.random() < self.failure_rate
+            if failed:
+                raise BackendError("模拟合成失败", retryable=True)
+        pcm = self.render_pcm(text, options)
+        if options.encoding == "pcm":
+            audio, encoding = pcm, "pcm"
+        else:
+            audio, encoding = pcm_to_wav(pcm, self.sample_rate), "wav"
+        return SynthesisResult(audio, encoding, timings={"payload_bytes": len(audio)},
+                               sample_rate=self.sample_rate)
+
+    def render(self, text, options):
+        """生成WAV音频"""
+        return pcm_to_wav(self.render_pcm(text, options), self.sample_rate)
+
+    def render_pcm(self, text, options):
+        """按文本哈希确定音高、按字数确定时长，生成正弦波PCM"""
+        digest = hashlib.sha1(f"{options.voice}|{text}".encode("utf-8")).digest()
+        period = 20 + digest[0] % 60  # 每周期采样数，决定音高
+        duration_ms = max(200, int(len(text) * self.ms_per_char / max(options.speed, 0.1)))
+        frames = self.sample_rate * duration_ms // 1000
+        cycle = b''.join(
+            struct.pack('<h', int(8000 * math.sin(2 * math.pi * i / period))) for i in range(period)
+        )
+        return (cycle * (frames // period + 1))[:frames * 2]
+
+
+class RemoteBackend(TTSBackend):
+    """本地合成服务（tts_service）的瘦客户端
+
+    每段文本作为一个任务提交给服务，长轮询等待完成后下载音频；
+    连接、缓存、限速和并发预算都由服务统一管理。
+    """
+
+    def __init__(self, url, backend="volcano", api_key="", timeout=300, poll=10):
+        self.url = url.rstrip("/")
+        self.backend = backend
+        self.name = f"remote-{backend}"
+        self.api_key = api_key
+        self.timeout = timeout  # 等待单个任务完成的上限（秒），包含在服务端排队的时间
+        self.poll = poll
+
+    def build_request(self, text, options):
+        """构造任务请求体（不含API密钥）"""
+        payload = {
+            "backend": self.backend,
+            "voice": options.voice,
+            "speed": options.speed,
+            "encoding": options.encoding,
+            "sample_rate": options.sample_rate,
+            "texts": [text],
+        }
+        if options.model:
+            payload["model"] = options.model
+        return payload
+
+    def synthesize(self, text, options, token=None):
+        payload = dict(self.build_request(text, options), api_key=self.api_key)
+        start = time.perf_counter()
+        job_id = self._request("POST", "/v1/jobs", payload)["id"]
+        if token is not None:
+            token.on_cancel(lambda: self._cancel(job_id))
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if token is not None:
+                token.raise_if_cancelled()
+            status = self._request("GET", f"/v1/jobs/{job_id}?wait={self.poll}")
+            if status["status"] in ("done", "failed", "cancelled"):
+                break
+            if time.monotonic() > deadline:
+                self._cancel(job_id)
+                raise BackendError(f"等待合成服务超时（{self.timeout}秒）", retryable=True)
+        ttfb = time.perf_counter() - start
+
+        item = status["items"][0]
+        if not item.get("ok"):
+            # 服务端已按自己的策略重试过，客户端不再重试
+            raise BackendError(f"合成服务返回错误: {item.get('error') or status['status']}",
+                               raw=json.dumps(status, ensure_ascii=False))
+        audio, headers = self._request("GET", f"/v1/jobs/{job_id}/items/0", raw=True)
+        return SynthesisResult(
+            audio, headers.get("X-Audio-Encoding", options.encoding),
+            cached=headers.get("X-Cached") == "1",
+            timings={"ttfb": ttfb, "payload_bytes": len(audio)},
+            sample_rate=int(headers.get("X-Sample-Rate", options.sample_rate)),
+        )
+
+    def probe(self, timeout=5.0):
+        """查询合成服务的/v1/health"""
+        try:
+            self._request("GET", "/v1/health")
+        except BackendError:
+            return False
+        return True
+
+    def _cancel(self, job_id):
+        try:
+            self._request("DELETE", f"/v1/jobs/{job_id}")
+        except BackendError:
+            pass
+
+    def _request(self, method, path, payload=None, raw=False):
+        import urllib.error
+        import urllib.request
+
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.poll + 30) as response:
+                body = response.read()
+                if raw:
+                    return body, response.headers
+                return json.loads(body)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise BackendError(f"合成服务错误 {e.code}: {message}", retryable=e.code >= 500)
+        except (urllib.error.URLError, OSError) as e:
+            raise BackendError(f"无法连接合成服务 {self.url}: {e}", retryable=True)
+
+
+# 可按名称创建的后端（供无界面的守护进程和服务模式使用）
+BACKENDS = ("volcano", "cosyvoice", "fake")
+
+
+def create_backend(name, api_key="", timeout=30, log=None):
+    """按名称创建后端"""
+    if name == "volcano":
+        return VolcanoBackend(api_key=api_key, timeout=timeout)
+    if name == "cosyvoice":
+        return CosyVoiceBackend(api_key=api_key, log=log)
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"未知的后端: {name}")
@@ -0,0 +1,634 @@
+"""离线基准测试：用本地模拟服务代替真实TTS接口，测量合成流水线性能
+
+用法示例：
+    python tts_bench.py run --pipeline volcano --cues 1000 --latency lognormal:-3,0.5
+    python tts_bench.py suite --cues 10,1000,10000
+    python tts_bench.py startup --runs 5
+    python tts_bench.py postprocess --cues 1000,10000
+    python tts_bench.py timeline --hours 0.5,2,6
+    python tts_bench.py stems --cues 5000
+
+volcano 流水线通过本地HTTP服务模拟 openspeech.bytedance.com/api/v1/tts，
+cosyvoice 流水线用模拟的SpeechSynthesizer代替DashScope WebSocket会话，
+两者都走与界面相同的解析、分段和SynthesisEngine调度代码。
+suite 模式下每个场景在独立子进程中运行，峰值内存互不干扰。
+startup 模式测量两个应用从进程启动到窗口首次绘制的冷启动时间（需要图形环境）。
+postprocess 模式测量字幕音频后处理（静音裁剪、响度归一化、淡入淡出）的批处理速度（需要NumPy）。
+timeline 模式按乱序、多线程把字幕写入内存映射的WAV时间轴，测量不同节目时长下的峰值内存。
+stems 模式测量逐条分轨导出（含清单）的耗时。
+"""
+import argparse
+import array
+import base64
+import json
+import math
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tts_audio import ENCODINGS
+from tts_backend import CosyVoiceBackend, FakeBackend, SynthesisOptions, TTSBackend
+from tts_engine import SynthesisEngine
+from tts_hedge import HedgePolicy
+from tts_pool import SynthesizerPool
+from tts_subtitle import clean_subtitle_text, dedupe_texts, parse_srt, split_paragraphs
+
+PHRASES = [
+    "好的", "谢谢", "你是否也曾这样", "心里很想和某个人聊天", "却希望他先来找你",
+    "呆呆的看着他的头像一遍又一遍", "今天天气怎么样", "我们明天见", "没关系", "真的吗",
+]
+
+
+class LatencyModel:
+    """延迟分布（秒），格式：fixed:0.05 / uniform:0.02,0.2 / lognormal:-3,0.5 / exp:0.05"""
+
+    def __init__(self, spec="fixed:0.05", seed=0):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        if kind not in ("fixed", "uniform", "lognormal", "exp"):
+            raise ValueError(f"未知的延迟分布: {spec}")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._random.uniform(self.params[0], self.params[1])
+            if self.kind == "lognormal":
+                return self._random.lognormvariate(self.params[0], self.params[1])
+            return self._random.expovariate(1.0 / self.params[0])
+
+
+class RateLimiter:
+    """令牌桶限流，rate为每秒请求数，0表示不限流"""
+
+    def __init__(self, rate=0.0, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if not self.rate:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class MockProfile:
+    """模拟服务的行为参数"""
+
+    def __init__(self, latency="fixed:0.05", error_rate=0.0, rate_limit=0.0, payload_bytes=16000, seed=0):
+        self.latency = LatencyModel(latency, seed)
+        self.error_rate = error_rate
+        self.limiter = RateLimiter(rate_limit)
+        self.payload_bytes = payload_bytes
+        self._random = random.Random(seed + 1)
+        self._lock = threading.Lock()
+        self.payload = bytes(random.Random(seed).getrandbits(8) for _ in range(payload_bytes))
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def roll_error(self):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+
+class MockVolcanoServer:
+    """本地模拟的火山引擎 /api/v1/tts 接口"""
+
+    def __init__(self, profile, host="127.0.0.1", port=0):
+        self.profile = profile
+        handler = self._make_handler(profile)
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1/tts"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-volcano", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def _make_handler(profile):
+        encoded = base64.b64encode(profile.payload).decode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    reqid = json.loads(body)["request"]["reqid"]
+                except (ValueError, KeyError):
+                    self._reply(400, {"code": 3001, "message": "invalid request"})
+                    return
+                if not profile.limiter.allow():
+                    with profile._lock:
+                        profile.throttled += 1
+                    self._reply(429, {"code": 3003, "message": "rate limited"})
+                    return
+                time.sleep(profile.latency.sample())
+                if profile.roll_error():
+                    self._reply(500, {"code": 3050, "message": "mock server error"})
+                    return
+                self._reply(200, {"reqid": reqid, "code": 3000, "message": "Success", "data": encoded})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class MockSpeechSynthesizer:
+    """模拟的DashScope SpeechSynthesizer，接口与tts_v2一致"""
+
+    def __init__(self, model, voice, profile):
+        self.model = model
+        self.voice = voice
+        self.profile = profile
+        self._cancelled = threading.Event()
+        # 模拟建立WebSocket会话的开销
+        time.sleep(profile.latency.sample() / 2)
+
+    def call(self, text):
+        if not self.profile.limiter.allow():
+            with self.profile._lock:
+                self.profile.throttled += 1
+            raise RuntimeError("Throttling.RateQuota")
+        if self._cancelled.wait(self.profile.latency.sample()):
+            raise RuntimeError("task cancelled")
+        if self.profile.roll_error():
+            raise RuntimeError("mock synthesizer error")
+        return self.profile.payload
+
+    def streaming_cancel(self):
+        self._cancelled.set()
+
+
+class TimingBackend(TTSBackend):
+    """包装任意后端，记录每次请求的耗时和首段音频时间"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.latencies = []
+        self.first_audio = None
+        self._lock = threading.Lock()
+
+    def synthesize(self, text, options, token=None):
+        start = time.perf_counter()
+        result = self.inner.synthesize(text, options, token)
+        end = time.perf_counter()
+        with self._lock:
+            self.latencies.append(end - start)
+            if self.first_audio is None:
+                self.first_audio = end
+        return result
+
+    def close(self):
+        self.inner.close()
+
+
+def make_srt(cue_count, seed=0):
+    """生成合成用的SRT文本，台词从常见短句中随机组合"""
+    rng = random.Random(seed)
+    blocks = []
+    for i in range(cue_count):
+        start = i * 2000
+        end = start + 1500
+        text = "，".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 3)))
+        blocks.append(f"{i + 1}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text}\n\n")
+    return "".join(blocks)
+
+
+def format_srt_time(ms):
+    """毫秒转为SRT时间格式"""
+    h, rest = divmod(ms, 3600000)
+    m, rest = divmod(rest, 60000)
+    s, ms = divmod(rest, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def percentile(values, pct):
+    """最近秩法求百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(pipeline, cues, latency="fixed:0.05", error_rate=0.0, rate_limit=0.0,
+                 payload_bytes=16000, workers=4, min_interval=0.0, timeout=30, seed=0, dedupe=1,
+                 hedge_budget=0.0):
+    """运行一个基准场景，返回结果字典；dedupe为0时每条字幕都单独请求，hedge_budget大于0时启用对冲请求"""
+    profile = MockProfile(latency, error_rate, rate_limit, payload_bytes, seed)
+    srt = make_srt(cues, seed)
+    server = None
+
+    if pipeline == "volcano":
+        from tts_backend import VolcanoBackend
+        server = MockVolcanoServer(profile).start()
+        inner = VolcanoBackend(api_key="bench", url=server.url, timeout=timeout, pool_size=workers)
+        options = SynthesisOptions("bench_voice", speed=1.0)
+    elif pipeline == "cosyvoice":
+        pool = SynthesizerPool(lambda model, voice, audio_format: MockSpeechSynthesizer(model, voice, profile))
+        inner = CosyVoiceBackend(pool=pool)
+        options = SynthesisOptions("bench_voice", model="cosyvoice-v2")
+    elif pipeline == "fake":
+        inner = FakeBackend(latency=profile.latency.sample(), failure_rate=error_rate, seed=seed)
+        options = SynthesisOptions("bench_voice")
+    else:
+        raise ValueError(f"未知的流水线: {pipeline}")
+
+    backend = TimingBackend(inner)
+    hedge = HedgePolicy(budget=hedge_budget) if hedge_budget else None
+    engine = SynthesisEngine(backend, max_workers=workers, timeout=timeout, min_interval=min_interval, hedge=hedge)
+    job = engine.new_job("bench")
+    try:
+        start = time.perf_counter()
+        if pipeline == "cosyvoice":
+            # 与阿里云应用一致：字幕先清洗成文本，再按段落合成
+            items = split_paragraphs(clean_subtitle_text(srt), max_chars=200)
+            results = engine.synthesize_many(items, options, job=job, dedupe=bool(dedupe))
+            ok = sum(1 for r in results if r is not None)
+            texts = items
+        else:
+            items = parse_srt(srt)
+            ok = len(engine.synthesize_cues(items, options, job=job, dedupe=bool(dedupe)))
+            texts = [cue['text'] for cue in items]
+        wall = time.perf_counter() - start
+        engine.metrics.end_job(job)
+        rollup = engine.metrics.rollup(job)
+    finally:
+        engine.close()
+        if server:
+            server.stop()
+
+    first_audio = (backend.first_audio - start) if backend.first_audio else None
+    return {
+        "pipeline": pipeline,
+        "cues": cues,
+        "requests": len(items),
+        "unique": len(dedupe_texts(texts)[0]) if dedupe else len(items),
+        "ok": ok,
+        "failed": len(items) - ok,
+        "workers": workers,
+        "latency_model": latency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(ok / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(backend.latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(backend.latencies, 99) * 1000, 2),
+        "job_p99_ms": rollup["total_p99_ms"],
+        "hedged": rollup["hedged"],
+        "hedge_saved_s": rollup["hedge_saved_s"],
+        "ttfa_ms": round(first_audio * 1000, 2) if first_audio is not None else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "throttled": profile.throttled,
+    }
+
+
+def run_postprocess(cues, sample_rate=24000, seed=0, runs=3):
+    """测量后处理速度：FakeBackend生成的正弦波前后补随机静音、音量随机，取多次运行的中位数"""
+    import tts_postprocess
+
+    if not tts_postprocess.available():
+        raise RuntimeError("未安装NumPy")
+    rng = random.Random(seed)
+    backend = FakeBackend(sample_rate=sample_rate)
+    options = SynthesisOptions("bench_voice", encoding="pcm", sample_rate=sample_rate)
+    levels = (0.05, 0.1, 0.2, 0.35, 0.5, 0.7, 0.85, 1.0)
+    tones = {}  # (文本, 音量) -> PCM
+    buffers = []
+    for _ in range(cues):
+        key = (rng.choice(PHRASES), rng.choice(levels))
+        tone = tones.get(key)
+        if tone is None:
+            samples = array.array("h", backend.render_pcm(key[0], options))
+            tone = tones[key] = array.array("h", (int(v * key[1]) for v in samples)).tobytes()
+        lead = bytes(2 * rng.randrange(sample_rate // 2))
+        tail = bytes(2 * rng.randrange(sample_rate // 2))
+        buffers.append(lead + tone + tail)
+    audio_s = sum(len(b) for b in buffers) / 2 / sample_rate
+
+    processor = tts_postprocess.PostProcessor()
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        outputs = processor.process_pcm(buffers, sample_rate)
+        walls.append(time.perf_counter() - start)
+    wall = statistics.median(walls)
+    return {
+        "cues": cues,
+        "audio_s": round(audio_s, 1),
+        "trimmed_s": round(audio_s - sum(len(b) for b in outputs) / 2 / sample_rate, 1),
+        "wall_s": round(wall, 3),
+        "cues_per_s": round(cues / wall) if wall else None,
+        "realtime_x": round(audio_s / wall) if wall else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_timeline(hours, cue_ms=2500, gap_ms=500, workers=4, sample_rate=24000, seed=0):
+    """导出hours小时的时间轴：字幕乱序提交给线程池写入，返回耗时、文件大小和峰值内存"""
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from tts_timeline import TimelineWriter
+
+    backend = FakeBackend(sample_rate=sample_rate, ms_per_char=cue_ms // 10)
+    tone = backend.render_pcm("一二三四五六七八九十", SynthesisOptions("bench_voice", encoding="pcm"))
+    starts = list(range(0, int(hours * 3600 * 1000), cue_ms + gap_ms))
+    random.Random(seed).shuffle(starts)
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        with TimelineWriter(path, starts and max(starts) + cue_ms, sample_rate) as timeline:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for _ in pool.map(lambda ms: timeline.write(ms, tone), starts):
+                    pass
+        wall = time.perf_counter() - start
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    return {
+        "hours": hours,
+        "cues": len(starts),
+        "file_mb": round(size / 1024 / 1024, 1),
+        "wall_s": round(wall, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_stems(cues, workers=8, encoding="wav", seed=0):
+    """把cues条FakeBackend生成的字幕音频导出为分轨，返回耗时与写入量"""
+    import shutil
+    import tempfile
+
+    from tts_stems import export_stems
+
+    backend = FakeBackend(sample_rate=24000)
+    options = SynthesisOptions("bench_voice", encoding=encoding, sample_rate=24000)
+    items = parse_srt(make_srt(cues, seed))
+    results = {}
+    segments = []
+    for cue in items:
+        result = results.get(cue['text'])
+        if result is None:
+            result = results[cue['text']] = backend.synthesize(cue['text'], options)
+        segments.append({'data': result.audio, 'subtitle': cue, 'result': result})
+    directory = tempfile.mkdtemp(prefix="tts-stems-")
+    try:
+        start = time.perf_counter()
+        manifest = export_stems(segments, directory, options, backend.name, max_workers=workers)
+        wall = time.perf_counter() - start
+        size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "cues": cues,
+        "workers": workers,
+        "files": manifest["count"] + 1,
+        "written_mb": round(size / 1024 / 1024, 1),
+        "wall_s": round(wall, 3),
+        "stems_per_s": round(cues / wall) if wall else None,
+    }
+
+
+# 在全新解释器中构建应用窗口，首次绘制完成后输出耗时
+STARTUP_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import tkinter as tk
+module = __import__(sys.argv[1])
+t1 = time.perf_counter()
+root = tk.Tk()
+app = getattr(module, sys.argv[2])(root)
+root.update()
+t2 = time.perf_counter()
+root.destroy()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_paint_ms": (t2 - t0) * 1000}))
+"""
+
+STARTUP_APPS = {
+    "volcano": ("volcano_tts", "VolcanoTTS"),
+    "cosyvoice": ("ali_tts", "VoiceSynthesisApp"),
+}
+
+
+def run_startup(app, runs=5):
+    """测量应用冷启动：进程启动到窗口首次绘制的耗时，取多次运行的中位数"""
+    module, cls = STARTUP_APPS[app]
+    here = os.path.dirname(os.path.abspath(__file__))
+    launch, imports, paints = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", STARTUP_SNIPPET, module, cls],
+                              capture_output=True, text=True, cwd=here)
+        elapsed = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "启动失败")
+        data = json.loads(proc.stdout.strip().splitlines()[-1])
+        imports.append(data["import_ms"])
+        paints.append(data["first_paint_ms"])
+        launch.append(elapsed)
+    return {
+        "app": app,
+        "runs": runs,
+        "import_ms": round(statistics.median(imports), 1),
+        "first_paint_ms": round(statistics.median(paints), 1),
+        "process_ms": round(statistics.median(launch), 1),
+    }
+
+
+def format_report(rows, columns=None):
+    """把结果格式化为表格文本"""
+    columns = columns or ["pipeline", "cues", "unique", "ok", "failed", "wall_s", "throughput_rps",
+                          "p50_ms", "p99_ms", "job_p99_ms", "hedged", "ttfa_ms", "peak_rss_mb"]
+    widths = [max([len(c)] + [len(str(r.get(c))) for r in rows]) for c in columns]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    for row in rows:
+        lines.append("  ".join(str(row.get(c)).ljust(w) for c, w in zip(columns, widths)))
+    return "\n".join(lines)
+
+
+def _scenario_args(args):
+    return {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit": args.rate_limit,
+        "payload_bytes": args.payload_bytes,
+        "workers": args.workers,
+        "min_interval": args.min_interval,
+        "timeout": args.timeout,
+        "seed": args.seed,
+        "dedupe": args.dedupe,
+        "hedge_budget": args.hedge_budget,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="语音合成离线基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(p):
+        p.add_argument("--latency", default="lognormal:-3,0.5", help="模拟服务延迟分布")
+        p.add_argument("--error-rate", type=float, default=0.0, help="模拟失败率")
+        p.add_argument("--rate-limit", type=float, default=0.0, help="每秒允许的请求数，0为不限")
+        p.add_argument("--payload-bytes", type=int, default=16000, help="每条返回的音频字节数")
+        p.add_argument("--workers", type=int, default=4, help="并发请求数")
+        p.add_argument("--min-interval", type=float, default=0.0, help="相邻请求最小间隔（秒）")
+        p.add_argument("--timeout", type=float, default=30, help="单次请求超时（秒）")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--dedupe", type=int, choices=[0, 1], default=1, help="1为合并重复字幕，0为逐条请求")
+        p.add_argument("--hedge-budget", type=float, default=0.0, help="对冲请求占比上限，0为不对冲")
+        p.add_argument("--json", action="store_true", help="输出JSON而不是表格")
+
+    run = sub.add_parser("run", help="在当前进程运行单个场景")
+    run.add_argument("--pipeline", choices=["volcano", "cosyvoice", "fake"], default="volcano")
+    run.add_argument("--cues", type=int, default=10)
+    add_common(run)
+
+    suite = sub.add_parser("suite", help="在子进程中运行场景矩阵")
+    suite.add_argument("--pipelines", default="volcano,cosyvoice")
+    suite.add_argument("--cues", default="10,1000,10000")
+    add_common(suite)
+
+    post = sub.add_parser("postprocess", help="测量字幕音频后处理的批处理速度")
+    post.add_argument("--cues", default="1000,10000")
+    post.add_argument("--sample-rate", type=int, default=24000)
+    post.add_argument("--runs", type=int, default=3)
+    post.add_argument("--seed", type=int, default=0)
+    post.add_argument("--json", action="store_true", help="输出JSON而不是表格")
+
+    timeline = sub.add_parser("timeline", help="测量内存映射时间轴导出的峰值内存")
+    timeline.add_argument("--hours", default="0.5,2,6")
+    timeline.add_argument("--workers", type=int, default=4)
+    timeline.add_argument("--json", action="store_true", help="输出JSON而不是表格")
+
+    stems = sub.add_parser("stems", help="测量分轨导出的耗时")
+    stems.add_argument("--cues", default="1000,5000")
+    stems.add_argument("--workers", type=int, default=8)
+    stems.add_argument("--encoding", choices=list(ENCODINGS), default="wav")
+    stems.add_argument("--json", action="store_true", help="输出JSON而不是表格")
+
+    startup = sub.add_parser("startup", help="测量应用冷启动到首次绘制的时间")
+    startup.add_argument("--apps", default="volcano,cosyvoice")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--json", action="store_true", help="输出JSON而不是表格")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "startup":
+        rows = []
+        for app in args.apps.split(","):
+            try:
+                rows.append(run_startup(app, args.runs))
+            except RuntimeError as e:
+                print(f"{app} 启动测量失败: {e}", file=sys.stderr)
+        columns = ["app", "runs", "import_ms", "first_paint_ms", "process_ms"]
+        print(json.dumps(rows, ensure_ascii=False, indent=2) if args.json else format_report(rows, columns))
+        return 0 if rows else 1
+
+    if args.command == "postprocess":
+        try:
+            rows = [run_postprocess(int(cues), args.sample_rate, args.seed, args.runs) for cues in args.cues.split(",")]
+        except RuntimeError as e:
+            print(f"后处理测量失败: {e}", file=sys.stderr)
+            return 1
+        columns = ["cues", "audio_s", "trimmed_s", "wall_s", "cues_per_s", "realtime_x", "peak_rss_mb"]
+        print(json.dumps(rows, ensure_ascii=False, indent=2) if args.json else format_report(rows, columns))
+        return 0
+
+    if args.command == "stems":
+        rows = [run_stems(int(cues), args.workers, args.encoding) for cues in args.cues.split(",")]
+        columns = ["cues", "workers", "files", "written_mb", "wall_s", "stems_per_s"]
+        print(json.dumps(rows, ensure_ascii=False, indent=2) if args.json else format_report(rows, columns))
+        return 0
+
+    if args.command == "timeline":
+        values = args.hours.split(",")
+        if len(values) == 1:
+            rows = [run_timeline(float(values[0]), workers=args.workers)]
+        else:
+            # 每个时长在独立子进程中运行，峰值内存互不干扰
+            rows = []
+            for hours in values:
+                proc = subprocess.run([sys.executable, __file__, "timeline", "--hours", hours,
+                                       "--workers", str(args.workers), "--json"], capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(f"时长 {hours} 小时运行失败:\n{proc.stderr}", file=sys.stderr)
+                    continue
+                rows.extend(json.loads(proc.stdout))
+        columns = ["hours", "cues", "file_mb", "wall_s", "peak_rss_mb"]
+        print(json.dumps(rows, ensure_ascii=False, indent=2) if args.json else format_report(rows, columns))
+        return 0
+
+    if args.command == "run":
+        row = run_scenario(args.pipeline, args.cues, **_scenario_args(args))
+        print(json.dumps(row, ensure_ascii=False) if args.json else format_report([row]))
+        return 0
+
+    rows = []
+    for pipeline in args.pipelines.split(","):
+        for cues in args.cues.split(","):
+            cmd = [sys.executable, __file__, "run", "--pipeline", pipeline, "--cues", cues, "--json"]
+            for key, value in _scenario_args(args).items():
+                cmd += [f"--{key.replace('_', '-')}", str(value)]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"场景 {pipeline}/{cues} 运行失败:\n{proc.stderr}", file=sys.stderr)
+                continue
+            rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(json.dumps(rows, ensure_ascii=False, indent=2) if args.json else format_report(rows))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""服务商熔断器：连续失败时暂停请求，轻量探测恢复后自动继续
+
+服务商故障时，如果每条字幕都各自等满超时再失败，一次故障会变成数小时的无效等待。
+熔断器在连续threshold次可重试的失败（网络异常、5xx、超时）后打开，之后的请求在发出前等待；
+等待期间由其中一个等待者按指数退避调用后端的probe()探测，探测成功即关闭，任务继续。
+"""
+import threading
+import time
+
+
+class CircuitBreaker:
+    """按服务商共用的熔断器
+
+    关闭后的第一个失败会立即再次打开（半开状态），避免探测通过但接口仍不可用时
+    又要累计threshold次失败；任何一次成功都把失败计数清零。
+    """
+
+    def __init__(self, name, threshold=5, probe_interval=5.0, max_probe_interval=60.0, log=None):
+        self.name = name
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self._log = log
+        self._lock = threading.Lock()
+        self.failures = 0  # 连续失败次数
+        self.opened_at = None
+        self.trips = 0  # 累计打开次数
+        self.probes = 0
+        self.paused_s = 0.0  # 累计处于打开状态的时间（秒）
+        self._interval = probe_interval
+        self._next_probe = 0.0
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def record_success(self):
+        """请求成功：清零失败计数，打开状态下直接关闭"""
+        with self._lock:
+            self.failures = 0
+            recovered = self._close()
+        if recovered is not None:
+            self._emit(f"{self.name} 请求已成功，熔断解除（暂停 {recovered:.0f} 秒）")
+
+    def record_failure(self, reason=None):
+        """可重试的失败：连续失败达到阈值时打开"""
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures < self.threshold:
+                return
+            now = time.monotonic()
+            self.opened_at = now
+            self.trips += 1
+            self._interval = self.probe_interval
+            self._next_probe = now + self._interval
+        detail = f"（{reason}）" if reason else ""
+        self._emit(f"{self.name} 连续失败 {self.failures} 次{detail}，暂停请求，{self.probe_interval:.0f} 秒后探测")
+
+    def wait(self, token=None, probe=None, on_pause=None):
+        """打开状态下阻塞到恢复；等待者中的一个负责探测
+
+        probe()返回服务商是否可达，为None时到时间即放行一个请求试探；
+        on_pause(reason)在开始等待时以暂停原因、结束等待时以None回调。
+        """
+        paused = False
+        try:
+            while True:
+                with self._lock:
+                    if self.opened_at is None:
+                        return
+                    run_probe = not self._probing and time.monotonic() >= self._next_probe
+                    if run_probe:
+                        self._probing = True
+                if not paused:
+                    paused = True
+                    if on_pause:
+                        on_pause(f"{self.name} 不可用，等待恢复")
+                if run_probe:
+                    self._probe(probe)
+                    continue
+                if token is not None:
+                    token.wait(0.2)
+                    token.raise_if_cancelled()
+                else:
+                    time.sleep(0.2)
+        finally:
+            if paused and on_pause:
+                on_pause(None)
+
+    def stats(self):
+        """返回熔断器状态快照"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "open": self.opened_at is not None,
+                "failures": self.failures,
+                "trips": self.trips,
+                "probes": self.probes,
+                "paused_s": round(self.paused_s + (time.monotonic() - self.opened_at if self.opened_at else 0), 1),
+            }
+
+    def _probe(self, probe):
+        try:
+            ok = probe() if probe is not None else True
+        except Exception:
+            ok = False
+        with self._lock:
+            self._probing = False
+            self.probes += 1
+            if ok:
+                self.failures = self.threshold - 1  # 半开：再失败一次立即重新打开
+                recovered = self._close()
+            else:
+                self._interval = min(self.max_probe_interval, self._interval * 2)
+                self._next_probe = time.monotonic() + self._interval
+                interval = self._interval
+        if not ok:
+            self._emit(f"{self.name} 探测失败，{interval:.0f} 秒后重试")
+        elif recovered is not None:
+            self._emit(f"{self.name} 探测成功，恢复请求（暂停 {recovered:.0f} 秒）")
+
+    def _close(self):
+        # 须持有锁；返回本次打开的时长，原本已关闭时返回None
+        if self.opened_at is None:
+            return None
+        paused = time.monotonic() - self.opened_at
+        self.paused_s += paused
+        self.opened_at = None
+        return paused
+
+    def _emit(self, message):
+        if self._log:
+            self._log(message)
@@ -0,0 +1,145 @@
+"""应用配置存储：两个应用共用一个config.json，各自的数据放在独立的命名空间下
+
+界面上的每次改动只更新内存并安排一次延迟写入，连续拖动滑块等操作合并为一次写盘；
+写入先写临时文件再替换，中途崩溃也不会留下写了一半的配置。写入前重新读取文件，
+只替换本进程改动过的命名空间，两个应用同时运行时不会互相覆盖。
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+CONFIG_VERSION = 2
+# 旧版本（不分命名空间）的配置内容，在某个应用认领前原样保留
+LEGACY_SECTION = "legacy"
+
+
+class ConfigStore:
+    """按命名空间读写的配置文件
+
+    delay为最后一次改动后等待多久写入（秒），max_delay为持续改动时最长的写入间隔。
+    进程正常退出时写入尚未保存的改动。
+    """
+
+    def __init__(self, path="config.json", delay=1.0, max_delay=5.0, log=None):
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        self._log = log
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = set()  # 有未写入改动的命名空间
+        self._claimed = False  # 旧版本配置已被某个命名空间认领
+        self._first_change = None
+        self._last_change = None
+        self._timer = None
+        self._data = self._read()
+        atexit.register(self.flush)
+
+    def section(self, name, legacy_keys=()):
+        """返回命名空间name的配置副本，不存在时返回None
+
+        该命名空间尚不存在、而旧版本配置包含legacy_keys中的任一键时，返回旧版本配置，
+        下次写入该命名空间后旧版本配置即被替换。
+        """
+        with self._lock:
+            section = self._data.get(name)
+            if section is None:
+                legacy = self._data.get(LEGACY_SECTION)
+                if legacy is not None and any(key in legacy for key in legacy_keys):
+                    self._claimed = True
+                    return dict(legacy)
+                return None
+            return dict(section)
+
+    def update(self, name, values):
+        """替换命名空间name的内容，并安排延迟写入"""
+        with self._lock:
+            self._data[name] = dict(values)
+            if self._claimed:
+                self._data.pop(LEGACY_SECTION, None)
+                self._dirty.add(LEGACY_SECTION)
+            self._dirty.add(name)
+            now = time.monotonic()
+            self._last_change = now
+            if self._first_change is None:
+                self._first_change = now
+            if self._timer is None:
+                self._schedule(self.delay)
+
+    def flush(self):
+        """立即写入尚未保存的改动，返回是否写入成功（没有改动时为True）"""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                dirty, self._dirty = self._dirty, set()
+                self._first_change = None
+                changes = {name: self._data.get(name) for name in dirty}
+            if not changes:
+                return True
+            try:
+                self._write(changes)
+            except Exception as e:
+                with self._lock:
+                    self._dirty |= dirty  # 下次写入时重试
+                self._emit(f"保存配置失败: {e}")
+                return False
+            return True
+
+    def _schedule(self, wait):
+        # 须持有锁
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            now = time.monotonic()
+            wait = min(self._last_change + self.delay, self._first_change + self.max_delay) - now
+            if wait > 0:
+                self._schedule(wait)  # 期间又有改动，推迟写入
+                return
+        self.flush()
+
+    def _read(self):
+        """读取配置文件；旧版本的平铺配置放入legacy命名空间，文件损坏时按空配置处理"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {"version": CONFIG_VERSION}
+        except (OSError, ValueError) as e:
+            self._emit(f"读取配置文件失败，按默认配置处理: {e}")
+            return {"version": CONFIG_VERSION}
+        if not isinstance(data, dict):
+            return {"version": CONFIG_VERSION}
+        if data.get("version") != CONFIG_VERSION:
+            return {"version": CONFIG_VERSION, LEGACY_SECTION: data}
+        return data
+
+    def _write(self, changes):
+        # 以磁盘上的最新内容为基础，只替换本进程改动过的命名空间
+        data = self._read()
+        for name, section in changes.items():
+            if section is None:
+                data.pop(name, None)
+            else:
+                data[name] = section
+        data["version"] = CONFIG_VERSION
+        tmp = f"{self.path}.{os.getpid()}.tmp"  # 两个应用同时写入时各用各的临时文件
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)  # 含API密钥，仅本用户可读写
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _emit(self, message):
+        if self._log:
+            self._log(message)
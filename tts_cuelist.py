@@ -0,0 +1,232 @@
+"""虚拟化的字幕列表：只为可见的几行创建表格项，数万条字幕也能即时加载和流畅滚动
+
+表格项数量等于可见行数，滚动时复用这些表格项、按需格式化对应条目的内容；
+外置的滚动条按条目总数计算位置。合成状态由工作线程写入（不做界面操作），
+CueListView在Tk主线程按固定帧率检查并只刷新可见行，与ProgressView的做法一致。
+"""
+import tkinter as tk
+from tkinter import ttk
+
+from tts_subtitle import ms_to_time
+
+PENDING = "pending"
+DONE = "done"
+CACHED = "cached"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+STATUS_LABELS = {
+    PENDING: "待合成",
+    DONE: "完成",
+    CACHED: "完成（缓存）",
+    FAILED: "失败",
+    SKIPPED: "跳过",
+}
+
+COLUMNS = (
+    ("index", "序号", 60),
+    ("time", "时间码", 200),
+    ("text", "文本", 360),
+    ("status", "状态", 90),
+    ("duration", "时长", 100),
+)
+
+
+class CueListView:
+    """字幕条目表格（序号、时间码、文本、状态、时长）
+
+    frame为外层容器，由调用方布局；on_activate(cue)在双击或回车时回调。
+    mark()可在任意线程调用，start()/stop()控制刷新。
+    """
+
+    def __init__(self, parent, height=6, fps=10, on_activate=None):
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=[key for key, _, _ in COLUMNS], show="headings",
+                                 height=height, selectmode="browse")
+        for key, title, width in COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, minwidth=40, stretch=(key == "text"),
+                             anchor=tk.W if key == "text" else tk.CENTER)
+        self.tree.tag_configure(FAILED, foreground="red")
+        self.tree.tag_configure(SKIPPED, foreground="gray")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        self.scrollbar.grid(row=0, column=1, sticky=tk.NS)
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        self.on_activate = on_activate
+        self.interval = max(1, int(1000 / fps))
+        self.cues = []
+        self._positions = {}  # id(条目) -> 位置
+        self._status = []
+        self._audio_ms = []  # 合成音频的实际时长（毫秒），未知为None
+        self.first = 0  # 第一个可见行对应的条目位置
+        self.visible = height
+        self.selected = None  # 选中条目的位置
+        self._rows = []  # 复用的表格项
+        self._dirty = False
+        self._running = False
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Double-1>", self._on_activate)
+        self.tree.bind("<Return>", self._on_activate)
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "page-up"), ("<Next>", "page-down")):
+            self.tree.bind(key, lambda event, step=step: self._on_key(step))
+        self.tree.bind("<Home>", lambda event: self._jump(0))
+        self.tree.bind("<End>", lambda event: self._jump(len(self.cues) - 1))
+        self._render()
+
+    def load(self, cues):
+        """显示一组字幕条目（parse_srt的结果），状态全部为待合成"""
+        self.cues = cues
+        self._positions = {id(cue): position for position, cue in enumerate(cues)}
+        self._status = [PENDING] * len(cues)
+        self._audio_ms = [None] * len(cues)
+        self.first = 0
+        self.selected = None
+        self._render()
+
+    def reset(self):
+        """开始新任务前把状态恢复为待合成"""
+        self._status = [PENDING] * len(self.cues)
+        self._audio_ms = [None] * len(self.cues)
+        self._dirty = True
+
+    def mark(self, cue, status=None, audio_ms=None):
+        """更新一个条目的合成状态和音频时长（任意线程），为None的项不变；cue不在列表中时忽略"""
+        position = self._positions.get(id(cue))
+        if position is None:
+            return
+        if status is not None:
+            self._status[position] = status
+        if audio_ms is not None:
+            self._audio_ms[position] = audio_ms
+        self._dirty = True
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._tick()
+
+    def stop(self):
+        """停止定时刷新并做最后一次刷新（须在Tk主线程调用）"""
+        self._running = False
+        self._render()
+
+    def see(self, position):
+        """滚动到使位置position可见"""
+        if position < self.first:
+            self.first = position
+        elif position >= self.first + self.visible:
+            self.first = position - self.visible + 1
+        self._render()
+
+    def scroll(self, rows):
+        self.first += rows
+        self._render()
+
+    def _tick(self):
+        if not self._running:
+            return
+        if self._dirty:
+            self._render()
+        self.tree.after(self.interval, self._tick)
+
+    def _render(self):
+        """按当前滚动位置刷新可见行"""
+        self._dirty = False
+        total = len(self.cues)
+        self.first = max(0, min(self.first, total - self.visible))
+        while len(self._rows) < self.visible:
+            self._rows.append(self.tree.insert("", tk.END))
+        while len(self._rows) > self.visible:
+            self.tree.delete(self._rows.pop())
+        selection = ()
+        for offset, row in enumerate(self._rows):
+            position = self.first + offset
+            if position < total:
+                self.tree.item(row, values=self._values(position), tags=(self._status[position],))
+                if position == self.selected:
+                    selection = (row,)
+            else:
+                self.tree.item(row, values=("",) * len(COLUMNS), tags=())
+        if tuple(self.tree.selection()) != selection:
+            self.tree.selection_set(selection)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.visible) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _values(self, position):
+        cue = self.cues[position]
+        window = cue['end'] - cue['start']
+        audio = self._audio_ms[position]
+        if audio is None:
+            duration = f"{window / 1000:.1f}s"
+        else:
+            duration = f"{audio / 1000:.1f}s / {window / 1000:.1f}s"
+        return (
+            cue['index'],
+            f"{ms_to_time(cue['start'])} → {ms_to_time(cue['end'])}",
+            " ".join(cue['text'].split()),
+            STATUS_LABELS[self._status[position]],
+            duration,
+        )
+
+    def _on_resize(self, event):
+        # 按表格实际高度计算可见行数：首行的纵坐标即表头高度
+        if not self._rows:
+            return
+        box = self.tree.bbox(self._rows[0])
+        if not box:
+            return
+        visible = max(1, (event.height - box[1]) // box[3])
+        if visible != self.visible:
+            self.visible = visible
+            self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.first = int(float(amount) * len(self.cues))
+        elif unit == "pages":
+            self.first += int(amount) * self.visible
+        else:
+            self.first += int(amount)
+        self._render()
+
+    def _on_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] in self._rows:
+            position = self.first + self._rows.index(selection[0])
+            if position < len(self.cues):
+                self.selected = position
+
+    def _on_key(self, step):
+        # 选中行移出可见范围时滚动，而不是只在可见行内移动
+        if step == "page-up":
+            step = -self.visible
+        elif step == "page-down":
+            step = self.visible
+        current = self.selected if self.selected is not None else self.first
+        self._jump(current + step)
+        return "break"
+
+    def _jump(self, position):
+        if not self.cues:
+            return "break"
+        self.selected = max(0, min(position, len(self.cues) - 1))
+        self.see(self.selected)
+        return "break"
+
+    def _on_activate(self, event):
+        if self.on_activate is not None and self.selected is not None:
+            self.on_activate(self.cues[self.selected])
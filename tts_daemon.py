@@ -0,0 +1,466 @@
+"""监视目录的字幕配音守护进程
+
+把SRT文件放入监视目录即可自动配音：新文件进入SQLite持久化队列，
+固定数量的任务线程依次处理，合并后的音频和状态文件写在输入文件旁边：
+
+    python tts_daemon.py /srv/dubbing --backend volcano --voice S_xxx --api-key ...
+
+    episode01.srt  ->  episode01.mp3  +  episode01.status.json
+
+Linux下用inotify接收文件写入完成事件，其他平台或inotify不可用时退回定时扫描。
+所有任务共享同一个合成引擎，服务商的并发数和请求间隔由引擎统一限制；
+排队的任务超过上限时暂停入队，文件留在目录中，待队列消化后由扫描补入。
+进程重启后，未完成的任务从队列中恢复。每个任务（合成与合并）有总的超时时间。
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from tts_audio import ENCODINGS, file_extension, to_file_bytes
+from tts_backend import BACKENDS, SynthesisOptions, create_backend
+from tts_breaker import CircuitBreaker
+from tts_engine import SynthesisEngine
+from tts_executor import CancelToken
+from tts_hedge import HedgePolicy
+from tts_metrics import format_rollup
+from tts_quota import QuotaLedger, QuotaScheduler, format_estimate
+from tts_subtitle import parse_srt
+
+# inotify事件掩码
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENT_HEADER = struct.Struct("iIII")
+
+STATUS_SUFFIX = ".status.json"
+
+
+def log(message):
+    """输出带时间戳的日志"""
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+class JobQueue:
+    """基于SQLite的持久化任务队列
+
+    同一文件以(路径, 修改时间, 大小)区分版本，重复入队会被忽略；
+    文件被修改后作为新任务重新入队。进程异常退出时处于running的任务在重启后恢复为queued。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " path TEXT NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'queued',"
+            " error TEXT,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " UNIQUE(path, mtime, size))"
+        )
+        with self._conn:
+            recovered = self._conn.execute(
+                "UPDATE jobs SET status='queued', updated=? WHERE status='running'", (time.time(),)
+            ).rowcount
+        self.recovered = recovered
+
+    def enqueue(self, path, mtime, size):
+        """登记一个文件版本，已存在时返回False"""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (path, mtime, size, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (path, mtime, size, now, now),
+            )
+            return cursor.rowcount > 0
+
+    def known(self, path, mtime, size):
+        """该文件版本是否已登记"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE path=? AND mtime=? AND size=?", (path, mtime, size)
+            ).fetchone()
+        return row is not None
+
+    def claim(self):
+        """取出最早排队的任务并标记为running，没有任务时返回None"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id, path FROM jobs WHERE status='queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE jobs SET status='running', updated=? WHERE id=?", (time.time(), row[0]))
+        return {"id": row[0], "path": row[1]}
+
+    def finish(self, job_id, status, error=None):
+        """结束任务：status为done、failed或queued（放回队列）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status=?, error=?, updated=? WHERE id=?", (status, error, time.time(), job_id)
+            )
+
+    def pending(self):
+        """排队中与执行中的任务数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+    def stats(self):
+        """按状态统计任务数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DirectoryWatcher:
+    """监视目录中的字幕文件
+
+    优先使用inotify（文件写入关闭或移入时立即触发），并定时全量扫描作为补充：
+    扫描发现的文件须在两次扫描间大小和修改时间不变，才视为已写完。
+    启动时已存在的文件同样处理，只有修改时间早于一个扫描间隔的文件直接视为已写完。
+    """
+
+    def __init__(self, directory, on_ready, interval=2.0, use_inotify=True, suffix=".srt"):
+        self.directory = directory
+        self.on_ready = on_ready  # on_ready(path, mtime, size)
+        self.interval = interval
+        self.suffix = suffix
+        self._stop = threading.Event()
+        self._seen = {}  # path -> (mtime, size)，上一次扫描的结果
+        self._fd = self._open_inotify() if use_inotify else None
+        self.mode = "inotify" if self._fd is not None else "polling"
+
+    def run(self):
+        """阻塞运行直到stop()"""
+        self.scan(initial=True)
+        next_scan = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            timeout = max(0.0, next_scan - time.monotonic())
+            if self._fd is not None:
+                self._read_events(timeout)
+            else:
+                self._stop.wait(timeout)
+            if time.monotonic() >= next_scan:
+                self.scan()
+                next_scan = time.monotonic() + self.interval
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def stop(self):
+        self._stop.set()
+
+    def scan(self, initial=False):
+        """全量扫描；启动时的首次扫描没有上一次的结果，直接接受一个扫描间隔内未修改过的文件"""
+        current = {}
+        settled = time.time() - self.interval
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError as e:
+            log(f"扫描目录失败: {e}")
+            return
+        for entry in entries:
+            if not entry.is_file() or not entry.name.lower().endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            version = (stat.st_mtime, stat.st_size)
+            current[entry.path] = version
+            if self._seen.get(entry.path) == version or (initial and stat.st_mtime <= settled):
+                self.on_ready(entry.path, *version)
+        self._seen = current
+
+    def _notify(self, name):
+        if not name.lower().endswith(self.suffix):
+            return
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        self.on_ready(path, stat.st_mtime, stat.st_size)
+
+    def _open_inotify(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+            wd = libc.inotify_add_watch(fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch")
+            return fd
+        except (OSError, AttributeError) as e:
+            log(f"inotify不可用，改为定时扫描: {e}")
+            return None
+
+    def _read_events(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += length
+            if name and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._notify(name)
+
+
+def status_path(path):
+    """输入文件对应的状态文件路径"""
+    return os.path.splitext(path)[0] + STATUS_SUFFIX
+
+
+def write_atomic(path, data):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_status(path, status, **fields):
+    """把任务状态写入输入文件旁的状态文件"""
+    payload = {"input": os.path.basename(path), "status": status,
+               "updated": time.strftime("%Y-%m-%d %H:%M:%S"), **fields}
+    write_atomic(status_path(path), json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+class WatchDaemon:
+    """监视目录、维护队列并用固定数量的任务线程配音
+
+    job_timeout为单个任务（合成和合并）的总时限（秒），超时的任务记为失败，None或0为不限。
+    """
+
+    def __init__(self, directory, engine, options, job_workers=1, max_pending=20,
+                 poll_interval=2.0, use_inotify=True, db_path=None, job_timeout=None):
+        self.directory = os.path.abspath(directory)
+        self.engine = engine
+        self.options = options
+        self.job_workers = job_workers
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        # 合并在独立线程中执行以便按剩余时限等待；超时的合并结束前仍占用一个线程
+        self._merger = ThreadPoolExecutor(max_workers=job_workers, thread_name_prefix="tts-merge")
+        self.queue = JobQueue(db_path or os.path.join(self.directory, ".tts_queue.sqlite3"))
+        self.watcher = DirectoryWatcher(self.directory, self._on_file, poll_interval, use_inotify)
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._tokens = {}  # job_id -> CancelToken
+        self._throttled = False
+
+    def run(self):
+        """阻塞运行直到stop()"""
+        log(f"开始监视 {self.directory}（{self.watcher.mode}），任务线程 {self.job_workers} 个，"
+            f"服务商并发 {self.engine.executor.max_workers}")
+        if self.queue.recovered:
+            log(f"从队列恢复 {self.queue.recovered} 个未完成任务")
+        workers = [threading.Thread(target=self._work_loop, name=f"tts-job-{i}", daemon=True)
+                   for i in range(self.job_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            self.watcher.run()
+        finally:
+            for worker in workers:
+                worker.join()
+            self._merger.shutdown(wait=False, cancel_futures=True)
+            self.queue.close()
+            self.engine.close()
+            log("守护进程已退出")
+
+    def stop(self):
+        """停止监视；执行中的任务被取消并放回队列，下次启动时继续"""
+        self._stop.set()
+        self.watcher.stop()
+        for token in list(self._tokens.values()):
+            token.cancel()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _on_file(self, path, mtime, size):
+        if self.queue.known(path, mtime, size):
+            return
+        if self.queue.pending() >= self.max_pending:
+            # 背压：暂不入队，文件留在目录中，队列消化后由定时扫描补入
+            if not self._throttled:
+                log(f"排队任务已达上限 {self.max_pending}，暂缓入队")
+                self._throttled = True
+            return
+        self._throttled = False
+        if self.queue.enqueue(path, mtime, size):
+            write_status(path, "queued")
+            log(f"已入队: {os.path.basename(path)}")
+            with self._wakeup:
+                self._wakeup.notify()
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(1.0)
+                continue
+            self._process(job)
+
+    def _process(self, job):
+        path = job["path"]
+        name = os.path.basename(path)
+        token = self._tokens[job["id"]] = CancelToken()
+        expired = threading.Event()
+        deadline = time.monotonic() + self.job_timeout if self.job_timeout else None
+        timer = None
+        if deadline is not None:
+            def expire():
+                expired.set()
+                token.cancel()
+            timer = threading.Timer(self.job_timeout, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            try:
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    cues = parse_srt(f.read())
+            except OSError as e:
+                self._fail(job, f"读取字幕失败: {e}")
+                return
+            if not cues:
+                self._fail(job, "未解析到有效字幕")
+                return
+
+            log(f"开始配音: {name}（{len(cues)} 条字幕），"
+                f"{format_estimate(self.engine.estimate([cue['text'] for cue in cues], self.options, dedupe=True))}")
+            write_status(path, "running", cues=len(cues))
+            engine_job = self.engine.new_job("watch")
+            try:
+                segments = self.engine.synthesize_cues(cues, self.options, token=token, job=engine_job)
+            finally:
+                self.engine.metrics.end_job(engine_job)
+            rollup = self.engine.metrics.rollup(engine_job)
+
+            if expired.is_set():
+                self._fail(job, f"配音超时（{self.job_timeout:g}秒）", rollup=rollup)
+                return
+            if token.cancelled:
+                self.queue.finish(job["id"], "queued")
+                write_status(path, "queued", note="守护进程停止，下次启动时继续")
+                return
+            if not segments:
+                self._fail(job, "所有字幕合成失败", rollup=rollup)
+                return
+
+            result = segments[0]["result"]
+            future = self._merger.submit(self._render, segments)
+            try:
+                data = future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                self._fail(job, f"配音超时（{self.job_timeout:g}秒），合并音频未完成", rollup=rollup)
+                return
+            output = os.path.splitext(path)[0] + file_extension(result.encoding)
+            write_atomic(output, data)
+            self.queue.finish(job["id"], "done")
+            write_status(path, "done", output=os.path.basename(output), cues=len(cues),
+                         ok=len(segments), failed=len(cues) - len(segments), rollup=rollup)
+            log(f"配音完成: {name} -> {os.path.basename(output)}，{format_rollup(rollup)}")
+        except Exception as e:
+            self._fail(job, f"配音出错: {e}")
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._tokens.pop(job["id"], None)
+
+    def _render(self, segments):
+        """合并各段音频并封装为输出文件的内容"""
+        result = segments[0]["result"]
+        merged = self.engine.merge([segment["result"] for segment in segments])
+        return to_file_bytes(merged, result.encoding, result.sample_rate)
+
+    def _fail(self, job, error, **fields):
+        self.queue.finish(job["id"], "failed", error)
+        write_status(job["path"], "failed", error=error, **fields)
+        log(f"配音失败: {os.path.basename(job['path'])}，{error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="监视目录并自动为新字幕文件配音")
+    parser.add_argument("directory", help="监视的目录")
+    parser.add_argument("--backend", choices=BACKENDS, default="volcano")
+    parser.add_argument("--api-key", default=os.environ.get("TTS_API_KEY", ""),
+                        help="服务商API密钥（默认读取环境变量TTS_API_KEY）")
+    parser.add_argument("--voice", required=True, help="音色ID")
+    parser.add_argument("--speed", type=float, default=1.0, help="语速")
+    parser.add_argument("--encoding", choices=list(ENCODINGS), default="mp3", help="输出格式")
+    parser.add_argument("--jobs", type=int, default=1, help="同时处理的字幕文件数")
+    parser.add_argument("--concurrency", type=int, default=4, help="向服务商并发请求数（所有任务共享）")
+    parser.add_argument("--min-interval", type=float, default=0.5, help="相邻请求最小间隔（秒）")
+    parser.add_argument("--max-pending", type=int, default=20, help="排队任务上限，超过后暂缓入队")
+    parser.add_argument("--quota-chars", type=int, default=0, help="每个配额窗口的字符上限，0为不限")
+    parser.add_argument("--quota-window", type=float, default=60, help="配额窗口长度（秒）")
+    parser.add_argument("--hedge-budget", type=float, default=0.0,
+                        help="对冲请求占普通请求的比例上限（如0.05），0为不对冲")
+    parser.add_argument("--job-timeout", type=float, default=7200,
+                        help="单个字幕文件的配音时限（秒，含合并），0为不限")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="目录扫描间隔（秒）")
+    parser.add_argument("--no-inotify", action="store_true", help="只使用定时扫描")
+    parser.add_argument("--db", help="队列数据库路径（默认在监视目录中）")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"目录不存在: {args.directory}")
+    engine = SynthesisEngine(
+        create_backend(args.backend, args.api_key, log=log),
+        max_workers=args.concurrency,
+        timeout=30,
+        min_interval=args.min_interval,
+        max_retries=2,
+        log=log,
+        quota=QuotaScheduler(args.quota_chars, args.quota_window,
+                             QuotaLedger(os.path.join(args.directory, ".tts_quota.json")), log=log),
+        hedge=HedgePolicy(budget=args.hedge_budget) if args.hedge_budget else None,
+        breaker=CircuitBreaker(args.backend, log=log),
+    )
+    options = SynthesisOptions(args.voice, speed=args.speed, encoding=args.encoding)
+    daemon = WatchDaemon(args.directory, engine, options, job_workers=args.jobs, max_pending=args.max_pending,
+                         poll_interval=args.poll_interval, use_inotify=not args.no_inotify, db_path=args.db,
+                         job_timeout=args.job_timeout)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: daemon.stop())
+    daemon.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
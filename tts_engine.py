@@ -0,0 +1,631 @@
+"""合成引擎：在后端接口之上统一处理缓存、并发调度、超时与合并"""
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from tts_audio import merge_audio
+from tts_backend import BackendError, SynthesisResult
+from tts_metrics import MetricsCollector, RequestMetrics
+from tts_hedge import HedgeTimer
+from tts_executor import CancelToken, SynthesisCancelled, SynthesisExecutor, SynthesisTimeout
+from tts_quota import count_chars
+from tts_subtitle import dedupe_texts
+
+
+class AudioCache:
+    """按字节数限制的内存LRU音频缓存"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        """是否已缓存（不计入命中统计）"""
+        with self._lock:
+            return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key, result):
+        size = len(result.audio)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old.audio)
+            self._items[key] = result
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted.audio)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+class SynthesisEngine:
+    """服务商无关的合成引擎，两个应用共用
+
+    请求经由SynthesisExecutor并发执行，同一时刻最多max_workers个；
+    min_interval限制相邻请求的最小发起间隔，用于遵守服务商的频率限制；
+    可重试的BackendError按指数退避最多重试max_retries次。
+    每个请求的计时记入metrics，按任务（job）汇总；
+    quota为QuotaScheduler时按API密钥统计字符用量，配额窗口用完后请求等待下一个窗口；
+    hedge为HedgePolicy时，耗时超过近期延迟高分位的请求再发一个相同的请求，先返回的为准；
+    breaker为CircuitBreaker时，服务商连续失败后暂停发出请求，探测到恢复后继续，
+    故障期间失败的请求在恢复后重发（不计入max_retries，但每个请求最多重发max_resends次）。
+    多个引擎可共用同一个executor、cache和metrics，共享并发预算与缓存（见tts_service）。
+    """
+
+    def __init__(self, backend, max_workers=4, timeout=30, min_interval=0.0, cache=None, log=None,
+                 max_retries=0, retry_backoff=0.5, metrics=None, executor=None, quota=None,
+                 hedge=None, breaker=None, max_resends=3):
+        self.backend = backend
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.max_resends = max_resends
+        self.retry_backoff = retry_backoff
+        self.cache = cache if cache is not None else AudioCache()
+        self.metrics = metrics if metrics is not None else MetricsCollector()
+        self.quota = quota
+        self.hedge = hedge
+        self.breaker = breaker
+        self._log = log
+        self._job_ids = itertools.count(1)
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = SynthesisExecutor(max_workers=max_workers, log=log, name=backend.name)
+        self.executor = executor
+        self._pace_lock = threading.Lock()
+        self._next_start = 0.0
+        self._hedge_timer = HedgeTimer(name=f"{backend.name}-hedge")
+
+    def new_job(self, prefix=None):
+        """生成任务ID并登记到指标收集器"""
+        job = f"{prefix or self.backend.name}-{time.strftime('%Y%m%d-%H%M%S')}-{next(self._job_ids)}"
+        self.metrics.begin_job(job)
+        return job
+
+    def estimate(self, texts, options, dedupe=False):
+        """合成前预估：需要实际请求（未命中缓存）的文本数与字符数，以及配额窗口"""
+        if dedupe:
+            texts = dedupe_texts(texts)[0]
+        pending = [t for t in texts if t and options.cache_key(self.backend.name, t) not in self.cache]
+        chars = sum(count_chars(t) for t in pending)
+        if self.quota is not None:
+            estimate = self.quota.estimate(getattr(self.backend, 'api_key', ''), chars)
+        else:
+            estimate = {"chars": chars, "available": None, "windows": 1 if chars else 0, "wait_s": 0.0}
+        estimate["requests"] = len(pending)
+        return estimate
+
+    def synthesize(self, text, options, timeout=None, job=None):
+        """同步合成一段文本（带缓存与超时）"""
+        own_job = job is None
+        if own_job:
+            job = self.new_job()
+        try:
+            key = options.cache_key(self.backend.name, text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record_cached(job, 0)
+                return SynthesisResult(cached.audio, cached.encoding, raw=cached.raw, cached=True,
+                                       sample_rate=cached.sample_rate)
+            timeout = self.timeout if timeout is None else timeout
+            state = {'job': job, 'index': 0, 'submitted': time.monotonic()}
+            future, token = self.executor.submit(self._request, text, options, state)
+            result = self._wait(future, token, state, timeout)
+            self.cache.put(key, result)
+            return result
+        finally:
+            if own_job:
+                self.metrics.end_job(job)
+
+    def synthesize_many(self, texts, options, on_item=None, token=None, job=None, progress=None,
+                        dedupe=False, scheduler=None):
+        """并发合成多段文本，按原顺序返回结果列表（失败项为None）
+
+        on_item(index, result, error)在每段完成时于调用线程中回调；
+        progress为ProgressModel时同步更新完成、失败和进行中的计数。
+        dedupe为True时先归一化文本，相同的文本只请求一次，结果分发给每个对应的序号。
+        scheduler为CueScheduler时请求不一次性全部提交，每有空闲并发才按调度器的顺序发出下一个。
+        """
+        own_job = job is None
+        if own_job:
+            job = self.new_job()
+        if dedupe:
+            requests, groups = dedupe_texts(texts)
+            self.metrics.annotate(job, items=len(texts), unique=len(requests))
+        else:
+            requests, groups = list(texts), [[index] for index in range(len(texts))]
+        if progress is not None:
+            progress.begin(len(texts))
+        try:
+            return self._synthesize_many(texts, requests, groups, options, on_item, token, job, progress,
+                                         scheduler)
+        finally:
+            if progress is not None:
+                progress.finish()
+            if own_job:
+                self.metrics.end_job(job)
+
+    def _synthesize_many(self, texts, requests, groups, options, on_item, token, job, progress, scheduler):
+        results = [None] * len(texts)
+        done_queue = queue.Queue()
+        running = {}  # index -> state，只包含正在执行的请求
+        states = []
+
+        def finish(index, result, error, state=None):
+            # index为请求序号，结果分发给该请求对应的每个原序号
+            for item in groups[index]:
+                results[item] = result
+                if progress is not None:
+                    progress.item_done(result is not None, started=bool(state and 'started' in state),
+                                       skipped=result is None and error is None)
+                    state = None  # 进行中的计数只减一次
+                if on_item:
+                    on_item(item, result, error)
+
+        covered = {item for group in groups for item in group}
+        for item in range(len(texts)):
+            if item not in covered:  # 去重时归一化后为空的文本
+                if progress is not None:
+                    progress.item_done(False, skipped=True)
+                if on_item:
+                    on_item(item, None, None)
+
+        def submit(index, key):
+            state = {'index': index, 'item': groups[index][0], 'key': key, 'running': running,
+                     'abandoned': False, 'job': job, 'submitted': time.monotonic(), 'progress': progress}
+            future, task_token = self.executor.submit(self._request, requests[index], options, state)
+            state.update(future=future, token=task_token)
+            future.add_done_callback(lambda f, state=state: done_queue.put(state))
+            states.append(state)
+
+        keys = {}  # 需要实际请求的请求序号 -> 缓存键
+        for index, text in enumerate(requests):
+            if not text:
+                finish(index, None, None)
+                continue
+            key = options.cache_key(self.backend.name, text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record_cached(job, groups[index][0])
+                finish(index, SynthesisResult(cached.audio, cached.encoding, raw=cached.raw, cached=True,
+                                              sample_rate=cached.sample_rate), None)
+                continue
+            keys[index] = key
+            if scheduler is None:
+                submit(index, key)
+
+        pending = len(states)
+        if scheduler is not None:
+            # 发出的请求数保持在执行器并发数以内，其余留在调度器中，跳转后按新位置发出
+            scheduler.bind(groups, keys)
+            limit = self.executor.max_workers
+
+        next_expiry = 0.0
+        while True:
+            cancelled = token is not None and token.cancelled
+            while scheduler is not None and not cancelled and pending < limit:
+                index = scheduler.pop()
+                if index is None:
+                    break
+                submit(index, keys[index])
+                pending += 1
+            if cancelled:
+                if scheduler is not None:
+                    for index in scheduler.drain():
+                        finish(index, None, SynthesisCancelled("合成已取消"))
+                for state in states:
+                    if state['future'].done() or state['abandoned']:
+                        continue
+                    self.executor.abandon(state['future'], state['token'])
+                    if not state['future'].cancelled():
+                        # 已在运行的请求不再等待
+                        state['abandoned'] = True
+                        running.pop(state['index'], None)
+                        pending -= 1
+                        finish(state['index'], None, SynthesisCancelled("合成已取消"), state)
+            if not pending:
+                break
+            try:
+                state = done_queue.get(timeout=0.2)
+            except queue.Empty:
+                state = None
+            # 按时间检查超时（而不是只在没有请求完成时），其他请求不断完成时卡住的请求也能及时放弃；
+            # 超时的请求立即判为失败，不再等待其线程结束
+            now = time.monotonic()
+            if now >= next_expiry:
+                next_expiry = now + 0.2
+                for expired in self._expire(running):
+                    pending -= 1
+                    finish(expired['index'], None, SynthesisTimeout(f"合成超时（{self.timeout}秒）"), expired)
+            if state is None:
+                continue
+            if state['abandoned']:
+                continue  # 已按超时处理过
+            pending -= 1
+            running.pop(state['index'], None)
+            future = state['future']
+            if future.cancelled():
+                finish(state['index'], None, SynthesisCancelled("合成已取消"), state)
+                continue
+            error = future.exception()
+            if error is not None:
+                finish(state['index'], None, error, state)
+                continue
+            result = future.result()
+            self.cache.put(state['key'], result)
+            finish(state['index'], result, None, state)
+        return results
+
+    def synthesize_cues(self, cues, options, on_cue=None, token=None, job=None, progress=None,
+                        dedupe=True, scheduler=None):
+        """并发合成字幕条目，按字幕顺序返回[{'data', 'subtitle', 'result'}]
+
+        on_cue(subtitle, result, error)在每条完成时于调用线程中回调；空字幕的result与error均为None。
+        默认对字幕文本去重，重复的台词只合成一次，音频数据由各条目共享。
+        scheduler为以同一cues创建的CueScheduler时，按播放位置决定请求顺序。
+        """
+        def on_item(index, result, error):
+            if on_cue:
+                on_cue(cues[index], result, error)
+
+        results = self.synthesize_many([cue['text'] for cue in cues], options, on_item, token, job, progress,
+                                      dedupe=dedupe, scheduler=scheduler)
+        return [
+            {'data': result.audio, 'subtitle': cue, 'result': result}
+            for cue, result in zip(cues, results) if result is not None
+        ]
+
+    def merge(self, results):
+        """按顺序合并多个合成结果"""
+        results = [r for r in results if r is not None]
+        if not results:
+            return b''
+        return merge_audio([r.audio for r in results], results[0].encoding)
+
+    def close(self):
+        if self.quota is not None:
+            self.quota.ledger.flush()
+        if self._owns_executor:
+            self.executor.shutdown()
+        self.backend.close()
+
+    def _request(self, token, text, options, state):
+        # 熔断与配额等待计入排队时间，不占用单次请求的超时
+        self._await_provider(token, state)
+        reservation = self._reserve(token, text, state)
+        return self._timed_request(token, text, options, state, reservation)
+
+    def _reserve(self, token, text, state):
+        """按字符数预占配额（余量不足时等待），返回(api_key, 字符数, 窗口)，未启用配额时返回None
+
+        重试的请求同样会被服务商计费，每次发出前都要预占；等待期间暂停该请求的超时计时。
+        """
+        if self.quota is None:
+            return None
+        api_key = getattr(self.backend, 'api_key', '')
+        chars = count_chars(text)
+        window = self.quota.try_acquire(api_key, chars)
+        if window is None:
+            self._pause_timer(state)
+            try:
+                window = self.quota.acquire(api_key, chars, token)
+            finally:
+                self._resume_timer(state)
+        return api_key, chars, window
+
+    def _settle(self, reservation, job, ok):
+        """请求结束：成功时记账，失败时退还预占的配额
+
+        记账失败只记录日志：已成功（且已计费）的合成不能因为统计出错而判为失败。
+        """
+        if reservation is None:
+            return
+        api_key, chars, window = reservation
+        try:
+            if ok:
+                self.quota.commit(api_key, job, chars, window)
+            else:
+                self.quota.refund(api_key, chars, window)
+        except Exception as e:
+            self._emit(f"配额记账失败: {e}")
+
+    def _timed_request(self, token, text, options, state, reservation=None):
+        job = state.get('job')
+        try:
+            self._pace(token)
+            metrics = RequestMetrics(job, self.backend.name, state.get('item', state.get('index')))
+            metrics.chars = count_chars(text)
+            started = time.monotonic()
+            metrics.queue_wait = started - state.get('submitted', started)
+            state['started'] = started
+            running = state.get('running')
+            if running is not None:
+                running[state['index']] = state
+            if state.get('progress') is not None:
+                state['progress'].request_started()
+            start = time.perf_counter()
+            try:
+                attempt = resends = 0
+                while True:
+                    try:
+                        result = self._call(text, options, token, metrics)
+                    except Exception as e:
+                        self._settle(reservation, job, False)
+                        reservation = None
+                        if not isinstance(e, BackendError):
+                            raise
+                        # 探测通过后仍反复失败的请求（如只有这条文本出错）不能无限重发，超出后按普通重试处理
+                        if self._outage(e, token, state) and resends < self.max_resends:
+                            resends += 1
+                            metrics.retries += 1
+                            reservation = self._reserve(token, text, state)
+                            continue
+                        if not e.retryable or attempt >= self.max_retries or token.cancelled:
+                            raise
+                        metrics.retries += 1
+                        token.wait(self.retry_backoff * (2 ** attempt))
+                        token.raise_if_cancelled()
+                        attempt += 1
+                        reservation = self._reserve(token, text, state)
+                        continue
+                    self._settle(reservation, job, True)
+                    reservation = None
+                    break
+                if self.breaker is not None:
+                    self.breaker.record_success()
+            except Exception as e:
+                metrics.total = time.perf_counter() - start
+                metrics.error = str(e)
+                self.metrics.record(metrics)
+                raise
+        finally:
+            self._settle(reservation, job, False)  # 未记账就退出（如排队间隔中被取消）的预占一律退还
+        metrics.total = time.perf_counter() - start
+        metrics.update_timings(result.timings)
+        metrics.ok = True
+        self.metrics.record(metrics)
+        return result
+
+    def _pause_timer(self, state):
+        """本地等待（配额、熔断）期间暂停请求的超时计时；计时尚未开始时不做处理"""
+        if state.get('started') is None:
+            return
+        running = state.get('running')
+        if running is not None:
+            running.pop(state['index'], None)  # 先移出，超时检查不会读到已清空的开始时间
+        state['started'] = None
+
+    def _resume_timer(self, state):
+        if 'started' not in state or state['started'] is not None:
+            return
+        state['started'] = time.monotonic()
+        running = state.get('running')
+        if running is not None:
+            running[state['index']] = state
+
+    def _wait(self, future, token, state, timeout):
+        """等待单个同步请求：只从实际发出请求开始计时，熔断、配额和排队的等待不计入timeout"""
+        while True:
+            try:
+                return future.result(timeout=0.2)
+            except FutureTimeoutError:
+                pass
+            started = state.get('started')
+            if timeout and started is not None and time.monotonic() - started > timeout:
+                self.executor.abandon(future, token, timeout)
+                if self.breaker is not None:
+                    self.breaker.record_failure(f"超时（{timeout}秒）")
+                raise SynthesisTimeout(f"合成超时（{timeout}秒）")
+
+    def _await_provider(self, token, state):
+        """熔断打开时等待服务商恢复，期间进度显示为暂停"""
+        if self.breaker is None or not self.breaker.is_open:
+            return
+        progress = state.get('progress')
+        self.breaker.wait(token, self.backend.probe, progress.set_paused if progress is not None else None)
+
+    def _outage(self, error, token, state):
+        """记录可重试的失败；熔断已打开时等服务商恢复，返回True表示已等到恢复、可以重发"""
+        if self.breaker is None or not error.retryable or token.cancelled:
+            return False
+        self.breaker.record_failure(str(error))
+        if not self.breaker.is_open:
+            return False
+        self._pause_timer(state)  # 等待恢复期间不计超时
+        try:
+            self._await_provider(token, state)
+        finally:
+            self._resume_timer(state)
+        return True
+
+    def _call(self, text, options, token, metrics):
+        """调用后端；启用对冲时记录耗时，样本足够时改为可对冲的调用"""
+        delay = self.hedge.delay() if self.hedge is not None else None
+        if delay is None:
+            start = time.perf_counter()
+            result = self.backend.synthesize(text, options, token)
+            if self.hedge is not None:
+                self.hedge.observe(time.perf_counter() - start)
+            return result
+        return self._hedged_call(text, options, token, metrics, delay)
+
+    def _hedged_call(self, text, options, token, metrics, delay):
+        # 原请求就在当前工作线程中执行；delay秒后仍未返回时，由共用的定时线程经executor.try_submit
+        # 发出对冲请求，只使用空闲的工作线程、不排队，执行器满载时不对冲。
+        # 对冲先返回时取消原请求，但要等原请求真正返回后工作线程才结束，
+        # 输掉的对冲请求也占着执行器名额直到返回，实际同时进行的请求不会超过max_workers
+        api_key = getattr(self.backend, 'api_key', '')
+        lock = threading.Lock()
+        state = {'closed': False, 'winner': None, 'error': None, 'won_at': None, 'cancel': None}
+        hedge_done = threading.Event()
+        primary_token = CancelToken()
+
+        def attempt(hedge_token, window):
+            committed = False
+            try:
+                self._pace(hedge_token)
+                started = time.perf_counter()
+                result = self.backend.synthesize(text, options, hedge_token)
+                self.hedge.observe(time.perf_counter() - started)
+                if window is not None:
+                    self._settle((api_key, metrics.chars, window), metrics.job, True)
+                    committed = True
+                with lock:
+                    if state['winner'] is None:
+                        state['winner'], state['won_at'] = result, time.perf_counter()
+                        primary_token.cancel()
+            except Exception as e:
+                state['error'] = e
+            finally:
+                # 对冲任务结束时归还名额，未提交的配额退回
+                self._release_hedge(api_key, metrics.chars, None if committed else window)
+                hedge_done.set()
+
+        def launch():
+            with lock:
+                if state['closed']:
+                    return
+            window = self._reserve_hedge(api_key, metrics.chars)
+            if window is False:
+                return
+            submitted = self.executor.try_submit(attempt, window)
+            if submitted is None:
+                self._release_hedge(api_key, metrics.chars, window, launched=False)
+                return
+            hedge_token = submitted[1]
+            metrics.hedged = True
+            with lock:
+                if not state['closed']:
+                    state['cancel'] = hedge_token.cancel
+                    token.on_cancel(hedge_token.cancel)
+                    return
+            hedge_token.cancel()  # 原请求已经结束
+
+        token.on_cancel(primary_token.cancel)
+        handle = self._hedge_timer.schedule(delay, launch)
+        start = time.perf_counter()
+        try:
+            try:
+                result, error = self.backend.synthesize(text, options, primary_token), None
+                self.hedge.observe(time.perf_counter() - start)
+            except Exception as e:
+                result, error = None, e
+            self._hedge_timer.cancel(handle)
+            with lock:
+                state['closed'] = True
+                hedge_cancel = state['cancel']
+                if error is None and state['winner'] is None:
+                    state['winner'] = result
+                    hedge_won = False
+                else:
+                    hedge_won = state['winner'] is not None
+            if hedge_won:
+                metrics.hedge_won = True
+                metrics.hedge_saved = self.hedge.estimate_saved(state['won_at'] - start)
+                return state['winner']
+            if hedge_cancel is not None:
+                if error is None:
+                    hedge_cancel()
+                    return result
+                # 原请求失败，等待进行中的对冲请求
+                while not hedge_done.wait(0.2):
+                    token.raise_if_cancelled()
+                if state['winner'] is not None:
+                    metrics.hedge_won = True
+                    metrics.hedge_saved = self.hedge.estimate_saved(state['won_at'] - start)
+                    return state['winner']
+            if error is not None:
+                raise error
+            return result
+        finally:
+            self._hedge_timer.cancel(handle)
+            token.remove_callback(primary_token.cancel)
+            with lock:
+                state['closed'] = True
+                hedge_cancel = state['cancel']
+            if hedge_cancel is not None:
+                token.remove_callback(hedge_cancel)
+
+    def _reserve_hedge(self, api_key, chars):
+        """占用对冲预算并预占配额，不能对冲时返回False，否则返回配额窗口（未启用配额时为None）"""
+        window = None
+        if self.quota is not None:
+            window = self.quota.try_acquire(api_key, chars)
+            if window is None:
+                return False
+        if not self.hedge.acquire():
+            if window is not None:
+                self.quota.refund(api_key, chars, window)
+            return False
+        return window
+
+    def _release_hedge(self, api_key, chars, window, launched=True):
+        """对冲请求结束或未能发出：归还对冲名额，退回未使用的配额"""
+        self.hedge.release(launched)
+        if window is not None:
+            self.quota.refund(api_key, chars, window)
+
+    def _record_cached(self, job, index):
+        metrics = RequestMetrics(job, self.backend.name, index)
+        metrics.cached = True
+        metrics.ok = True
+        self.metrics.record(metrics)
+
+    def _pace(self, token):
+        """按min_interval错开请求发起时间"""
+        if not self.min_interval:
+            return
+        with self._pace_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            token.wait(start - now)
+        token.raise_if_cancelled()
+
+    def _expire(self, running):
+        """放弃执行时间超过timeout的请求，返回被放弃的请求"""
+        if not self.timeout:
+            return []
+        now = time.monotonic()
+        expired = []
+        for index, state in list(running.items()):
+            # 工作线程可能刚暂停计时（配额、熔断等待）把开始时间清空，只读取一次
+            started = state.get('started')
+            if started is None:
+                continue
+            if now - started > self.timeout and not state['future'].done():
+                running.pop(index, None)
+                state['abandoned'] = True
+                self.executor.abandon(state['future'], state['token'], self.timeout)
+                expired.append(state)
+                if self.breaker is not None:
+                    self.breaker.record_failure(f"超时（{self.timeout}秒）")
+        return expired
+
+    def _emit(self, message):
+        if self._log:
+            self._log(message)
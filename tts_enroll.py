@@ -0,0 +1,214 @@
+"""声音复刻登记表：按参考音频内容指纹和目标模型去重，复刻任务异步执行
+
+同一段参考音频（无论文件名或URL是否相同）对同一模型只复刻一次，
+再次提交时直接返回已登记的Voice ID，不消耗复刻额度。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_audio import read_wav
+
+# 远程参考音频的下载上限，超过时只按已读取的部分计算指纹
+MAX_FETCH_BYTES = 50 * 1024 * 1024
+
+
+def audio_fingerprint(source, timeout=30):
+    """参考音频的内容指纹（sha256）
+
+    本地文件直接读取，URL下载后计算。WAV只对采样格式和PCM数据计算，
+    因此仅附加元数据不同的同一段录音得到相同的指纹。
+    """
+    if os.path.exists(source):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        import urllib.request
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            data = response.read(MAX_FETCH_BYTES)
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        try:
+            pcm, rate, channels, width = read_wav(data)
+            data = f"{rate},{channels},{width}:".encode() + pcm
+        except Exception:
+            pass  # 非PCM编码的WAV按原始字节计算
+    return hashlib.sha256(data).hexdigest()
+
+
+class EnrollmentRegistry:
+    """持久化的复刻登记表：(模型, 指纹) -> Voice ID"""
+
+    def __init__(self, path="voice_registry.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @staticmethod
+    def key(model, fingerprint):
+        return f"{model}:{fingerprint}"
+
+    def lookup(self, model, fingerprint):
+        """返回已登记的条目，没有时返回None"""
+        with self._lock:
+            entry = self._entries.get(self.key(model, fingerprint))
+            return dict(entry) if entry else None
+
+    def record(self, model, fingerprint, voice_id, source="", name=""):
+        """登记一次成功的复刻"""
+        entry = {
+            "model": model,
+            "fingerprint": fingerprint,
+            "voice_id": voice_id,
+            "source": source,
+            "name": name,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            self._entries[self.key(model, fingerprint)] = entry
+            self._save()
+        return entry
+
+    def forget_voice(self, voice_id):
+        """删除某个Voice ID的登记（音色被删除后，下次提交同一音频会重新复刻）"""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e.get("voice_id") == voice_id]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self._save()
+        return len(keys)
+
+    def entries(self):
+        with self._lock:
+            return [dict(e) for e in self._entries.values()]
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+class EnrollmentJob:
+    """一次复刻请求及其状态"""
+
+    # 状态：fingerprinting -> reused / enrolling -> done / failed
+    def __init__(self, source, model, prefix, name):
+        self.source = source
+        self.model = model
+        self.prefix = prefix
+        self.name = name
+        self.status = "fingerprinting"
+        self.fingerprint = None
+        self.voice_id = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.elapsed = None
+
+    @property
+    def finished(self):
+        return self.status in ("reused", "done", "failed")
+
+
+class EnrollmentManager:
+    """异步执行复刻任务
+
+    指纹计算和登记表查询在独立线程中进行，命中时立即回调；
+    未命中的任务进入有界线程池执行复刻。同一(模型, 指纹)正在复刻时，
+    后提交的任务等待并共享其结果，不重复复刻。
+    enroll(model, prefix, source)执行实际复刻并返回Voice ID；
+    on_status(job)在每次状态变化时于工作线程中回调。
+    """
+
+    def __init__(self, registry, enroll, max_workers=1, on_status=None, log=None):
+        self.registry = registry
+        self._enroll = enroll
+        self._on_status = on_status
+        self._log = log
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-enroll")
+        self._lock = threading.Lock()
+        self._inflight = {}  # registry key -> [jobs]
+        self._jobs = []
+
+    def submit(self, source, model, prefix, name=""):
+        """提交复刻请求，立即返回EnrollmentJob"""
+        job = EnrollmentJob(source, model, prefix, name)
+        with self._lock:
+            self._jobs.append(job)
+        threading.Thread(target=self._prepare, args=(job,), name="tts-enroll-fingerprint", daemon=True).start()
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def summary(self):
+        """按状态统计任务数"""
+        counts = {}
+        for job in self.jobs():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _prepare(self, job):
+        try:
+            job.fingerprint = audio_fingerprint(job.source)
+        except Exception as e:
+            self._set_status(job, "failed", error=f"读取参考音频失败: {e}")
+            return
+        key = self.registry.key(job.model, job.fingerprint)
+        with self._lock:
+            # 复刻完成时先登记再移出进行中列表，因此在锁内查询不会漏掉刚完成的结果
+            entry = self.registry.lookup(job.model, job.fingerprint)
+            waiting = self._inflight.get(key)
+            if entry is None and waiting is not None:
+                waiting.append(job)  # 同一音频正在复刻，等待其结果
+                return
+            if entry is None:
+                self._inflight[key] = [job]
+        if entry is not None:
+            self._set_status(job, "reused", voice_id=entry["voice_id"])
+            return
+        self._set_status(job, "enrolling")
+        self._executor.submit(self._run, key, job)
+
+    def _run(self, key, job):
+        try:
+            voice_id = self._enroll(job.model, job.prefix, job.source)
+            self.registry.record(job.model, job.fingerprint, voice_id, job.source, job.name)
+            result = {"status": "done", "voice_id": voice_id}
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        with self._lock:
+            jobs = self._inflight.pop(key, [job])
+        for waiting in jobs:
+            status = result["status"]
+            if waiting is not job and status == "done":
+                status = "reused"
+            self._set_status(waiting, status, voice_id=result.get("voice_id"), error=result.get("error"))
+
+    def _set_status(self, job, status, voice_id=None, error=None):
+        job.status = status
+        if voice_id is not None:
+            job.voice_id = voice_id
+        if error is not None:
+            job.error = error
+        if job.finished:
+            job.elapsed = time.monotonic() - job.submitted
+        if self._on_status:
+            try:
+                self._on_status(job)
+            except Exception as e:
+                if self._log:
+                    self._log(f"复刻状态回调出错: {e}")
@@ -0,0 +1,184 @@
+"""语音合成任务执行器：有界并发、可取消、超时放弃计数"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class SynthesisCancelled(Exception):
+    """合成任务已被取消"""
+
+
+class SynthesisTimeout(Exception):
+    """合成任务超时"""
+
+
+class CancelToken:
+    """取消令牌，任务通过它登记取消回调（例如中断连接）"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def on_cancel(self, callback):
+        """登记取消回调，若已取消则立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._invoke(callback)
+
+    def remove_callback(self, callback):
+        """注销尚未执行的取消回调（回调引用的资源归还之后调用）"""
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    def cancel(self):
+        """取消任务并执行所有已登记的回调"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._invoke(callback)
+
+    def raise_if_cancelled(self):
+        """已取消时抛出SynthesisCancelled，供任务在检查点调用"""
+        if self._event.is_set():
+            raise SynthesisCancelled("合成任务已取消")
+
+    def wait(self, timeout=None):
+        """等待取消信号，可用于可中断的休眠"""
+        return self._event.wait(timeout)
+
+    @staticmethod
+    def _invoke(callback):
+        try:
+            callback()
+        except Exception:
+            pass  # 取消回调失败不影响其他回调
+
+
+class SynthesisExecutor:
+    """固定线程数的合成执行器，替代每次调用新建线程再join超时的做法
+
+    超时的任务会收到取消信号；若任务已在运行无法立即停止，则记为"放弃"，
+    它仍占用一个工作线程直到结束，因此同时运行的调用数永远不超过max_workers。
+    try_submit只在有空闲工作线程时提交，用于不应排队的附加请求（如对冲请求）。
+    """
+
+    def __init__(self, max_workers=4, log=None, name="tts"):
+        self.max_workers = max_workers
+        self._log = log
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.abandoned = 0  # 超时后被放弃的调用总数
+        self.lingering = 0  # 已放弃但仍在运行的调用数
+        self.in_flight = 0
+        self.outstanding = 0  # 已提交未结束的任务数（含排队中的）
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，fn的第一个参数为CancelToken，返回(future, token)"""
+        with self._lock:
+            self.outstanding += 1
+        return self._submit(fn, args, kwargs)
+
+    def try_submit(self, fn, *args, **kwargs):
+        """有空闲工作线程时提交任务并返回(future, token)，否则不排队，返回None"""
+        with self._lock:
+            if self.outstanding >= self.max_workers:
+                return None
+            self.outstanding += 1
+        return self._submit(fn, args, kwargs)
+
+    def _submit(self, fn, args, kwargs):
+        token = CancelToken()
+        state = {"abandoned": False}
+
+        def task():
+            token.raise_if_cancelled()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                return fn(token, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    if state["abandoned"]:
+                        self.lingering -= 1
+                if state["abandoned"]:
+                    self._emit(f"已放弃的合成调用已结束，仍在运行 {self.lingering} 个")
+
+        future = self._pool.submit(task)
+        future._tts_state = state
+        future.add_done_callback(self._on_done)
+        return future, token
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """同步执行任务，超时则取消并抛出SynthesisTimeout"""
+        future, token = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self.abandon(future, token, timeout)
+            raise SynthesisTimeout(f"合成超时（{timeout}秒）")
+
+    def abandon(self, future, token, timeout=None):
+        """取消任务；已在运行的任务记为放弃"""
+        token.cancel()
+        if future.cancel():
+            return
+        with self._lock:
+            if future.done() or future._tts_state["abandoned"]:
+                return
+            future._tts_state["abandoned"] = True
+            self.abandoned += 1
+            self.lingering += 1
+            abandoned, lingering = self.abandoned, self.lingering
+        reason = f"超时（{timeout}秒）" if timeout is not None else "取消"
+        self._emit(f"合成调用{reason}已放弃，累计放弃 {abandoned} 次，仍在运行 {lingering} 个")
+
+    def stats(self):
+        """返回执行器计数快照"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "in_flight": self.in_flight,
+                "outstanding": self.outstanding,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "abandoned": self.abandoned,
+                "lingering": self.lingering,
+            }
+
+    def shutdown(self, wait=False):
+        """关闭执行器，未开始的任务直接取消"""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _on_done(self, future):
+        with self._lock:
+            self.outstanding -= 1
+            if future.cancelled():
+                self.cancelled += 1
+            elif future.exception() is not None:
+                if isinstance(future.exception(), SynthesisCancelled):
+                    self.cancelled += 1
+                else:
+                    self.failed += 1
+            else:
+                self.completed += 1
+
+    def _emit(self, message):
+        if self._log:
+            self._log(message)
@@ -0,0 +1,154 @@
+"""对冲请求：单次请求耗时超过近期延迟的高分位时再发一个相同的请求，先返回的结果为准
+
+慢请求（长尾）决定了整个字幕任务的完成时间。对冲请求按近期成功请求的延迟分布自适应地
+决定等待多久，额外请求数受budget限制（占普通请求的比例），不会成倍放大服务商的负载和计费。
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+from tts_metrics import percentile
+
+
+class HedgePolicy:
+    """对冲策略与统计
+
+    percentile为触发对冲的延迟分位数，近期样本不足min_samples个时不对冲；
+    触发等待时间不短于min_delay秒。budget为对冲请求占普通请求的比例上限，
+    另有burst个请求的余量，刚开始统计时也能对冲；同时进行的对冲请求不超过max_in_flight个。
+    """
+
+    def __init__(self, percentile=95, budget=0.05, min_samples=20, min_delay=0.2, burst=2, window=200,
+                 enabled=True, max_in_flight=2):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._samples = deque(maxlen=window)  # 近期成功请求的耗时（秒）
+        self._lock = threading.Lock()
+        self.requests = 0  # 计入预算的普通请求数
+        self.hedged = 0
+        self.in_flight = 0
+        self.wins = 0  # 对冲请求先返回的次数
+        self.saved = 0.0  # 估算节省的长尾耗时（秒）
+
+    def configure(self, config):
+        """从应用配置读取参数（hedge、hedge_percentile、hedge_budget）"""
+        self.enabled = bool(config.get("hedge", False))
+        self.percentile = float(config.get("hedge_percentile", 95))
+        self.budget = float(config.get("hedge_budget", 0.05))
+
+    def config(self):
+        """写入应用配置的参数"""
+        return {"hedge": self.enabled, "hedge_percentile": self.percentile, "hedge_budget": self.budget}
+
+    def observe(self, seconds):
+        """记录一次成功请求的耗时"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def delay(self):
+        """本次请求触发对冲前的等待时间（秒），未启用或样本不足时返回None，并计入预算"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self.requests += 1
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return max(self.min_delay, percentile(ordered, self.percentile))
+
+    def acquire(self):
+        """预算内且同时进行的对冲请求未达上限时占用一次对冲额度"""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            if self.hedged >= self.budget * self.requests + self.burst:
+                return False
+            self.hedged += 1
+            self.in_flight += 1
+            return True
+
+    def release(self, launched=True):
+        """对冲请求结束；launched为False表示占用额度后未能发出，额度退回"""
+        with self._lock:
+            self.in_flight -= 1
+            if not launched:
+                self.hedged -= 1
+
+    def estimate_saved(self, elapsed):
+        """对冲请求先返回时，估算原请求还需要多久：近期样本中超过elapsed的平均值减去elapsed
+
+        没有比elapsed更慢的样本时按0计，估算偏保守。
+        """
+        with self._lock:
+            slower = [s for s in self._samples if s > elapsed]
+        saved = sum(slower) / len(slower) - elapsed if slower else 0.0
+        with self._lock:
+            self.wins += 1
+            self.saved += saved
+        return saved
+
+    def stats(self):
+        """返回对冲计数快照"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "in_flight": self.in_flight,
+                "wins": self.wins,
+                "saved_s": round(self.saved, 3),
+                "samples": len(self._samples),
+            }
+
+
+class HedgeTimer:
+    """在一个共用的后台线程中按时触发对冲回调，不为每个请求各建定时线程
+
+    schedule()返回的句柄可交给cancel()撤销；回调应当很快返回（只负责发出对冲请求）。
+    """
+
+    def __init__(self, name="tts-hedge-timer"):
+        self.name = name
+        self._cond = threading.Condition()
+        self._heap = []  # (触发时间, 句柄)
+        self._callbacks = {}  # 句柄 -> 回调，撤销后删除
+        self._ids = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        """delay秒后调用callback()，返回句柄"""
+        with self._cond:
+            handle = next(self._ids)
+            self._callbacks[handle] = callback
+            heapq.heappush(self._heap, (time.monotonic() + delay, handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return handle
+
+    def cancel(self, handle):
+        """撤销尚未触发的回调"""
+        with self._cond:
+            self._callbacks.pop(handle, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._heap[0][1] not in self._callbacks:
+                        heapq.heappop(self._heap)  # 已撤销
+                    if self._heap and self._heap[0][0] <= time.monotonic():
+                        callback = self._callbacks.pop(heapq.heappop(self._heap)[1])
+                        break
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+            try:
+                callback()
+            except Exception:
+                pass  # 对冲只是优化，发出失败时原请求照常进行
@@ -0,0 +1,116 @@
+"""线程安全的批量日志管道
+
+任意线程都可以调用write()；消息先进入有界队列，由Tk主线程按固定间隔
+一次性插入日志控件，避免每条消息各占一个事件回调。最近的消息同时保存在
+内存环形缓冲区中，可选写入滚动日志文件。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+
+class LogSink:
+    """日志管道：收集、批量刷新到Text控件、环形缓冲、可选滚动文件"""
+
+    def __init__(self, root, capacity=5000, flush_interval=100, max_widget_lines=1000,
+                 log_file=None, max_bytes=5 * 1024 * 1024, backup_count=3):
+        self.root = root
+        self.flush_interval = flush_interval  # 毫秒
+        self.max_widget_lines = max_widget_lines
+        self.buffer = deque(maxlen=capacity)  # 最近的日志，供查看或导出
+        self._pending = deque()
+        self._max_pending = capacity
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._widget = None
+        self._auto_scroll = None
+        self._widget_lines = 0
+        self._scheduled = False
+        self._file_logger = None
+        if log_file:
+            self._file_logger = logging.getLogger(f"tts.{id(self)}")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._file_logger.addHandler(handler)
+
+    def attach(self, widget, auto_scroll=None):
+        """绑定日志控件；auto_scroll为返回是否自动滚动的函数"""
+        self._widget = widget
+        self._auto_scroll = auto_scroll
+        self._widget_lines = 0
+        self._schedule()
+
+    def write(self, message):
+        """记录一条日志（可在任意线程调用）"""
+        line = f"[{time.strftime('%H:%M:%S')}] {message}"
+        with self._lock:
+            self.buffer.append(line)
+            if len(self._pending) >= self._max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+            self._pending.append(line)
+        if self._file_logger:
+            self._file_logger.info(message)
+
+    def lines(self):
+        """返回环形缓冲区中的日志快照"""
+        with self._lock:
+            return list(self.buffer)
+
+    def clear(self):
+        """清空日志控件（环形缓冲区保留）"""
+        if self._widget is None:
+            return
+        self._widget.config(state="normal")
+        self._widget.delete("1.0", "end")
+        self._widget.config(state="disabled")
+        self._widget_lines = 0
+
+    def flush(self):
+        """把待显示的日志一次性写入控件（须在Tk主线程调用）"""
+        with self._lock:
+            if not self._pending or self._widget is None:
+                return
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            lines.insert(0, f"[{time.strftime('%H:%M:%S')}] ……已省略 {dropped} 条日志")
+        if len(lines) > self.max_widget_lines:
+            lines = lines[-self.max_widget_lines:]
+
+        widget = self._widget
+        widget.config(state="normal")
+        widget.insert("end", "\n".join(lines) + "\n")
+        self._widget_lines += len(lines)
+        excess = self._widget_lines - self.max_widget_lines
+        if excess > 0:
+            widget.delete("1.0", f"{excess + 1}.0")
+            self._widget_lines -= excess
+        if self._auto_scroll is None or self._auto_scroll():
+            widget.see("end")
+        widget.config(state="disabled")
+
+    def close(self):
+        if self._file_logger:
+            for handler in list(self._file_logger.handlers):
+                handler.close()
+                self._file_logger.removeHandler(handler)
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        self._scheduled = True
+        self.root.after(self.flush_interval, self._tick)
+
+    def _tick(self):
+        try:
+            self.flush()
+        finally:
+            self._scheduled = False
+            self._schedule()
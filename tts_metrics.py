@@ -0,0 +1,290 @@
+"""请求级计时指标：采集、按任务汇总，导出为JSON Lines和Prometheus文本格式"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 各阶段耗时字段（秒）
+PHASES = ("queue_wait", "connect", "ttfb", "total", "decode")
+
+
+class RequestMetrics:
+    """单次请求的计时与结果"""
+
+    def __init__(self, job, backend, item=None):
+        self.job = job
+        self.backend = backend
+        self.item = item  # 任务内的序号（字幕序号或段落序号）
+        self.timestamp = time.time()
+        self.queue_wait = 0.0
+        self.connect = 0.0
+        self.ttfb = 0.0
+        self.total = 0.0
+        self.decode = 0.0
+        self.payload_bytes = 0
+        self.chars = 0  # 计费字符数（命中缓存时为0）
+        self.retries = 0
+        self.hedged = False  # 是否发出了对冲请求
+        self.hedge_won = False  # 对冲请求先返回
+        self.hedge_saved = 0.0  # 估算节省的耗时（秒）
+        self.cached = False
+        self.ok = False
+        self.error = None
+
+    def update_timings(self, timings):
+        """合并后端上报的连接、首字节、解码耗时和数据量"""
+        for key in ("connect", "ttfb", "decode"):
+            if timings.get(key) is not None:
+                setattr(self, key, timings[key])
+        if timings.get("payload_bytes") is not None:
+            self.payload_bytes = timings["payload_bytes"]
+
+    def to_dict(self):
+        return {
+            "type": "request",
+            "job": self.job,
+            "backend": self.backend,
+            "item": self.item,
+            "timestamp": round(self.timestamp, 3),
+            "queue_wait_ms": round(self.queue_wait * 1000, 2),
+            "connect_ms": round(self.connect * 1000, 2),
+            "ttfb_ms": round(self.ttfb * 1000, 2),
+            "total_ms": round(self.total * 1000, 2),
+            "decode_ms": round(self.decode * 1000, 2),
+            "payload_bytes": self.payload_bytes,
+            "chars": self.chars,
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedge_won": self.hedge_won,
+            "hedge_saved_ms": round(self.hedge_saved * 1000, 2),
+            "cached": self.cached,
+            "ok": self.ok,
+            "error": self.error,
+        }
+
+
+def percentile(ordered, pct):
+    """最近秩法求已排序序列的百分位数，空序列返回0"""
+    if not ordered:
+        return 0.0
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# 按服务商累计的计数器：(Prometheus指标名, 字段, 说明)
+_COUNTERS = (
+    ("tts_cached_total", "cached", "命中缓存的请求数"),
+    ("tts_retries_total", "retries", "重试次数"),
+    ("tts_payload_bytes_total", "payload_bytes", "返回音频字节数"),
+    ("tts_chars_total", "chars", "计费字符数"),
+    ("tts_hedged_total", "hedged", "发出对冲请求的请求数"),
+    ("tts_hedge_wins_total", "hedge_wins", "对冲请求先返回的次数"),
+    ("tts_hedge_saved_seconds_total", "hedge_saved_s", "对冲估算节省的长尾耗时（秒）"),
+)
+
+
+class MetricsCollector:
+    """线程安全的指标收集器，只保留最近max_jobs个任务的明细
+
+    另按服务商累计各计数（不随任务明细淘汰而减少），Prometheus导出只用服务商作标签，
+    时间序列数不随任务数增长。
+    """
+
+    def __init__(self, max_jobs=20):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # job -> {"started", "finished", "requests"}
+        self._totals = {}  # backend -> 累计计数
+        self._lock = threading.Lock()
+
+    def begin_job(self, job):
+        """开始一个新任务"""
+        with self._lock:
+            self._jobs[job] = {"started": time.time(), "finished": None, "requests": [], "info": {}}
+            self._jobs.move_to_end(job)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def end_job(self, job):
+        with self._lock:
+            if job in self._jobs:
+                self._jobs[job]["finished"] = time.time()
+
+    def annotate(self, job, **info):
+        """记录任务级信息（如去重前后的条目数），汇总时一并输出"""
+        with self._lock:
+            entry = self._jobs.get(job)
+            if entry is not None:
+                entry["info"].update(info)
+
+    def record(self, metrics):
+        with self._lock:
+            entry = self._jobs.get(metrics.job)
+            if entry is None:
+                entry = {"started": metrics.timestamp, "finished": None, "requests": [], "info": {}}
+                self._jobs[metrics.job] = entry
+            entry["requests"].append(metrics)
+            totals = self._totals.get(metrics.backend)
+            if totals is None:
+                totals = self._totals[metrics.backend] = dict.fromkeys(
+                    ["ok", "failed"] + [key for _, key, _ in _COUNTERS], 0)
+                totals["seconds"] = {phase: [0.0, 0] for phase in PHASES}  # 阶段 -> [耗时总和, 请求数]
+            totals["ok" if metrics.ok else "failed"] += 1
+            totals["cached"] += int(metrics.cached)
+            totals["retries"] += metrics.retries
+            totals["hedged"] += int(metrics.hedged)
+            totals["hedge_wins"] += int(metrics.hedge_won)
+            totals["hedge_saved_s"] += metrics.hedge_saved
+            if metrics.ok:
+                totals["payload_bytes"] += metrics.payload_bytes
+                totals["chars"] += metrics.chars
+                if not metrics.cached:
+                    for phase in PHASES:
+                        totals["seconds"][phase][0] += getattr(metrics, phase)
+                        totals["seconds"][phase][1] += 1
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def rollup(self, job):
+        """按任务汇总：请求数、成功率、各阶段p50/p99/平均值、吞吐量"""
+        with self._lock:
+            entry = self._jobs.get(job)
+            if entry is None:
+                return None
+            requests = list(entry["requests"])
+            started, finished = entry["started"], entry["finished"]
+            info = dict(entry["info"])
+
+        wall = (finished or time.time()) - started
+        ok = [m for m in requests if m.ok]
+        network = [m for m in ok if not m.cached]
+        summary = {
+            "type": "job",
+            "job": job,
+            "backend": requests[0].backend if requests else None,
+            "requests": len(requests),
+            "ok": len(ok),
+            "failed": len(requests) - len(ok),
+            "cached": sum(1 for m in requests if m.cached),
+            "retries": sum(m.retries for m in requests),
+            "payload_bytes": sum(m.payload_bytes for m in ok),
+            "chars": sum(m.chars for m in ok),
+            "hedged": sum(1 for m in requests if m.hedged),
+            "hedge_wins": sum(1 for m in requests if m.hedge_won),
+            "hedge_saved_s": round(sum(m.hedge_saved for m in requests), 3),
+            "wall_s": round(wall, 3),
+            "throughput_rps": round(len(ok) / wall, 2) if wall > 0 else 0.0,
+        }
+        if info.get("items"):
+            summary["items"] = info["items"]
+            summary["unique"] = info["unique"]
+            summary["dedup_ratio"] = round(1 - info["unique"] / info["items"], 4)
+        for phase in PHASES:
+            values = sorted(getattr(m, phase) for m in network)
+            summary[f"{phase}_p50_ms"] = round(percentile(values, 50) * 1000, 2)
+            summary[f"{phase}_p99_ms"] = round(percentile(values, 99) * 1000, 2)
+            summary[f"{phase}_mean_ms"] = round(sum(values) / len(values) * 1000, 2) if values else 0.0
+        return summary
+
+    def to_jsonl(self, job=None):
+        """导出为JSON Lines：每个请求一行，随后是任务汇总行"""
+        lines = []
+        for name in ([job] if job else self.jobs()):
+            with self._lock:
+                requests = list(self._jobs.get(name, {}).get("requests", []))
+            lines.extend(json.dumps(m.to_dict(), ensure_ascii=False) for m in requests)
+            rollup = self.rollup(name)
+            if rollup:
+                lines.append(json.dumps(rollup, ensure_ascii=False))
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def to_prometheus(self):
+        """导出为Prometheus文本格式，按服务商（backend标签）汇总
+
+        计数器和耗时总和为进程启动以来的累计值；耗时分位数和任务级的吞吐量、去重比例
+        取自保留明细的最近任务。
+        """
+        with self._lock:
+            totals = {backend: dict(t, seconds={phase: list(v) for phase, v in t["seconds"].items()})
+                      for backend, t in self._totals.items()}
+            recent = {}  # backend -> 最近任务中成功且未命中缓存的请求
+            for entry in self._jobs.values():
+                for m in entry["requests"]:
+                    if m.ok and not m.cached:
+                        recent.setdefault(m.backend, []).append(m)
+        latest = {}  # backend -> 最近一个任务的汇总
+        for name in reversed(self.jobs()):
+            summary = self.rollup(name)
+            if summary and summary["backend"] is not None:
+                latest.setdefault(summary["backend"], summary)
+
+        out = [
+            "# HELP tts_requests_total 合成请求数",
+            "# TYPE tts_requests_total counter",
+        ]
+        for backend, t in totals.items():
+            label = f'backend="{_escape_label(backend)}"'
+            out.append(f'tts_requests_total{{{label},status="ok"}} {t["ok"]}')
+            out.append(f'tts_requests_total{{{label},status="failed"}} {t["failed"]}')
+        for metric, key, help_text in _COUNTERS:
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} counter")
+            for backend, t in totals.items():
+                value = round(t[key], 3) if isinstance(t[key], float) else t[key]
+                out.append(f'{metric}{{backend="{_escape_label(backend)}"}} {value}')
+        for metric, key, help_text in (
+            ("tts_job_throughput_rps", "throughput_rps", "最近一个任务的吞吐量（请求/秒）"),
+            ("tts_job_dedup_ratio", "dedup_ratio", "最近一个任务去重合并的条目比例"),
+        ):
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} gauge")
+            for backend, summary in latest.items():
+                if key in summary:
+                    out.append(f'{metric}{{backend="{_escape_label(backend)}"}} {summary[key]}')
+        out.append("# HELP tts_request_seconds 请求各阶段耗时")
+        out.append("# TYPE tts_request_seconds summary")
+        for backend, t in totals.items():
+            label = f'backend="{_escape_label(backend)}"'
+            requests = recent.get(backend, [])
+            for phase in PHASES:
+                values = sorted(getattr(m, phase) for m in requests)
+                for quantile in (0.5, 0.99):
+                    value = percentile(values, quantile * 100)
+                    out.append(f'tts_request_seconds{{{label},phase="{phase}",quantile="{quantile}"}} {value:.6f}')
+                total, count = t["seconds"][phase]
+                out.append(f'tts_request_seconds_sum{{{label},phase="{phase}"}} {total:.6f}')
+                out.append(f'tts_request_seconds_count{{{label},phase="{phase}"}} {count}')
+        return "\n".join(out) + "\n"
+
+    def export(self, path):
+        """导出到path（JSON Lines），同名.prom文件写入Prometheus格式"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+        prom_path = os.path.splitext(path)[0] + ".prom"
+        with open(prom_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        return prom_path
+
+
+def format_rollup(summary):
+    """把任务汇总格式化为一行日志"""
+    dedup = ""
+    if "dedup_ratio" in summary:
+        dedup = f"去重 {summary['items']}→{summary['unique']} 条（{summary['dedup_ratio']:.0%}），"
+    hedge = ""
+    if summary.get("hedged"):
+        hedge = (f"，对冲 {summary['hedged']} 次（先返回 {summary['hedge_wins']} 次，"
+                 f"估算节省 {summary['hedge_saved_s']:.2f} 秒）")
+    return (
+        f"任务汇总：{dedup}成功 {summary['ok']}/{summary['requests']}，缓存命中 {summary['cached']}，"
+        f"字符 {summary.get('chars', 0)}，"
+        f"重试 {summary['retries']} 次，吞吐 {summary['throughput_rps']} 条/秒，"
+        f"排队p50 {summary['queue_wait_p50_ms']}ms，首字节p50 {summary['ttfb_p50_ms']}ms，"
+        f"总耗时p50/p99 {summary['total_p50_ms']}/{summary['total_p99_ms']}ms{hedge}"
+    )
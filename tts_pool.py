@@ -0,0 +1,188 @@
+"""DashScope合成会话池：按(model, voice, 输出格式, API密钥)复用预热的SpeechSynthesizer"""
+import threading
+import time
+from collections import defaultdict
+
+
+class PooledSession:
+    """池中的一个合成会话"""
+
+    def __init__(self, key, synthesizer):
+        self.key = key
+        self.synthesizer = synthesizer
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.connect_time = 0.0  # 新建会话的耗时
+        self.uses = 0
+        self.healthy = True
+
+
+class SynthesizerPool:
+    """合成会话池
+
+    每个会话按顺序服务多个片段；空闲超时的会话由后台线程回收，
+    出错、被取消或未通过健康检查的会话直接丢弃，不再放回池中。
+    """
+
+    def __init__(self, factory, max_idle_per_key=4, idle_timeout=60.0, max_uses=500,
+                 health_check=None, log=None):
+        self._factory = factory  # factory(model, voice, audio_format) -> synthesizer
+        self.max_idle_per_key = max_idle_per_key
+        self.idle_timeout = idle_timeout
+        self.max_uses = max_uses
+        self._health_check = health_check
+        self._log = log
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reaper = None
+        self._stop = threading.Event()
+        self._local = threading.local()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.discarded = 0
+
+    def acquire(self, model, voice, audio_format=None, tenant=None):
+        """取出一个可用会话，没有空闲会话时新建；tenant（API密钥）不同的会话互不复用"""
+        key = (model, voice, audio_format, tenant)
+        self._ensure_reaper()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                session = idle.pop() if idle else None
+            if session is None:
+                break
+            if self._is_healthy(session):
+                with self._lock:
+                    self.reused += 1
+                return session
+            self._discard(session)
+
+        start = time.monotonic()
+        session = PooledSession(key, self._factory(model, voice, audio_format))
+        session.connect_time = time.monotonic() - start
+        with self._lock:
+            self.created += 1
+        return session
+
+    def release(self, session):
+        """归还会话；不健康或已达使用上限的会话直接关闭"""
+        session.uses += 1
+        session.last_used = time.monotonic()
+        if not session.healthy or session.uses >= self.max_uses:
+            self._discard(session)
+            return
+        with self._lock:
+            idle = self._idle[session.key]
+            if not self._closed and len(idle) < self.max_idle_per_key:
+                idle.append(session)
+                return
+        self._discard(session)
+
+    def run(self, model, voice, fn, token=None, audio_format=None, tenant=None):
+        """用池中会话执行fn(synthesizer)
+
+        复用的会话若调用失败，视为连接已失效，丢弃后在新会话上重试一次。
+        """
+        for attempt in range(2):
+            session = self.acquire(model, voice, audio_format, tenant)
+            reused = session.uses > 0
+            self._local.connect_time = 0.0 if reused else session.connect_time
+            try:
+                result = fn(session.synthesizer)
+            except Exception:
+                session.healthy = False
+                self.release(session)
+                if reused and attempt == 0 and not (token and token.cancelled):
+                    continue
+                raise
+            if token is not None and token.cancelled:
+                session.healthy = False  # 被中断的会话状态不可信
+            self.release(session)
+            return result
+
+    def last_connect_time(self):
+        """当前线程最近一次run新建会话的耗时，复用会话时为0"""
+        return getattr(self._local, 'connect_time', 0.0)
+
+    def evict_idle(self):
+        """回收空闲超时的会话"""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = [s for s in idle if s.last_used >= deadline]
+                expired.extend(s for s in idle if s.last_used < deadline)
+                idle[:] = keep
+            self.evicted += len(expired)
+        for session in expired:
+            self._close(session)
+        if expired and self._log:
+            self._log(f"已回收 {len(expired)} 个空闲合成会话")
+        return len(expired)
+
+    def clear(self):
+        """关闭所有空闲会话（例如API密钥变更后）"""
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+        for session in sessions:
+            self._close(session)
+
+    def close(self):
+        """关闭会话池"""
+        self._closed = True
+        self._stop.set()
+        self.clear()
+
+    def stats(self):
+        """返回会话池计数快照"""
+        with self._lock:
+            return {
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "discarded": self.discarded,
+            }
+
+    def _is_healthy(self, session):
+        if not session.healthy:
+            return False
+        if time.monotonic() - session.last_used > self.idle_timeout:
+            return False
+        if self._health_check is None:
+            return True
+        try:
+            return bool(self._health_check(session.synthesizer))
+        except Exception:
+            return False
+
+    def _discard(self, session):
+        with self._lock:
+            self.discarded += 1
+        self._close(session)
+
+    @staticmethod
+    def _close(session):
+        close = getattr(session.synthesizer, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+    def _ensure_reaper(self):
+        if self._reaper is not None or self.idle_timeout <= 0:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="tts-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(1.0, self.idle_timeout / 2)
+        while not self._stop.wait(interval):
+            self.evict_idle()
@@ -0,0 +1,213 @@
+"""字幕音频后处理：首尾静音裁剪、响度归一化与淡入淡出
+
+各条字幕的音频在拼接到时间轴之前批量处理：所有条目拼成一个数组，
+用NumPy一次性计算每条的有效区间、响度和包络，不逐条循环。
+只处理16位单声道PCM/WAV；MP3和Opus需要解码，原样保留。
+未安装NumPy时后处理不可用，合成结果原样使用。
+"""
+from tts_audio import encoding_label, pcm_to_wav, read_wav
+from tts_backend import SynthesisResult
+
+# 可处理的编码
+PCM_ENCODINGS = ("pcm", "wav")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def available():
+    """是否安装了NumPy"""
+    return _numpy() is not None
+
+
+def supported(encoding):
+    """该编码的结果能否做后处理"""
+    return encoding in PCM_ENCODINGS
+
+
+def skip_reason(encoding):
+    """不能做后处理的原因，可以处理时返回None"""
+    if not supported(encoding):
+        return f"{encoding_label(encoding)}格式需要解码，跳过音频后处理（输出WAV或PCM时可用）"
+    if not available():
+        return "未安装NumPy，跳过音频后处理"
+    return None
+
+
+class PostProcessor:
+    """批量后处理
+
+    trim_db为静音阈值（dBFS，按window_ms滑动窗口的RMS判断），首尾低于阈值的部分被裁掉，
+    两端各保留pad_ms；target_dbfs为归一化后的RMS响度（None表示不归一化），
+    增益限制在±max_gain_db以内且不超过峰值余量；fade_ms为首尾淡入淡出时长。
+    """
+
+    def __init__(self, trim_db=-45.0, target_dbfs=-20.0, fade_ms=10, pad_ms=30, window_ms=10,
+                 max_gain_db=20.0, peak=0.97, batch_samples=4 * 1024 * 1024, enabled=True):
+        self.enabled = enabled
+        self.trim_db = trim_db
+        self.target_dbfs = target_dbfs
+        self.fade_ms = fade_ms
+        self.pad_ms = pad_ms
+        self.window_ms = window_ms
+        self.max_gain_db = max_gain_db
+        self.peak = peak
+        self.batch_samples = batch_samples  # 每批的采样点数上限，限制临时数组的内存
+        self._notified = set()  # 已提示过的跳过原因
+
+    def configure(self, config):
+        """从应用配置读取参数（postprocess、trim_db、target_dbfs、fade_ms）"""
+        self.enabled = bool(config.get("postprocess", True))
+        self.trim_db = float(config.get("trim_db", -45.0))
+        target = config.get("target_dbfs", -20.0)
+        self.target_dbfs = None if target is None else float(target)
+        self.fade_ms = int(config.get("fade_ms", 10))
+
+    def should_process(self, encoding, log=None):
+        """启用且该编码可以处理时返回True
+
+        不能处理时（如MP3输出、未安装NumPy）把原因传给log，同一原因只提示一次，不在每个任务重复。
+        """
+        if not self.enabled:
+            return False
+        reason = skip_reason(encoding)
+        if reason is None:
+            return True
+        if log is not None and reason not in self._notified:
+            self._notified.add(reason)
+            log(reason)
+        return False
+
+    def config(self):
+        """写入应用配置的参数"""
+        return {"postprocess": self.enabled, "trim_db": self.trim_db, "target_dbfs": self.target_dbfs,
+                "fade_ms": self.fade_ms}
+
+    def process_pcm(self, buffers, sample_rate):
+        """处理同一采样率的多段16位单声道PCM，返回处理后的PCM列表"""
+        np = _numpy()
+        if np is None:
+            return list(buffers)
+        outputs = []
+        batch, size = [], 0
+        for buffer in buffers:
+            if batch and size + len(buffer) // 2 > self.batch_samples:
+                outputs.extend(self._process_batch(np, batch, sample_rate))
+                batch, size = [], 0
+            batch.append(buffer)
+            size += len(buffer) // 2
+        if batch:
+            outputs.extend(self._process_batch(np, batch, sample_rate))
+        return outputs
+
+    def _process_batch(self, np, buffers, sample_rate):
+        count = len(buffers)
+        frame = max(1, sample_rate * self.window_ms // 1000)
+        pad_frames = -(-sample_rate * self.pad_ms // 1000 // frame)
+        fade = sample_rate * self.fade_ms // 1000
+
+        # 每段末尾补零到整帧，拼成(帧数, 帧长)的矩阵，帧不会跨段
+        lengths = np.array([len(b) // 2 for b in buffers], dtype=np.int64)
+        frames = -(-lengths // frame)
+        data = b''.join(b[:n * 2] + bytes((f * frame - n) * 2)
+                        for b, n, f in zip(buffers, lengths.tolist(), frames.tolist()))
+        x = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        x /= 32768.0
+        shaped = x.reshape(-1, frame)
+        frame_starts = np.concatenate(([0], np.cumsum(frames)[:-1])).astype(np.int64)
+        frame_ends = frame_starts + frames
+        ends = frame_starts * frame + lengths
+
+        # 每帧能量，RMS超过阈值的帧为有声帧
+        energy = np.einsum("ij,ij->i", shaped, shaped, dtype=np.float64)
+        loud = np.flatnonzero(energy > 10 ** (self.trim_db / 10.0) * frame)
+
+        # 每段第一个和最后一个有声帧，两端各留pad；整段静音时保持原样
+        first_pos = np.searchsorted(loud, frame_starts)
+        last_pos = np.searchsorted(loud, frame_ends) - 1
+        voiced = first_pos <= last_pos
+        lookup = loud if len(loud) else np.zeros(1, dtype=np.int64)
+        first = lookup[np.clip(first_pos, 0, len(lookup) - 1)]
+        last = lookup[np.clip(last_pos, 0, len(lookup) - 1)]
+        keep_first = np.where(voiced, np.maximum(first - pad_frames, frame_starts), frame_starts)
+        keep_last = np.where(voiced, np.minimum(last + 1 + pad_frames, frame_ends), frame_ends)
+        keep_start = keep_first * frame
+        keep_end = np.minimum(keep_last * frame, ends)
+        kept = keep_end - keep_start
+
+        # 保留区间的RMS响度和峰值决定每段的增益，按帧原地相乘
+        if self.target_dbfs is not None and voiced.any():
+            total = np.concatenate(([0.0], np.cumsum(energy)))
+            power = (total[keep_last] - total[keep_first]) / np.maximum(kept, 1)
+            gain_db = np.clip(self.target_dbfs - 10 * np.log10(np.maximum(power, 1e-12)),
+                              -self.max_gain_db, self.max_gain_db)
+            frame_peak = np.maximum(shaped.max(axis=1), -shaped.min(axis=1))
+            peaks = np.zeros(count)
+            nonempty = np.flatnonzero(keep_last > keep_first)
+            # reduceat按相邻下标分区，区间之间有间隔，交错插入终点后取偶数项
+            bounds = np.empty(len(nonempty) * 2, dtype=np.int64)
+            bounds[0::2] = keep_first[nonempty]
+            bounds[1::2] = keep_last[nonempty]
+            peaks[nonempty] = np.maximum.reduceat(np.append(frame_peak, 0), bounds)[0::2]
+            limit = self.peak / np.maximum(peaks, 1e-12)
+            gains = np.where(voiced, np.minimum(10 ** (gain_db / 20.0), limit), 1.0)
+            shaped *= np.repeat(gains.astype(np.float32), frames)[:, None]
+
+        # 首尾淡入淡出：短于两倍淡入时长的段按各自一半长度处理
+        if fade > 0:
+            ramp = np.arange(fade)
+            mask = ramp[None, :] < (kept // 2)[:, None]
+            scale = np.broadcast_to((ramp / fade).astype(np.float32), mask.shape)[mask]
+            x[(keep_start[:, None] + ramp[None, :])[mask]] *= scale
+            x[(keep_end[:, None] - 1 - ramp[None, :])[mask]] *= scale
+
+        x *= 32767.0
+        np.rint(x, out=x)
+        np.clip(x, -32768, 32767, out=x)
+        out = x.astype("<i2")
+        return [out[start:end].tobytes() for start, end in zip(keep_start.tolist(), keep_end.tolist())]
+
+    def process_results(self, results):
+        """处理一组合成结果，返回对应的新结果列表
+
+        不可处理的编码、多声道或非16位的WAV原样返回；同一个结果对象（去重后共享）只处理一次。
+        """
+        processed = {}  # id(result) -> 新结果
+        batches = {}  # sample_rate -> [(result, pcm)]
+        for result in results:
+            if result is None or id(result) in processed or result.encoding not in PCM_ENCODINGS:
+                continue
+            processed[id(result)] = result
+            if result.encoding == "wav":
+                try:
+                    pcm, rate, channels, width = read_wav(result.audio)
+                except Exception:
+                    continue
+                if channels != 1 or width != 2:
+                    continue
+            else:
+                pcm, rate = result.audio, result.sample_rate
+            batches.setdefault(rate, []).append((result, pcm))
+
+        if batches and available():
+            for rate, items in batches.items():
+                outputs = self.process_pcm([pcm for _, pcm in items], rate)
+                for (result, _), pcm in zip(items, outputs):
+                    audio = pcm_to_wav(pcm, rate) if result.encoding == "wav" else pcm
+                    processed[id(result)] = SynthesisResult(audio, result.encoding, raw=result.raw,
+                                                            cached=result.cached, timings=result.timings,
+                                                            sample_rate=rate)
+        return [processed.get(id(result), result) if result is not None else None for result in results]
+
+    def process_segments(self, segments):
+        """处理synthesize_cues返回的[{'data', 'subtitle', 'result'}]，原地更新"""
+        results = self.process_results([segment['result'] for segment in segments])
+        for segment, result in zip(segments, results):
+            segment['result'] = result
+            segment['data'] = result.audio
+        return segments
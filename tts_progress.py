@@ -0,0 +1,126 @@
+"""任务进度模型与按固定帧率刷新的进度视图
+
+工作线程只更新ProgressModel中的计数（加锁、无界面操作），
+ProgressView在Tk主线程按固定帧率采样并刷新进度条，
+因此无论每秒完成多少条，界面事件队列的负载都是恒定的。
+"""
+import threading
+import time
+
+
+class ProgressModel:
+    """线程安全的任务进度计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.begin(0)
+
+    def begin(self, total):
+        """开始新任务"""
+        with self._lock:
+            self.total = total
+            self.completed = 0
+            self.failed = 0
+            self.skipped = 0
+            self.in_flight = 0
+            self.paused = None  # 暂停原因（如服务商熔断），None表示正常进行
+            self.started_at = time.monotonic()
+            self.finished_at = None
+
+    def request_started(self):
+        """一个请求开始执行"""
+        with self._lock:
+            self.in_flight += 1
+
+    def item_done(self, ok, started=False, skipped=False):
+        """一条完成（成功、失败或跳过）；started表示它曾计入进行中"""
+        with self._lock:
+            if started:
+                self.in_flight = max(0, self.in_flight - 1)
+            if skipped:
+                self.skipped += 1
+            elif ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def set_paused(self, reason):
+        """标记任务暂停（reason为原因）或恢复（None）"""
+        with self._lock:
+            self.paused = reason
+
+    def finish(self):
+        """任务结束"""
+        with self._lock:
+            self.in_flight = 0
+            self.paused = None
+            self.finished_at = time.monotonic()
+
+    def snapshot(self):
+        """返回当前进度，包含吞吐量（条/秒）与预计剩余时间（秒）"""
+        with self._lock:
+            done = self.completed + self.failed + self.skipped
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+            throughput = (self.completed + self.failed) / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, self.total - done)
+            eta = remaining / throughput if throughput > 0 else None
+            return {
+                "total": self.total,
+                "done": done,
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "in_flight": self.in_flight,
+                "paused": self.paused,
+                "elapsed": elapsed,
+                "throughput": throughput,
+                "eta": eta if self.finished_at is None else 0,
+            }
+
+
+def format_progress(snap):
+    """把进度快照格式化为状态文本"""
+    if snap["eta"] is None:
+        eta = "--:--"
+    else:
+        minutes, seconds = divmod(int(snap["eta"]), 60)
+        eta = f"{minutes:02d}:{seconds:02d}"
+    if snap.get("paused"):
+        return f"已暂停：{snap['paused']}  完成 {snap['completed']}/{snap['total']}  失败 {snap['failed']}"
+    return (f"完成 {snap['completed']}/{snap['total']}  失败 {snap['failed']}  "
+            f"进行中 {snap['in_flight']}  {snap['throughput']:.1f} 条/秒  剩余约 {eta}")
+
+
+class ProgressView:
+    """在Tk主线程按固定帧率采样进度模型，刷新进度条和状态标签"""
+
+    def __init__(self, root, model, progressbar, label=None, fps=10):
+        self.root = root
+        self.model = model
+        self.progressbar = progressbar
+        self.label = label
+        self.interval = max(1, int(1000 / fps))
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._tick()
+
+    def stop(self):
+        """停止采样并做最后一次刷新（须在Tk主线程调用）"""
+        self._running = False
+        self.refresh()
+
+    def refresh(self):
+        snap = self.model.snapshot()
+        self.progressbar.config(maximum=max(1, snap["total"]), value=snap["done"])
+        if self.label is not None:
+            self.label.config(text=format_progress(snap))
+
+    def _tick(self):
+        if not self._running:
+            return
+        self.refresh()
+        self.root.after(self.interval, self._tick)
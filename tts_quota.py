@@ -0,0 +1,275 @@
+"""按字符计费的配额统计与调度
+
+两家服务商都按字符数计费和限流。QuotaLedger按API密钥和任务累计字符用量（持久化），
+QuotaScheduler按固定时间窗口限制每个密钥的字符数：当前窗口余量不足时，
+请求等待下一个窗口，而不是撞上限流后让剩余的字幕全部失败。
+"""
+import atexit
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+
+
+def count_chars(text):
+    """计费字符数（不含首尾空白）"""
+    return len(text.strip())
+
+
+def key_id(api_key):
+    """API密钥的短摘要，统计文件中不保存明文密钥"""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class _FileLock:
+    """跨进程的文件锁：独占创建锁文件；持有者异常退出留下的锁超过stale秒后视为失效"""
+
+    def __init__(self, path, timeout=10.0, stale=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue  # 锁刚被释放
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"等待文件锁超时: {self.path}")
+            time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _merge_usage(data, delta, max_jobs):
+    """把delta中的用量累加到data（结构相同：key_id -> {"total", "jobs", "window"}）"""
+    for kid, change in delta.items():
+        entry = data.setdefault(kid, {"total": 0, "jobs": {}, "window": [0, 0]})
+        entry["total"] += change["total"]
+        jobs = entry["jobs"]
+        for job, chars in change["jobs"].items():
+            jobs[job] = jobs.pop(job, 0) + chars  # 移到末尾，保持最近使用的顺序
+        while len(jobs) > max_jobs:
+            jobs.pop(next(iter(jobs)))
+        start, chars = change["window"]
+        if start > entry["window"][0]:
+            entry["window"] = [start, chars]
+        elif start == entry["window"][0]:
+            entry["window"][1] += chars
+
+
+class QuotaLedger:
+    """按API密钥累计字符用量，保存每个密钥最近的任务和当前窗口的用量
+
+    两个应用、守护进程和合成服务可能共用同一个统计文件：保存时在文件锁内重新读取文件，
+    只累加本进程上次保存后新增的用量，再原子替换，各进程的用量不会互相覆盖。
+    记账只更新内存，写文件由后台线程每save_interval秒做一次（进程退出时再写一次），
+    等锁或写文件失败不会影响正在进行的请求，未写入的用量留到下次重试。
+    """
+
+    def __init__(self, path=None, max_jobs=50, save_interval=5.0, log=None):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.save_interval = save_interval  # 记账后最多间隔多久写一次文件（秒）
+        self._log = log
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._data = self._read()  # key_id -> {"total", "jobs": {job: chars}, "window": [start, chars]}
+        self._delta = {}  # 上次保存后本进程新增的用量，结构同_data
+        self._flusher = None
+        if path:
+            atexit.register(self.flush)
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, api_key, job, chars, window_start=None):
+        """记录一次成功请求的字符数（只更新内存，由后台线程写入文件）"""
+        change = {key_id(api_key): {"total": chars, "jobs": {job: chars},
+                                    "window": [window_start, chars] if window_start is not None else [0, 0]}}
+        with self._lock:
+            _merge_usage(self._data, change, self.max_jobs)
+            _merge_usage(self._delta, change, self.max_jobs)
+            if self._flusher is None and self.path:
+                self._flusher = threading.Thread(target=self._flush_loop, name="tts-quota-ledger", daemon=True)
+                self._flusher.start()
+
+    def window_usage(self, api_key, window_start):
+        """某个窗口内已记录的用量（用于进程重启后恢复当前窗口）"""
+        with self._lock:
+            entry = self._data.get(key_id(api_key))
+            if entry and entry["window"][0] == window_start:
+                return entry["window"][1]
+            return 0
+
+    def usage(self, api_key):
+        """某个密钥的累计用量与各任务用量"""
+        with self._lock:
+            entry = self._data.get(key_id(api_key), {"total": 0, "jobs": {}})
+            return {"total": entry["total"], "jobs": dict(entry["jobs"])}
+
+    def job_chars(self, api_key, job):
+        with self._lock:
+            return self._data.get(key_id(api_key), {}).get("jobs", {}).get(job, 0)
+
+    def flush(self):
+        """保存新增的用量，失败时记录日志并保留到下次重试，返回是否成功"""
+        try:
+            self.save()
+        except Exception as e:
+            if self._log:
+                self._log(f"保存配额统计失败，稍后重试: {e}")
+            return False
+        return True
+
+    def save(self):
+        """把新增的用量合并写入统计文件（无变化时跳过），失败时抛出异常"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._delta:
+                    return
+                delta, self._delta = self._delta, {}
+            try:
+                with _FileLock(f"{self.path}.lock"):
+                    data = self._read()
+                    _merge_usage(data, delta, self.max_jobs)
+                    tmp = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(data, f, ensure_ascii=False, indent=2)
+                    os.replace(tmp, self.path)
+            except Exception:
+                with self._lock:
+                    _merge_usage(self._delta, delta, self.max_jobs)  # 下次保存时重试
+                raise
+            with self._lock:
+                # 其他进程记录的用量同步到内存，再加上保存期间本进程新增的用量
+                _merge_usage(data, self._delta, self.max_jobs)
+                self._data = data
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.save_interval)
+            self.flush()
+
+
+class QuotaScheduler:
+    """按固定窗口限制每个API密钥的字符数
+
+    limit为每个窗口允许的字符数，0表示不限（只统计用量）。请求发出前调用acquire
+    预占字符，余量不足时等待下一个窗口；请求失败时调用refund退还，成功时调用commit记账。
+    """
+
+    def __init__(self, limit=0, window=60.0, ledger=None, log=None):
+        self.limit = limit
+        self.window = window
+        self.ledger = ledger if ledger is not None else QuotaLedger()
+        if self.ledger._log is None:
+            self.ledger._log = log
+        self._log = log
+        self._lock = threading.Lock()
+        self._windows = {}  # key_id -> [window_start, reserved_chars]
+        self._announced = None  # 已提示过等待的窗口，避免每个并发请求都打印一次
+
+    def _window_start(self, now=None):
+        now = time.time() if now is None else now
+        return math.floor(now / self.window) * self.window
+
+    def _state(self, api_key, start):
+        state = self._windows.get(key_id(api_key))
+        if state is None or state[0] != start:
+            state = self._windows[key_id(api_key)] = [start, self.ledger.window_usage(api_key, start)]
+        return state
+
+    def acquire(self, api_key, chars, token=None):
+        """预占chars个字符，当前窗口余量不足时等待；返回预占所在的窗口"""
+        while True:
+            with self._lock:
+                start = self._window_start()
+                state = self._state(api_key, start)
+                # 单个请求超过整个窗口的额度时，只要窗口为空就放行
+                if not self.limit or state[1] + chars <= self.limit or state[1] == 0:
+                    state[1] += chars
+                    return start
+                wait = start + self.window - time.time()
+                announce = self._announced != start
+                self._announced = start
+            if announce and self._log:
+                self._log(f"本窗口字符配额已用完（{self.limit}），等待 {wait:.0f} 秒后继续")
+            if token is not None:
+                token.wait(max(0.0, wait))
+                token.raise_if_cancelled()
+            else:
+                time.sleep(max(0.0, wait))
+
+    def try_acquire(self, api_key, chars):
+        """不等待地预占chars个字符，当前窗口余量不足时返回None"""
+        with self._lock:
+            start = self._window_start()
+            state = self._state(api_key, start)
+            if self.limit and state[1] + chars > self.limit:
+                return None
+            state[1] += chars
+            return start
+
+    def refund(self, api_key, chars, window_start):
+        """请求失败时退还预占的字符"""
+        with self._lock:
+            state = self._windows.get(key_id(api_key))
+            if state is not None and state[0] == window_start:
+                state[1] = max(0, state[1] - chars)
+
+    def commit(self, api_key, job, chars, window_start):
+        """请求成功后记账"""
+        self.ledger.record(api_key, job, chars, window_start)
+
+    def estimate(self, api_key, chars):
+        """预估：当前窗口余量、需要的窗口数和大致等待时间（秒）"""
+        if not self.limit:
+            return {"chars": chars, "available": None, "windows": 1 if chars else 0, "wait_s": 0.0}
+        with self._lock:
+            now = time.time()
+            start = self._window_start(now)
+            used = self._state(api_key, start)[1]
+        available = max(0, self.limit - used)
+        remaining = max(0, chars - available)
+        windows = (1 if chars and available else 0) + math.ceil(remaining / self.limit)
+        wait = 0.0
+        if remaining:
+            wait = (start + self.window - now) + (math.ceil(remaining / self.limit) - 1) * self.window
+        return {"chars": chars, "available": available, "windows": windows, "wait_s": wait}
+
+
+def format_estimate(estimate):
+    """把预估结果格式化为一行日志"""
+    text = f"预计消耗 {estimate['chars']} 字符"
+    if estimate.get("requests") is not None:
+        text += f"（{estimate['requests']} 个请求）"
+    if estimate["available"] is not None:
+        text += f"，当前窗口余量 {estimate['available']}，需 {estimate['windows']} 个配额窗口"
+        if estimate["wait_s"] > 0:
+            text += f"，约需等待 {estimate['wait_s']:.0f} 秒"
+    return text
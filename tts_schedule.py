@@ -0,0 +1,88 @@
+"""按播放位置调度字幕合成：离播放头最近、即将播放的条目最先请求
+
+边合成边预览时，合成顺序应当跟随试听者正在听的位置而不是字幕序号。CueScheduler按
+最早截止时间优先（EDF）排列待合成的请求：播放头之后（含正在播放）的条目按开始时间排序，
+截止时间最早的先发出；播放头之前的条目只在前方没有紧迫条目时用剩余并发补齐，供最终导出。
+跳转时立即重新排序，排队中的请求按新位置发出，已发出的请求不受影响。
+"""
+import heapq
+import threading
+
+
+class CueScheduler:
+    """字幕请求的EDF调度器
+
+    cues为synthesize_cues的字幕列表；lookahead_ms为前方缓冲目标：播放头之后这段时间内的
+    条目都已发出时，空闲的并发先用于补齐播放头之前的条目，前方缓冲不足时再回到前方。
+    """
+
+    def __init__(self, cues, lookahead_ms=120000):
+        self.cues = cues
+        self.lookahead_ms = lookahead_ms
+        self.playhead = 0
+        self._lock = threading.Lock()
+        self._pending = set()  # 尚未发出的请求序号
+        self._entries = []  # (开始时间, 结束时间, 请求序号)，每个字幕条目一项
+        self._ahead = []  # 播放头之后的条目，按开始时间的最小堆
+        self._behind = []  # 播放头之前的条目，按开始时间的最小堆
+
+    def bind(self, groups, indexes):
+        """登记待发出的请求：groups为请求序号 -> 字幕条目序号列表，indexes为需要实际请求的请求序号
+
+        同一文本出现在多处时每处各有一项，任一处临近播放头都会提前该请求。
+        """
+        with self._lock:
+            self._pending = set(indexes)
+            self._entries = [(self.cues[item]['start'], self.cues[item]['end'], index)
+                             for index in self._pending for item in groups[index]]
+            self._rebuild()
+
+    def move(self, ms):
+        """播放头移动到ms；向前移动时按需惰性调整，向后跳转时重新排序"""
+        with self._lock:
+            backward = ms < self.playhead
+            self.playhead = ms
+            if backward:
+                self._rebuild()
+
+    def pop(self):
+        """取出下一个应发出的请求序号，没有时返回None"""
+        with self._lock:
+            while True:
+                entry = self._next()
+                if entry is None:
+                    return None
+                if entry[2] in self._pending:
+                    self._pending.discard(entry[2])
+                    return entry[2]
+
+    def drain(self):
+        """取出所有未发出的请求序号（取消任务时使用）"""
+        with self._lock:
+            pending, self._pending = sorted(self._pending), set()
+            self._ahead, self._behind = [], []
+            return pending
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _next(self):
+        # 须持有锁；堆顶已播完的条目移到后方堆，堆中已发出的请求在取出时跳过
+        while self._ahead and self._ahead[0][1] <= self.playhead:
+            heapq.heappush(self._behind, heapq.heappop(self._ahead))
+        while self._ahead and self._ahead[0][2] not in self._pending:
+            heapq.heappop(self._ahead)
+        while self._behind and self._behind[0][2] not in self._pending:
+            heapq.heappop(self._behind)
+        if self._ahead and (not self._behind or self._ahead[0][0] - self.playhead < self.lookahead_ms):
+            return heapq.heappop(self._ahead)
+        if self._behind:
+            return heapq.heappop(self._behind)
+        return None
+
+    def _rebuild(self):
+        self._ahead = [entry for entry in self._entries if entry[1] > self.playhead and entry[2] in self._pending]
+        self._behind = [entry for entry in self._entries if entry[1] <= self.playhead and entry[2] in self._pending]
+        heapq.heapify(self._ahead)
+        heapq.heapify(self._behind)
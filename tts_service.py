@@ -0,0 +1,413 @@
+"""本地HTTP合成服务
+
+一个进程持有所有连接、音频缓存和全局并发预算，多个编辑人员的应用作为瘦客户端
+（设置环境变量TTS_SERVICE_URL，见tts_backend.RemoteBackend）提交任务，
+相同的台词只合成一次，请求频率由服务统一控制：
+
+    python tts_service.py --port 8765 --concurrency 8
+
+接口（JSON）：
+    POST   /v1/jobs                    提交任务，返回任务ID
+           {"backend", "api_key", "voice", "speed", "encoding", "model", "sample_rate",
+            "texts": [...] 或 "srt": "...", "dedupe"}
+    POST   /v1/estimate                参数同上，只预估字符数与所需配额窗口
+    GET    /v1/jobs/<id>?wait=秒       查询任务状态，wait>0时等待任务结束（长轮询）
+    GET    /v1/jobs/<id>/items/<序号>  下载单条音频，编码见响应头X-Audio-Encoding
+    GET    /v1/jobs/<id>/audio         下载按顺序合并的音频
+    DELETE /v1/jobs/<id>               取消任务
+    GET    /v1/health                  服务状态
+    GET    /metrics                    Prometheus格式的请求指标
+"""
+import argparse
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from tts_audio import ENCODINGS, to_file_bytes
+from tts_backend import BACKENDS, BackendError, SynthesisOptions, create_backend
+from tts_breaker import CircuitBreaker
+from tts_engine import AudioCache, SynthesisEngine
+from tts_executor import CancelToken, SynthesisExecutor
+from tts_hedge import HedgePolicy
+from tts_metrics import MetricsCollector
+from tts_quota import QuotaLedger, QuotaScheduler
+from tts_subtitle import parse_srt
+
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 16 * 1024 * 1024
+FINISHED = ("done", "failed", "cancelled")
+
+# 各服务商相邻请求的最小间隔（秒），沿用应用中的设置
+DEFAULT_INTERVALS = {"volcano": 0.5}
+
+
+def log(message):
+    """输出带时间戳的日志"""
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+class ServiceJob:
+    """服务端的一个合成任务"""
+
+    def __init__(self, job_id, backend, api_key, texts, options, cues=None, dedupe=False):
+        self.id = job_id
+        self.backend = backend
+        self.api_key = api_key
+        self.texts = texts
+        self.options = options
+        self.cues = cues  # SRT任务的字幕条目
+        self.dedupe = dedupe
+        self.status = "queued"
+        self.results = [None] * len(texts)
+        self.errors = {}  # index -> BackendError或其他异常
+        self.done = 0
+        self.created = time.time()
+        self.finished = None
+        self.rollup = None
+        self.token = CancelToken()
+        self._finished = threading.Event()
+
+    def wait(self, timeout):
+        """等待任务结束，返回是否已结束"""
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        items = []
+        for index, result in enumerate(self.results):
+            item = {"index": index}
+            if self.cues:
+                cue = self.cues[index]
+                item.update(cue=cue["index"], start=cue["start"], end=cue["end"])
+            if result is not None:
+                item.update(ok=True, encoding=result.encoding, sample_rate=result.sample_rate,
+                            cached=result.cached, bytes=len(result.audio))
+            elif index in self.errors:
+                error = self.errors[index]
+                item.update(ok=False, error=str(error), retryable=bool(getattr(error, "retryable", False)))
+            else:
+                item["ok"] = None  # 尚未完成或被跳过的空文本
+            items.append(item)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "backend": self.backend,
+            "total": len(self.texts),
+            "done": self.done,
+            "failed": len(self.errors),
+            "created": self.created,
+            "finished": self.finished,
+            "rollup": self.rollup,
+            "items": items,
+        }
+
+
+class SynthesisService:
+    """合成服务：按(后端, API密钥)复用引擎，所有引擎共用并发预算、缓存和指标"""
+
+    def __init__(self, concurrency=8, max_jobs=8, keep_jobs=200, cache_bytes=512 * 1024 * 1024,
+                 timeout=30, max_retries=2, intervals=None, quota=None, hedge_budget=0.0):
+        self.executor = SynthesisExecutor(max_workers=concurrency, log=log, name="service")
+        self.cache = AudioCache(cache_bytes)
+        self.metrics = MetricsCollector(max_jobs=50)
+        self.quota = quota if quota is not None else QuotaScheduler(log=log)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge_budget = hedge_budget  # 对冲请求占比上限，0为不对冲；每个引擎按各自的延迟分布对冲
+        self.intervals = dict(DEFAULT_INTERVALS if intervals is None else intervals)
+        self.keep_jobs = keep_jobs
+        self._engines = {}
+        self._breakers = {}  # 后端 -> CircuitBreaker，同一服务商的所有API密钥共用
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._runner = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="tts-service-job")
+
+    def engine(self, backend, api_key):
+        """取得(后端, API密钥)对应的引擎，首次使用时创建"""
+        key = (backend, api_key)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = self._engines[key] = SynthesisEngine(
+                    create_backend(backend, api_key, timeout=self.timeout, log=log),
+                    timeout=self.timeout,
+                    min_interval=self.intervals.get(backend, 0.0),
+                    cache=self.cache,
+                    log=log,
+                    max_retries=self.max_retries,
+                    metrics=self.metrics,
+                    executor=self.executor,
+                    quota=self.quota,
+                    hedge=HedgePolicy(budget=self.hedge_budget) if self.hedge_budget else None,
+                    breaker=self._breakers.setdefault(backend, CircuitBreaker(backend, log=log)),
+                )
+            return engine
+
+    def estimate(self, payload):
+        """不提交任务，只预估需要实际请求的字符数和配额窗口"""
+        job = self._parse(payload)
+        engine = self.engine(job.backend, job.api_key)
+        return engine.estimate(job.texts, job.options, dedupe=job.dedupe)
+
+    def submit(self, payload):
+        """校验并登记任务，参数不合法时抛出ValueError"""
+        job = self._parse(payload)
+        with self._lock:
+            job.id = f"{job.backend}-{time.strftime('%Y%m%d-%H%M%S')}-{next(self._ids)}"
+            self._jobs[job.id] = job
+            self._evict()
+        self._runner.submit(self._run, job)
+        return job
+
+    def _parse(self, payload):
+        backend = payload.get("backend", "volcano")
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的后端: {backend}")
+        voice = payload.get("voice")
+        if not voice:
+            raise ValueError("缺少voice参数")
+        encoding = payload.get("encoding", "mp3")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"不支持的输出格式: {encoding}")
+        options = SynthesisOptions(voice, speed=float(payload.get("speed", 1.0)), encoding=encoding,
+                                   model=payload.get("model"))
+        if payload.get("sample_rate"):
+            options.sample_rate = int(payload["sample_rate"])
+
+        cues = None
+        if "srt" in payload:
+            cues = parse_srt(payload["srt"])
+            if not cues:
+                raise ValueError("未解析到有效字幕")
+            texts = [cue["text"] for cue in cues]
+        else:
+            texts = payload.get("texts")
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("texts必须是字符串列表")
+        dedupe = bool(payload.get("dedupe", cues is not None))
+        return ServiceJob(None, backend, payload.get("api_key", ""), texts, options, cues, dedupe)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """取消任务，返回任务（不存在时为None）"""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            job.token.cancel()
+        return job
+
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            engines = len(self._engines)
+            breakers = list(self._breakers.values())
+        return {
+            "jobs": statuses,
+            "engines": engines,
+            "breakers": {breaker.name: breaker.stats() for breaker in breakers},
+            "executor": self.executor.stats(),
+            "cache": {"hits": self.cache.hits, "misses": self.cache.misses},
+        }
+
+    def close(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            engines = list(self._engines.values())
+        self.quota.ledger.flush()
+        for job in jobs:
+            job.token.cancel()
+        self._runner.shutdown(wait=False)
+        for engine in engines:
+            engine.close()
+        self.executor.shutdown()
+
+    def _run(self, job):
+        if job.token.cancelled:
+            self._finish(job, "cancelled")
+            return
+        job.status = "running"
+        engine = self.engine(job.backend, job.api_key)
+
+        def on_item(index, result, error):
+            job.results[index] = result
+            if error is not None:
+                job.errors[index] = error
+            job.done += 1
+
+        engine_job = engine.new_job("service")
+        try:
+            engine.synthesize_many(job.texts, job.options, on_item, token=job.token, job=engine_job,
+                                   dedupe=job.dedupe)
+        except Exception as e:
+            job.errors.setdefault(-1, BackendError(f"任务执行出错: {e}"))
+        finally:
+            engine.metrics.end_job(engine_job)
+        job.rollup = engine.metrics.rollup(engine_job)
+        if job.token.cancelled:
+            self._finish(job, "cancelled")
+        elif job.errors and not any(result is not None for result in job.results):
+            self._finish(job, "failed")
+        else:
+            self._finish(job, "done")
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        job._finished.set()
+        log(f"任务 {job.id} {status}：{job.done}/{len(job.texts)} 条，失败 {len(job.errors)} 条")
+
+    def _evict(self):
+        """只保留最近keep_jobs个任务，优先淘汰已结束的"""
+        excess = len(self._jobs) - self.keep_jobs
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.status in FINISHED][:excess]:
+            del self._jobs[job_id]
+
+
+def make_handler(service):
+    job_path = re.compile(r"^/v1/jobs/([\w.-]+)(?:/(audio|items/(\d+)))?$")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/v1/health":
+                self._json(200, service.stats())
+                return
+            if url.path == "/metrics":
+                self._send(200, service.metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+                return
+            match = job_path.match(url.path)
+            job = service.get(match.group(1)) if match else None
+            if job is None:
+                self._json(404, {"error": "任务不存在"})
+                return
+            if match.group(2) is None:
+                try:
+                    wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+                except ValueError:
+                    self._json(400, {"error": "wait必须是数字（秒）"})
+                    return
+                if wait > 0:
+                    job.wait(min(wait, 60.0))
+                self._json(200, job.to_dict())
+                return
+            if match.group(2) == "audio":
+                results = [r for r in job.results if r is not None]
+                if job.status not in FINISHED or not results:
+                    self._json(409, {"error": "任务尚未完成或没有可用音频"})
+                    return
+                first = results[0]
+                merged = service.engine(job.backend, job.api_key).merge(results)
+                self._audio(to_file_bytes(merged, first.encoding, first.sample_rate), first, file=True)
+                return
+            index = int(match.group(3))
+            result = job.results[index] if index < len(job.results) else None
+            if result is None:
+                self._json(404, {"error": "该条音频不存在或尚未完成"})
+                return
+            self._audio(result.audio, result)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path not in ("/v1/jobs", "/v1/estimate"):
+                self._json(404, {"error": "接口不存在"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY_BYTES:
+                self._json(413, {"error": "请求体过大"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if path == "/v1/estimate":
+                    self._json(200, service.estimate(payload))
+                    return
+                job = service.submit(payload)
+            except (ValueError, TypeError, AttributeError) as e:
+                self._json(400, {"error": str(e)})
+                return
+            self._json(202, {"id": job.id, "status": job.status, "total": len(job.texts)})
+
+        def do_DELETE(self):
+            match = job_path.match(urlparse(self.path).path)
+            job = service.cancel(match.group(1)) if match and match.group(2) is None else None
+            if job is None:
+                self._json(404, {"error": "任务不存在"})
+                return
+            self._json(200, {"id": job.id, "status": job.status})
+
+        def _audio(self, data, result, file=False):
+            encoding = "wav" if file and result.encoding == "pcm" else result.encoding
+            self._send(200, data, "application/octet-stream", {
+                "X-Audio-Encoding": encoding,
+                "X-Sample-Rate": str(result.sample_rate),
+                "X-Cached": "1" if result.cached else "0",
+            })
+
+        def _json(self, status, payload):
+            self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                       "application/json; charset=utf-8")
+
+        def _send(self, status, data, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地语音合成服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认只接受本机连接）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=8, help="向服务商的全局并发请求数")
+    parser.add_argument("--jobs", type=int, default=8, help="同时执行的任务数")
+    parser.add_argument("--cache-mb", type=int, default=512, help="音频缓存上限（MB）")
+    parser.add_argument("--volcano-interval", type=float, default=0.5, help="火山引擎相邻请求最小间隔（秒）")
+    parser.add_argument("--quota-chars", type=int, default=0, help="每个API密钥每个配额窗口的字符上限，0为不限")
+    parser.add_argument("--quota-window", type=float, default=60, help="配额窗口长度（秒）")
+    parser.add_argument("--hedge-budget", type=float, default=0.0,
+                        help="对冲请求占普通请求的比例上限（如0.05），0为不对冲")
+    args = parser.parse_args(argv)
+
+    quota = QuotaScheduler(args.quota_chars, args.quota_window, QuotaLedger("quota_usage.json"), log=log)
+    service = SynthesisService(concurrency=args.concurrency, max_jobs=args.jobs,
+                               cache_bytes=args.cache_mb * 1024 * 1024,
+                               intervals={"volcano": args.volcano_interval}, quota=quota,
+                               hedge_budget=args.hedge_budget)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    httpd.daemon_threads = True
+    log(f"合成服务已启动: http://{args.host}:{httpd.server_address[1]}，全局并发 {args.concurrency}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+        log("合成服务已退出")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""分轨导出：每条字幕单独保存为一个音频文件，并生成JSON清单供剪辑软件导入
+
+文件名由字幕序号和开始时间码组成（如 0012_00-01-02-345.wav），由写入线程池并行保存；
+清单manifest.json记录每条的序号、起止时间、实际时长、文本、音色和缓存键。
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_audio import duration_ms, file_extension, to_file_bytes
+from tts_subtitle import ms_to_time
+
+MANIFEST_NAME = "manifest.json"
+
+
+def stem_name(subtitle, encoding):
+    """分轨文件名：序号_开始时间码.扩展名（时间码中的冒号换成连字符，兼容Windows）"""
+    return f"{int(subtitle['index']):04d}_{ms_to_time(subtitle['start'], '-').replace(':', '-')}{file_extension(encoding)}"
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def export_stems(segments, directory, options, backend_name, max_workers=8, on_item=None):
+    """把synthesize_cues返回的字幕段逐条写入directory，返回清单字典
+
+    options为合成时使用的SynthesisOptions；适配时长时重新请求过的段使用其自带的'options'。
+    on_item(done, total)在每个文件写完后于调用线程中回调。
+    """
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-stems") as pool:
+        futures = []
+        for segment in segments:
+            subtitle, result = segment['subtitle'], segment['result']
+            used = segment.get('options', options)
+            name = stem_name(subtitle, result.encoding)
+            entry = {
+                "index": int(subtitle['index']),
+                "file": name,
+                "start": subtitle['start'],
+                "end": subtitle['end'],
+                "start_tc": ms_to_time(subtitle['start']),
+                "end_tc": ms_to_time(subtitle['end']),
+                "duration_ms": duration_ms(result.audio, result.encoding, result.sample_rate),
+                "text": subtitle['text'],
+                "voice": used.voice,
+                "speed": used.speed,
+                "encoding": result.encoding,
+                "sample_rate": result.sample_rate,
+                "cache_key": used.cache_key(backend_name, subtitle['text']),
+            }
+            if 'stretch' in segment:
+                entry["stretch"] = segment['stretch']
+            entries.append(entry)
+            data = to_file_bytes(result.audio, result.encoding, result.sample_rate)
+            futures.append(pool.submit(_write, os.path.join(directory, name), data))
+
+        done = 0
+        for future in futures:
+            future.result()  # 写入失败时抛出
+            done += 1
+            if on_item:
+                on_item(done, len(futures))
+
+    manifest = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "backend": backend_name,
+        "count": len(entries),
+        "stems": entries,
+    }
+    tmp = os.path.join(directory, f"{MANIFEST_NAME}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(directory, MANIFEST_NAME))
+    manifest["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return manifest
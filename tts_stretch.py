@@ -0,0 +1,150 @@
+"""字幕时长适配：把超出字幕时间窗的音频压缩到窗内
+
+超出不多的条目用WSOLA（波形相似叠加）在本地加速，音高不变，不消耗接口额度；
+需要的加速超过质量上限（max_speed）或音频为压缩编码时，才用更快的语速重新请求，
+重新请求后仍略有超出的再在本地压缩。需要NumPy，未安装时只能重新请求。
+"""
+from tts_audio import duration_ms, pcm_to_wav, read_wav
+from tts_backend import SynthesisOptions, SynthesisResult
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def stretch_pcm(pcm, speed, sample_rate, frame_ms=20):
+    """WSOLA变速：speed>1时加速（变短），返回16位单声道PCM
+
+    输出按半帧步长逐帧叠加，每帧在名义位置附近±四分之一帧内搜索与上一帧自然延续最相似的位置，
+    相似度用候选矩阵与模板的矩阵乘法一次算出；叠加用两个半帧错位相加完成。
+    """
+    np = _numpy()
+    samples = len(pcm) // 2
+    target = int(round(samples / speed))
+    frame = max(2, sample_rate * frame_ms // 1000) // 2 * 2
+    if np is None or speed == 1.0 or samples < frame * 2 or target < frame:
+        return pcm[:samples * 2]
+    hop = frame // 2
+    delta = hop // 2
+    window = np.hanning(frame + 1)[:frame].astype(np.float32)  # 周期汉宁窗，半帧重叠时叠加为1
+
+    x = np.frombuffer(pcm[:samples * 2], dtype="<i2").astype(np.float32)
+    # 两端补零，搜索和取帧不越界
+    x = np.concatenate((np.zeros(delta, np.float32), x, np.zeros(frame + 2 * delta + hop, np.float32)))
+    views = np.lib.stride_tricks.sliding_window_view(x, frame)
+
+    count = -(-max(target - frame, 0) // hop) + 1
+    nominal = delta + np.round(np.arange(count) * hop * speed).astype(np.int64)
+    nominal = np.minimum(nominal, len(views) - 1 - delta)
+    positions = np.empty(count, dtype=np.int64)
+    positions[0] = nominal[0]
+    offsets = np.arange(-delta, delta + 1)
+    for k in range(1, count):
+        template = views[positions[k - 1] + hop]  # 上一帧的自然延续
+        candidates = views[nominal[k] - delta:nominal[k] + delta + 1]
+        positions[k] = nominal[k] + offsets[np.argmax(candidates @ template)]
+
+    frames = views[positions] * window
+    out = frames[:, :hop].copy()
+    out[1:] += frames[:-1, hop:]
+    y = np.concatenate((out.ravel(), frames[-1, hop:]))[:target]
+    if len(y) < target:
+        y = np.concatenate((y, np.zeros(target - len(y), np.float32)))
+    return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
+
+
+def stretch_result(result, speed):
+    """变速一个PCM/WAV合成结果，其他编码或非16位单声道时返回None"""
+    if result.encoding == "pcm":
+        pcm, rate = result.audio, result.sample_rate
+    elif result.encoding == "wav":
+        pcm, rate, channels, width = read_wav(result.audio)
+        if channels != 1 or width != 2:
+            return None
+    else:
+        return None
+    pcm = stretch_pcm(pcm, speed, rate)
+    audio = pcm_to_wav(pcm, rate) if result.encoding == "wav" else pcm
+    return SynthesisResult(audio, result.encoding, raw=result.raw, cached=result.cached,
+                           timings=result.timings, sample_rate=rate)
+
+
+class TimingFitter:
+    """把字幕配音适配到各自的时间窗
+
+    max_speed为本地压缩的质量上限（输入/输出时长之比）；tolerance_ms以内的超出不处理；
+    重新请求时语速按0.05向上取整以便相同语速的条目合并请求，且不超过max_request_speed。
+    """
+
+    def __init__(self, max_speed=1.25, tolerance_ms=40, max_request_speed=2.0, log=None):
+        self.max_speed = max_speed
+        self.tolerance_ms = tolerance_ms
+        self.max_request_speed = max_request_speed
+        self._log = log
+
+    def overrun(self, segment):
+        """返回(音频时长与时间窗之比, 时长是否精确)，未超出或时间窗无效时比值为None
+
+        时长无法从音频中解析时按字节数粗略估算（与播放时的估算一致），此时不做本地压缩。
+        """
+        subtitle, result = segment['subtitle'], segment['result']
+        window = subtitle['end'] - subtitle['start']
+        length = duration_ms(result.audio, result.encoding, result.sample_rate)
+        exact = length is not None
+        if not exact:
+            length = len(result.audio) / 3.5
+        if window <= 0 or length <= window + self.tolerance_ms:
+            return None, exact
+        return length / window, exact
+
+    def fit(self, engine, segments, options, job=None):
+        """原地适配synthesize_cues返回的字幕段，返回{'stretched', 'requested', 'unfit'}
+
+        重新请求的段记录所用的'options'，本地压缩的段记录加速比'stretch'。
+        """
+        stats = {'stretched': 0, 'requested': 0, 'unfit': 0}
+        local = _numpy() is not None
+        retry = {}  # 语速 -> [segment]
+        for segment in segments:
+            ratio, exact = self.overrun(segment)
+            if ratio is None:
+                continue
+            if exact and local and ratio <= self.max_speed and self._stretch(segment, ratio):
+                stats['stretched'] += 1
+                continue
+            speed = min(self.max_request_speed, -(-options.speed * ratio * 20 // 1) / 20)
+            if speed <= options.speed:
+                stats['unfit'] += 1
+                continue
+            retry.setdefault(speed, []).append(segment)
+
+        for speed, group in sorted(retry.items()):
+            faster = SynthesisOptions(options.voice, speed=speed, encoding=options.encoding, model=options.model,
+                                      sample_rate=options.sample_rate)
+            if self._log:
+                self._log(f"时长适配：{len(group)} 段超出过多，以 {speed:.2f}x 语速重新请求")
+            results = engine.synthesize_many([s['subtitle']['text'] for s in group], faster, job=job, dedupe=True)
+            for segment, result in zip(group, results):
+                if result is None:
+                    stats['unfit'] += 1
+                    continue
+                stats['requested'] += 1
+                segment['result'], segment['data'], segment['options'] = result, result.audio, faster
+                ratio, exact = self.overrun(segment)
+                if ratio is None:
+                    continue
+                if not (exact and local and ratio <= self.max_speed and self._stretch(segment, ratio)):
+                    stats['unfit'] += 1
+        return stats
+
+    def _stretch(self, segment, ratio):
+        result = stretch_result(segment['result'], ratio)
+        if result is None:
+            return False
+        segment['result'], segment['data'] = result, result.audio
+        segment['stretch'] = round(segment.get('stretch', 1.0) * ratio, 3)
+        return True
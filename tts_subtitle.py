@@ -0,0 +1,254 @@
+"""字幕解析与文本分段（两个应用共用）"""
+import re
+from bisect import bisect_left, bisect_right
+
+# SRT格式正则表达式
+SRT_PATTERN = re.compile(
+    r'(\d+)\r?\n'
+    r'(\d+:\d+:\d+,\d+) --> (\d+:\d+:\d+,\d+)\r?\n'
+    r'(.*?)\r?\n\r?\n',
+    re.DOTALL
+)
+
+
+def time_to_ms(time_str):
+    """将SRT时间格式转换为毫秒"""
+    # 处理逗号为点，统一格式
+    time_str = time_str.replace(',', '.')
+    h, m, s = time_str.split(':')
+    s, ms = s.split('.')
+
+    # 转换为总毫秒数
+    return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(ms)
+
+
+def ms_to_time(ms, separator=','):
+    """毫秒转换为SRT时间格式（HH:MM:SS,mmm）"""
+    h, rest = divmod(int(ms), 3600 * 1000)
+    m, rest = divmod(rest, 60 * 1000)
+    s, ms = divmod(rest, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}{separator}{ms:03d}"
+
+
+def parse_srt(content):
+    """解析SRT格式字幕，返回字幕条目列表"""
+    subtitles = []
+    for match in SRT_PATTERN.finditer(content):
+        start_time = time_to_ms(match.group(2))
+        end_time = time_to_ms(match.group(3))
+        subtitles.append({
+            'index': match.group(1),
+            'start': start_time,
+            'end': end_time,
+            'duration': end_time - start_time,  # 字幕时长(毫秒)
+            'text': match.group(4).strip()
+        })
+    return subtitles
+
+
+def clean_subtitle_text(subtitle_text):
+    """解析字幕并过滤时间戳和序号，保留段落间空行"""
+    clean_lines = []
+    skip_next_empty = False  # 用于跳过字幕块之间的空行
+
+    for line in subtitle_text.splitlines():
+        stripped_line = line.strip()
+
+        # 过滤SRT格式的序号（纯数字）和时间戳（包含 --> 标记）
+        if stripped_line.isdigit() or '-->' in stripped_line:
+            skip_next_empty = True
+            continue
+
+        # 跳过字幕块之间的空行，保留文本段落之间的空行
+        if not stripped_line:
+            if skip_next_empty:
+                skip_next_empty = False
+            else:
+                clean_lines.append('')
+            continue
+
+        skip_next_empty = False
+        clean_lines.append(stripped_line)
+
+    return '\n'.join(clean_lines)
+
+
+def split_paragraphs(text, max_chars=200):
+    """按空行和长度上限把文本分成多个段落（避免超出API限制）"""
+    paragraphs = []
+    current_paragraph = []
+    current_length = 0
+
+    for line in text.splitlines():
+        stripped_line = line.strip()
+        if not stripped_line:  # 保留段落分隔
+            if current_paragraph:
+                paragraphs.append(" ".join(current_paragraph))
+                current_paragraph = []
+                current_length = 0
+            continue
+
+        if current_paragraph and current_length + len(stripped_line) > max_chars:
+            paragraphs.append(" ".join(current_paragraph))
+            current_paragraph = [stripped_line]
+            current_length = len(stripped_line)
+        else:
+            current_paragraph.append(stripped_line)
+            current_length += len(stripped_line)
+
+    if current_paragraph:
+        paragraphs.append(" ".join(current_paragraph))
+    return paragraphs
+
+
+def split_cue_paragraphs(cues, max_chars=200):
+    """把字幕条目分成段落，返回(段落列表, 每段所属条目的位置列表)
+
+    与clean_subtitle_text + split_paragraphs的结果相同（字幕块之间的空行使每条自成一段），
+    同时记录段落来自哪条字幕，便于把合成状态对应回条目；没有文本的条目不产生段落。
+    """
+    paragraphs, members = [], []
+    for position, cue in enumerate(cues):
+        for paragraph in split_paragraphs(cue['text'], max_chars=max_chars):
+            paragraphs.append(paragraph)
+            members.append([position])
+    return paragraphs, members
+
+
+# 句子结尾：句末标点（连同其后的引号、括号），或后接空白的英文句点
+_SENTENCE = re.compile(r'.*?(?:(?:[。！？!?；;…\n]+|\.+(?=\s|$))[”’」』）)"\']*|$)', re.DOTALL)
+# 单句超长时退而按分句切开
+_CLAUSE = re.compile(r'.*?(?:[，,、：:]+[”’」』）)"\']*|$)', re.DOTALL)
+
+
+def utf8_len(text):
+    return len(text.encode("utf-8"))
+
+
+def _split_pieces(text, max_bytes):
+    for sentence in _SENTENCE.findall(text):
+        if utf8_len(sentence) <= max_bytes:
+            yield sentence
+            continue
+        for clause in _CLAUSE.findall(sentence):
+            if utf8_len(clause) <= max_bytes:
+                yield clause
+                continue
+            # 没有可用的标点，按字符硬切
+            piece = ""
+            for char in clause:
+                if utf8_len(piece + char) > max_bytes:
+                    yield piece
+                    piece = ""
+                piece += char
+            yield piece
+
+
+def split_sentences(text, max_bytes=1024):
+    """在句子边界把长文本切成若干块，每块的UTF-8编码不超过max_bytes字节
+
+    相邻的句子尽量合并到同一块，减少请求数；单句超长时按逗号等分句切开，仍超长时按字符切开。
+    """
+    chunks = []
+    current = ""
+    for piece in _split_pieces(text, max_bytes):
+        if current and utf8_len((current + piece).strip()) > max_bytes:
+            chunks.append(current.strip())
+            current = piece
+        else:
+            current += piece
+    chunks.append(current.strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+# 句末标点中影响语气的部分（问句、感叹），其余句末标点归一化时直接去掉
+_TRAILING_PUNCTUATION = re.compile(r'[\s.,;:~…。，、；：～·\-—!?！？"\'”’」』）)]+$')
+
+
+def normalize_text(text):
+    """合成前的文本归一化：全角转半角、合并空白、统一句末标点
+
+    句末的问号和感叹号会影响语调，归一化为一个半角符号保留下来；
+    其余句末标点（句号、逗号、省略号等）去掉。
+    """
+    chars = []
+    for ch in text:
+        code = ord(ch)
+        if code == 0x3000:  # 全角空格
+            ch = ' '
+        elif 0xFF01 <= code <= 0xFF5E:  # 全角ASCII字符
+            ch = chr(code - 0xFEE0)
+        chars.append(ch)
+    text = re.sub(r'\s+', ' ', ''.join(chars)).strip()
+
+    match = _TRAILING_PUNCTUATION.search(text)
+    if match:
+        tail = match.group(0)
+        text = text[:match.start()]
+        if not text:
+            return ''
+        if '?' in tail:
+            text += '?'
+        elif '!' in tail:
+            text += '!'
+    return text
+
+
+def dedupe_texts(texts):
+    """归一化并合并相同文本，返回(去重后的文本, 每条去重文本对应的原序号列表)
+
+    只有标点的文本（如“……”）归一化后为空，按原文（去掉首尾空白）合并和请求；
+    只有空白的文本不出现在结果中。
+    """
+    unique = []
+    groups = []
+    positions = {}
+    for index, text in enumerate(texts):
+        text = normalize_text(text or '') or (text or '').strip()
+        if not text:
+            continue
+        position = positions.get(text)
+        if position is None:
+            position = positions[text] = len(unique)
+            unique.append(text)
+            groups.append([])
+        groups[position].append(index)
+    return unique, groups
+
+
+class CueIndex:
+    """字幕时间轴索引：按开始时间二分查找，O(log n)定位任意时刻或任意字幕序号
+
+    starts为各条按时间排序的开始时间，lengths为各条音频的实际时长（毫秒），numbers为SRT序号。
+    """
+
+    def __init__(self, starts, lengths, numbers=None):
+        self.starts = list(starts)
+        self.lengths = list(lengths)
+        self.numbers = list(numbers) if numbers is not None else list(range(1, len(self.starts) + 1))
+        self._positions = {str(number): position for position, number in enumerate(self.numbers)}
+        self.duration = max((s + n for s, n in zip(self.starts, self.lengths)), default=0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def locate(self, ms):
+        """返回(位置, 条目内偏移)：ms落在某条音频内时从该条的偏移处开始，否则为其后第一条、偏移0"""
+        position = bisect_right(self.starts, ms) - 1
+        if position >= 0 and ms < self.starts[position] + self.lengths[position]:
+            return position, ms - self.starts[position]
+        return position + 1, 0
+
+    def position(self, number):
+        """SRT序号对应的位置，不存在时返回None"""
+        return self._positions.get(str(number))
+
+    def previous_start(self, ms):
+        """ms之前（留出半秒，便于连续后退）最近一条的开始时间"""
+        position = bisect_left(self.starts, ms - 500) - 1
+        return self.starts[max(0, position)] if self.starts else 0
+
+    def next_start(self, ms):
+        """ms之后下一条的开始时间，没有时返回None"""
+        position = bisect_right(self.starts, ms)
+        return self.starts[position] if position < len(self.starts) else None
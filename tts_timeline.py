@@ -0,0 +1,136 @@
+"""时间轴导出：预分配WAV文件并内存映射，各条字幕的PCM直接写到对应的采样位置
+
+输出文件按字幕总时长预先分配，写入位置超出时自动扩展。已写入的页定期刷回磁盘并从进程
+地址空间释放，导出数小时的节目时常驻内存也不随节目时长增长。各条目可以任意顺序、由多个线程写入；
+安装了NumPy时重叠部分按饱和相加混音，结果与写入顺序无关，否则后写入的覆盖先写入的。
+"""
+import mmap
+import struct
+import threading
+
+from tts_audio import DEFAULT_SAMPLE_RATE, read_wav
+
+HEADER_BYTES = 44
+
+
+def wav_header(data_bytes, sample_rate=DEFAULT_SAMPLE_RATE, channels=1, sample_width=2):
+    """标准44字节PCM WAV文件头"""
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_bytes, b"WAVE", b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b"data", data_bytes,
+    )
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class TimelineWriter:
+    """16位单声道WAV时间轴
+
+    with TimelineWriter(path, duration_ms, sample_rate) as timeline:
+        timeline.write(cue['start'], pcm)
+
+    release_bytes为每写入多少字节把脏页刷回磁盘并释放一次映射。
+    """
+
+    def __init__(self, path, duration_ms=0, sample_rate=DEFAULT_SAMPLE_RATE, release_bytes=32 * 1024 * 1024):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.release_bytes = release_bytes
+        self._np = _numpy()
+        self._lock = threading.Lock()
+        self._end = 0  # 已写入的最大数据字节位置（不含文件头）
+        self._pending = 0
+        self._map = None
+        self._capacity = 0
+        self._file = open(path, "w+b")
+        self._grow(self._offset(duration_ms))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def duration_ms(self):
+        return self._end // 2 * 1000 // self.sample_rate
+
+    def write(self, start_ms, pcm):
+        """把一段PCM写到start_ms处（线程安全）"""
+        pcm = pcm[:len(pcm) // 2 * 2]
+        if not pcm:
+            return
+        offset = self._offset(max(0, start_ms))
+        end = offset + len(pcm)
+        with self._lock:
+            if end > self._capacity:
+                self._grow(max(end, self._capacity + self._capacity // 4))
+            self._place(HEADER_BYTES + offset, pcm)
+            self._end = max(self._end, end)
+            self._pending += len(pcm)
+            if self._pending >= self.release_bytes:
+                self._release()
+
+    def write_result(self, start_ms, result):
+        """写入一个PCM/WAV合成结果，编码、声道或采样率不匹配时返回False"""
+        if result.encoding == "pcm":
+            pcm, rate = result.audio, result.sample_rate
+        elif result.encoding == "wav":
+            pcm, rate, channels, width = read_wav(result.audio)
+            if channels != 1 or width != 2:
+                return False
+        else:
+            return False
+        if rate != self.sample_rate:
+            return False
+        self.write(start_ms, pcm)
+        return True
+
+    def close(self):
+        """写入最终的文件头，截掉多分配的部分"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._map[:HEADER_BYTES] = wav_header(self._end, self.sample_rate)
+            self._map.flush()
+            self._map.close()
+            self._file.truncate(HEADER_BYTES + self._end)
+            self._file.close()
+            self._file = None
+
+    def _offset(self, ms):
+        return ms * self.sample_rate // 1000 * 2
+
+    def _grow(self, data_bytes):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+        size = HEADER_BYTES + max(data_bytes, 2)
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._capacity = size - HEADER_BYTES
+        self._pending = 0
+
+    def _place(self, start, pcm):
+        np = self._np
+        if np is None:
+            self._map[start:start + len(pcm)] = pcm
+            return
+        target = np.frombuffer(self._map, dtype="<i2", count=len(pcm) // 2, offset=start)
+        mixed = target.astype(np.int32) + np.frombuffer(pcm, dtype="<i2")
+        target[:] = np.clip(mixed, -32768, 32767)
+        del target  # 不保留对映射的引用，否则无法关闭或扩展
+
+    def _release(self):
+        self._map.flush()
+        if hasattr(mmap, "MADV_DONTNEED"):
+            self._map.madvise(mmap.MADV_DONTNEED)
+        self._pending = 0
@@ -1,17 +1,29 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import requests
 import time
 import json
 import threading
 import os
 import sys
-import uuid
-import base64
-import pygame
-import re
 from io import BytesIO
-from cryptography.fernet import Fernet  # 需要安装cryptography库
+from tts_audio import ENCODINGS, duration_ms, encoding_from_label, encoding_label, file_extension, to_file_bytes
+from tts_backend import (VOLCANO_MAX_TEXT_BYTES, RemoteBackend, SynthesisOptions, SynthesisResult,
+                         VolcanoBackend)
+from tts_breaker import CircuitBreaker
+from tts_config import ConfigStore
+from tts_cuelist import CACHED, DONE, FAILED, SKIPPED, CueListView
+from tts_engine import SynthesisEngine
+from tts_hedge import HedgePolicy
+from tts_log import LogSink
+from tts_metrics import format_rollup
+from tts_postprocess import PostProcessor
+from tts_progress import ProgressModel, ProgressView
+from tts_quota import QuotaLedger, QuotaScheduler, format_estimate
+from tts_schedule import CueScheduler
+from tts_stems import export_stems
+from tts_stretch import TimingFitter
+from tts_subtitle import CueIndex, ms_to_time, parse_srt, split_sentences
+from tts_timeline import TimelineWriter
 
 class VolcanoTTS:
     def __init__(self, root):
@@ -20,37 +32,155 @@ class VolcanoTTS:
         self.root.geometry("850x800")  # 增加高度以容纳新控件
         self.root.resizable(False, False)  
         
-        # 创建加密密钥
-        self._create_crypto_key()
+        # 日志管道（任意线程写入，主线程定时批量刷新到界面；设置TTS_LOG_FILE可同时写入滚动文件）
+        self.log_sink = LogSink(root, log_file=os.environ.get("TTS_LOG_FILE"))
+        
+        # 加密组件与音频播放器在后台线程初始化，窗口先显示
+        self.cipher_suite = None
+        self._cipher_ready = threading.Event()
+        self._pygame = None
+        self._audio_ready = threading.Event()
         
         # 创建主容器，用于更好地管理布局
         self.main_container = ttk.Frame(root)
         self.main_container.pack(fill=tk.BOTH, expand=True)
         
-        # 配置参数
-        self.config = self._load_config()
-        self.default_api_key = self.config.get("api_key", "")
-        self.voice_id = self.config.get("voice_id", "")
-        self.default_speed = self.config.get("speed", 1.0)  # 默认语速
+        # 配置参数（解密后由后台线程回填到界面）；与其他应用共用config.json，本应用的数据在volcano命名空间下
+        self.config_store = ConfigStore("config.json", log=self._log)
+        self.config = {}
+        self.default_api_key = ""
+        self.voice_id = ""
+        self.default_speed = 1.0  # 默认语速
+        self.default_encoding = "mp3"  # 默认输出格式
         
         # 音频相关变量
-        self.base64_audio = None
         self.raw_response = ""
         self.audio_data = None  # 单段音频数据
+        self.audio_result = None  # 单段音频的合成结果（含编码与采样率）
+        self.text_chunks = []  # 文本模式按句子切分后各块的合成结果（未完成为None）
+        self.text_generating = False
+        self.play_chunk = 0  # 下一个要排入播放声道的块
+        self.text_channel = None
         self.audio_segments = []  # 字幕模式的多段音频
+        self.subtitle_options = None  # 字幕模式合成时使用的参数
         self.is_playing = False
         self.current_segment = 0
         self.raw_responses = []  # 存储所有API响应
-        self.playback_start_time = 0  # 播放开始的系统时间（毫秒）
+        self.playback_start_time = 0  # 时间轴零点对应的系统时间（毫秒）
+        self.cue_index = None  # 字幕音频的时间轴索引，用于跳转
+        # 边合成边预览：按开始时间排列的条目（None为尚未合成，False为没有音频）及其按字幕时间的索引
+        self.live_segments = []
+        self.live_positions = {}
+        self.live_index = None
+        self.subtitle_generating = False
+        self.scheduler = None  # 按播放位置决定合成顺序
+        self.play_segments = []  # 当前播放所用的段列表与索引
+        self.play_index = None
+        self._buffering = False
+        self._playback_job = None  # 已安排的下一段播放
+        self._scrubbing = False  # 正在拖动进度条
+        self._seek_job = None  # 进度条的定时刷新
+        self.progress_model = ProgressModel()  # 工作线程更新，界面按固定帧率采样
+        self.postprocessor = PostProcessor()  # 拼接前的静音裁剪、响度归一化与淡入淡出
+        self.fitter = TimingFitter(log=self._log)  # 超出字幕时长的条目本地压缩，超出过多时重新请求
+        self.fit_timing = False
         
-        # 初始化音频播放器
-        pygame.mixer.init()
+        # 合成引擎（复用HTTP连接，并发请求，沿用原有的0.5秒请求间隔）
+        # 设置TTS_SERVICE_URL时作为本地合成服务的客户端，限速、缓存和并发由服务统一管理
+        # 字符配额：按API密钥统计用量，设置了窗口上限时超出的请求等待下一个窗口；
+        # 作为服务客户端时由服务统一记账和限流，客户端不再重复统计
+        # 对冲请求（默认关闭）：耗时超过近期延迟高分位的请求再发一份，先返回的为准
+        # 熔断：服务商连续失败时暂停任务，探测到恢复后自动继续
+        self.quota = QuotaScheduler(ledger=QuotaLedger("quota_usage.json"), log=self._log)
+        self.hedge = HedgePolicy(enabled=False)
+        breaker = CircuitBreaker("火山引擎", log=self._log)
+        service_url = os.environ.get("TTS_SERVICE_URL")
+        if service_url:
+            self.engine = SynthesisEngine(
+                RemoteBackend(service_url, backend="volcano"),
+                max_workers=4,
+                timeout=300,
+                log=self._log,
+                breaker=breaker
+            )
+        else:
+            self.engine = SynthesisEngine(
+                VolcanoBackend(timeout=30),
+                max_workers=4,
+                timeout=30,
+                min_interval=0.5,
+                max_retries=2,
+                log=self._log,
+                quota=self.quota,
+                hedge=self.hedge,
+                breaker=breaker
+            )
         
         # 初始化界面
         self._init_ui()
+        
+        # 后台加载密钥、配置和音频播放器，不阻塞首次绘制
+        threading.Thread(target=self._load_settings_background, daemon=True).start()
+        threading.Thread(target=self._init_audio_background, daemon=True).start()
+    
+    def _load_settings_background(self):
+        """后台创建/读取加密密钥并解密配置，完成后回填界面"""
+        try:
+            self._create_crypto_key()
+        except Exception:
+            pass  # 错误已记录日志，配置按默认值处理
+        finally:
+            self._cipher_ready.set()
+        config = self._load_config()
+        self.root.after(0, lambda: self._apply_config(config))
+        
+        # 预热网络库，首次请求不再付出导入开销
+        try:
+            import requests  # noqa: F401
+        except ImportError:
+            self._log("警告：未安装requests库，无法发送合成请求")
+    
+    def _apply_config(self, config):
+        """把加载好的配置填入界面（主线程）"""
+        self.config = config
+        self.default_api_key = config.get("api_key", "")
+        self.voice_id = config.get("voice_id", "")
+        self.default_speed = config.get("speed", 1.0)
+        if not self.api_key_entry.get():
+            self.api_key_entry.insert(0, self.default_api_key)
+        if not self.voice_id_entry.get():
+            self.voice_id_entry.insert(0, self.voice_id)
+        self.speed_scale.set(self.default_speed)
+        self._update_speed_label(self.default_speed)
+        self.default_encoding = config.get("encoding", "mp3")
+        self.encoding_combo.set(encoding_label(self.default_encoding))
+        self.quota.limit = config.get("quota_chars", 0)
+        self.quota.window = config.get("quota_window", 60)
+        self.postprocessor.configure(config)
+        self.hedge.configure(config)
+        self.fit_var.set(bool(config.get("fit_timing", False)))
+        self.fitter.max_speed = float(config.get("max_stretch", 1.25))
+    
+    def _init_audio_background(self):
+        """后台导入pygame并初始化混音器"""
+        try:
+            import pygame
+            pygame.mixer.init()
+            self._pygame = pygame
+        except Exception as e:
+            self._log(f"初始化音频播放器失败: {str(e)}")
+        finally:
+            self._audio_ready.set()
+    
+    def _audio(self):
+        """返回已初始化的pygame模块（必要时等待后台初始化），不可用时返回None"""
+        self._audio_ready.wait(10)
+        return self._pygame
     
     def _create_crypto_key(self):
         """创建加密密钥，用于加密敏感信息"""
+        from cryptography.fernet import Fernet  # 需要安装cryptography库
+        
         key_path = "crypto.key"
         if not os.path.exists(key_path):
             try:
@@ -74,56 +204,65 @@ class VolcanoTTS:
         """加密数据"""
         if not data:
             return ""
+        self._cipher_ready.wait(10)
+        if self.cipher_suite is None:
+            raise RuntimeError("加密密钥不可用")
         return self.cipher_suite.encrypt(data.encode()).decode()
     
     def _decrypt_data(self, data):
         """解密数据"""
         if not data:
             return ""
+        self._cipher_ready.wait(10)
         try:
             return self.cipher_suite.decrypt(data.encode()).decode()
         except:
             return ""  # 解密失败返回空
     
     def _load_config(self):
-        """加载外部配置文件（加密存储敏感信息）"""
-        config_path = "config.json"
+        """加载配置文件的volcano命名空间（加密存储敏感信息）"""
         default_config = {
             "api_key": "",
             "voice_id": "",
-            "speed": 1.0  # 新增语速配置
+            "speed": 1.0,  # 新增语速配置
+            "encoding": "mp3",  # 输出格式
+            "quota_chars": 0,  # 每个配额窗口的字符上限，0为不限
+            "quota_window": 60,  # 配额窗口长度（秒）
+            **PostProcessor().config(),  # 音频后处理：开关、静音阈值(dBFS)、目标响度(dBFS)、淡入淡出(毫秒)
+            **HedgePolicy(enabled=False).config(),  # 对冲请求：开关、触发分位数、额外请求比例上限
+            "fit_timing": False,  # 超出字幕时长的音频自动适配
+            "max_stretch": 1.25  # 本地压缩的最大加速比，超过时重新请求
         }
         
-        # 如果配置文件不存在则创建
-        if not os.path.exists(config_path):
-            try:
-                with open(config_path, "w", encoding="utf-8") as f:
-                    json.dump(default_config, f, ensure_ascii=False, indent=2)
-                # 限制配置文件权限
-                os.chmod(config_path, 0o600)
-                return default_config
-            except Exception as e:
-                self._log(f"创建配置文件失败: {str(e)}")
-                return default_config
+        # 旧版本的平铺配置按本应用特有的speed字段识别后迁移
+        config = self.config_store.section("volcano", legacy_keys=("speed",))
+        
+        # 如果还没有本应用的配置则写入默认配置，便于手动修改
+        if config is None:
+            self.config_store.update("volcano", default_config)
+            self.config_store.flush()
+            return default_config
         
-        # 读取配置文件
         try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-            
             # 解密配置信息
             return {
                 "api_key": self._decrypt_data(config.get("api_key", "")),
                 "voice_id": self._decrypt_data(config.get("voice_id", "")),
-                "speed": float(config.get("speed", 1.0))  # 新增语速配置
+                "speed": float(config.get("speed", 1.0)),  # 新增语速配置
+                "encoding": config.get("encoding", "mp3") if config.get("encoding") in ENCODINGS else "mp3",
+                "quota_chars": int(config.get("quota_chars", 0)),
+                "quota_window": float(config.get("quota_window", 60)),
+                **{key: config[key] for key in PostProcessor().config() if key in config},
+                **{key: config[key] for key in HedgePolicy().config() if key in config},
+                "fit_timing": bool(config.get("fit_timing", False)),
+                "max_stretch": float(config.get("max_stretch", 1.25))
             }
         except Exception as e:
             self._log(f"读取配置文件失败: {str(e)}")
             return default_config
     
     def _save_config(self):
-        """保存配置到外部文件（加密存储敏感信息）"""
-        config_path = "config.json"
+        """保存配置到外部文件（加密存储敏感信息，点击按钮时立即写入）"""
         try:
             # 获取当前语速值
             current_speed = self.speed_scale.get()
@@ -132,16 +271,21 @@ class VolcanoTTS:
             encrypted_config = {
                 "api_key": self._encrypt_data(self.api_key_entry.get().strip()),
                 "voice_id": self._encrypt_data(self.voice_id_entry.get().strip()),
-                "speed": current_speed  # 新增保存语速配置
+                "speed": current_speed,  # 新增保存语速配置
+                "encoding": encoding_from_label(self.encoding_combo.get()),
+                "quota_chars": self.quota.limit,
+                "quota_window": self.quota.window,
+                **self.postprocessor.config(),
+                **self.hedge.config(),
+                "fit_timing": self.fit_var.get(),
+                "max_stretch": self.fitter.max_speed
             }
-            
-            with open(config_path, "w", encoding="utf-8") as f:
-                json.dump(encrypted_config, f, ensure_ascii=False, indent=2)
-            # 限制配置文件权限
-            os.chmod(config_path, 0o600)
-            self._log("配置已加密保存到config.json")
         except Exception as e:
             self._log(f"保存配置文件失败: {str(e)}")
+            return
+        self.config_store.update("volcano", encrypted_config)
+        if self.config_store.flush():  # 失败原因由配置存储记录到日志
+            self._log("配置已加密保存到config.json")
     
     def _init_ui(self):
         # 1. API配置区域
@@ -215,6 +359,17 @@ class VolcanoTTS:
         self.speed_label = ttk.Label(speed_row, text=f"{self.default_speed:.1f}x")
         self.speed_label.pack(side=tk.LEFT)
         
+        # 输出格式：PCM便于拼接时间轴，OGG Opus体积最小
+        ttk.Label(speed_row, text="输出格式：").pack(side=tk.LEFT, padx=(30, 10))
+        self.encoding_combo = ttk.Combobox(
+            speed_row,
+            state="readonly",
+            width=16,
+            values=[label for label, _ in ENCODINGS.values()]
+        )
+        self.encoding_combo.set(encoding_label(self.default_encoding))
+        self.encoding_combo.pack(side=tk.LEFT)
+        
         # 3. 配音模式选择（原3改为4）
         mode_frame = ttk.LabelFrame(self.main_container, text="4. 配音模式", padding=(15, 10))
         mode_frame.pack(fill=tk.X, padx=20, pady=5)
@@ -251,9 +406,39 @@ class VolcanoTTS:
         ttk.Entry(subtitle_row, textvariable=self.subtitle_path, width=50).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         ttk.Button(subtitle_row, text="选择SRT文件", command=self._select_subtitle).pack(side=tk.LEFT)
         
-        # 字幕内容预览
-        self.subtitle_preview = tk.Text(self.subtitle_frame, height=6, width=75)
-        self.subtitle_preview.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        # 音频超出字幕时长时自动压缩（超出过多时以更快语速重新请求）
+        self.fit_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(subtitle_row, text="适配字幕时长", variable=self.fit_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 字幕条目列表（只渲染可见行，合成状态实时更新；双击跳转到该条）
+        self.cue_list = CueListView(self.subtitle_frame, height=6, on_activate=self._seek_to_cue)
+        self.cue_list.frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        
+        # 播放定位：拖动进度条跳到任意时刻，或按字幕序号、上一条/下一条跳转
+        seek_row = ttk.Frame(self.subtitle_frame)
+        seek_row.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(seek_row, text="上一条", width=6, command=self._seek_previous).pack(side=tk.LEFT)
+        self.seek_var = tk.DoubleVar(value=0)
+        self.seek_scale = ttk.Scale(
+            seek_row,
+            from_=0,
+            to=1,
+            orient="horizontal",
+            variable=self.seek_var,
+            command=self._update_seek_label
+        )
+        self.seek_scale.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.seek_scale.bind("<ButtonPress-1>", self._on_scrub_start)
+        self.seek_scale.bind("<ButtonRelease-1>", self._on_scrub_end)
+        ttk.Button(seek_row, text="下一条", width=6, command=self._seek_next).pack(side=tk.LEFT)
+        self.seek_label = ttk.Label(seek_row, text="00:00:00 / 00:00:00")
+        self.seek_label.pack(side=tk.LEFT, padx=(10, 10))
+        ttk.Label(seek_row, text="第").pack(side=tk.LEFT)
+        self.seek_cue_entry = ttk.Entry(seek_row, width=6)
+        self.seek_cue_entry.pack(side=tk.LEFT, padx=2)
+        self.seek_cue_entry.bind("<Return>", lambda event: self._seek_cue())
+        ttk.Label(seek_row, text="条").pack(side=tk.LEFT)
+        ttk.Button(seek_row, text="跳转", width=5, command=self._seek_cue).pack(side=tk.LEFT, padx=(5, 0))
         
         # 6. 按钮区域（原6改为7）
         btn_frame = ttk.Frame(self.main_container, padding=(15, 10))
@@ -271,12 +456,23 @@ class VolcanoTTS:
         self.save_btn = ttk.Button(btn_frame, text="保存音频", command=self._save_audio, state="disabled")
         self.save_btn.pack(side="left", padx=10)
         
+        # 字幕模式：每条字幕单独保存为文件，附带清单，便于在剪辑软件中逐条调整
+        self.stems_btn = ttk.Button(btn_frame, text="导出分轨", command=self._export_stems, state="disabled")
+        self.stems_btn.pack(side="left", padx=10)
+        
         self.show_log_btn = ttk.Button(btn_frame, text="查看响应", command=self._show_raw, state="disabled")
         self.show_log_btn.pack(side="left", padx=10)
         
+        self.metrics_btn = ttk.Button(btn_frame, text="导出指标", command=self._export_metrics)
+        self.metrics_btn.pack(side="left", padx=10)
+        
         # 7. 进度条（原7改为8）
         self.progress = ttk.Progressbar(self.main_container, orient="horizontal", length=100, mode="determinate")
-        self.progress.pack(fill=tk.X, padx=20, pady=5)
+        self.progress.pack(fill=tk.X, padx=20, pady=(5, 0))
+        
+        self.progress_label = ttk.Label(self.main_container, text="")
+        self.progress_label.pack(fill=tk.X, padx=20, pady=(0, 5))
+        self.progress_view = ProgressView(self.root, self.progress_model, self.progress, self.progress_label)
         
         # 8. 操作日志区域（固定在最底部，原8改为9）
         log_frame = ttk.LabelFrame(root, text="9. 操作日志", padding=(15, 10))
@@ -289,6 +485,7 @@ class VolcanoTTS:
         scrollbar = ttk.Scrollbar(log_frame, command=self.log_text.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.log_text.config(yscrollcommand=scrollbar.set)
+        self.log_sink.attach(self.log_text)
     
     def _update_speed_label(self, value):
         """更新语速显示标签"""
@@ -337,12 +534,9 @@ class VolcanoTTS:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
             
-            # 显示字幕内容
-            self.subtitle_preview.delete(1.0, tk.END)
-            self.subtitle_preview.insert(tk.END, content)
-            
-            # 解析字幕
-            self.subtitles = self._parse_srt(content)
+            # 解析字幕并显示到条目列表
+            self.subtitles = parse_srt(content)
+            self.cue_list.load(self.subtitles)
             if self.subtitles:
                 self._log(f"成功加载字幕文件，共{len(self.subtitles)}条字幕")
             else:
@@ -351,54 +545,9 @@ class VolcanoTTS:
         except Exception as e:
             self._log(f"加载字幕失败：{str(e)}")
     
-    def _parse_srt(self, content):
-        """解析SRT格式字幕"""
-        # SRT格式正则表达式
-        pattern = re.compile(
-            r'(\d+)\r?\n'
-            r'(\d+:\d+:\d+,\d+) --> (\d+:\d+:\d+,\d+)\r?\n'
-            r'(.*?)\r?\n\r?\n',
-            re.DOTALL
-        )
-        
-        subtitles = []
-        for match in pattern.finditer(content):
-            index = match.group(1)
-            start_time = self._time_to_ms(match.group(2))
-            end_time = self._time_to_ms(match.group(3))
-            text = match.group(4).strip()
-            
-            # 计算字幕时长(毫秒)
-            duration = end_time - start_time
-            subtitles.append({
-                'index': index,
-                'start': start_time,
-                'end': end_time,
-                'duration': duration,
-                'text': text
-            })
-        
-        return subtitles
-    
-    def _time_to_ms(self, time_str):
-        """将SRT时间格式转换为毫秒"""
-        # 处理逗号为点，统一格式
-        time_str = time_str.replace(',', '.')
-        h, m, s = time_str.split(':')
-        s, ms = s.split('.')
-        
-        # 转换为总毫秒数
-        total_ms = (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(ms)
-        return total_ms
-    
     def _log(self, msg):
-        """安全更新日志"""
-        def _update():
-            self.log_text.config(state="normal")
-            self.log_text.insert(tk.END, f"[{time.strftime('%H:%M:%S')}] {msg}\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state="disabled")
-        self.root.after(0, _update)
+        """线程安全地记录日志（由日志管道批量刷新到界面）"""
+        self.log_sink.write(msg)
     
     def _show_raw(self):
         """显示API响应"""
@@ -429,6 +578,7 @@ class VolcanoTTS:
         
         # 获取语速值（限制在0.5-1.5之间）
         self.speed_ratio = max(0.5, min(1.5, round(float(self.speed_scale.get()), 1)))
+        self.encoding = encoding_from_label(self.encoding_combo.get())
         
         # 停止可能的播放
         self._stop_audio()
@@ -436,6 +586,7 @@ class VolcanoTTS:
         # 禁用按钮防止重复操作
         self.gen_btn.config(state="disabled")
         self.save_btn.config(state="disabled")
+        self.stems_btn.config(state="disabled")
         self.play_btn.config(state="disabled")
         self.stop_btn.config(state="disabled")
         self.show_log_btn.config(state="disabled")
@@ -451,6 +602,7 @@ class VolcanoTTS:
                 return
             
             self._log(f"开始生成文本语音（语速：{self.speed_ratio}x）...")
+            self.text_chunks = []
             threading.Thread(
                 target=self._generate_text_audio,
                 args=(self.api_key, self.voice_id, text),
@@ -463,7 +615,10 @@ class VolcanoTTS:
                 return
             
             self._log(f"开始生成{len(self.subtitles)}条字幕配音（语速：{self.speed_ratio}x）...")
-            self.progress["maximum"] = len(self.subtitles)
+            self.fit_timing = self.fit_var.get()
+            self._prepare_preview()
+            self.progress_model.begin(len(self.subtitles))
+            self.progress_view.start()
             self.raw_responses = []  # 重置响应列表
             threading.Thread(
                 target=self._generate_subtitle_audio,
@@ -472,153 +627,186 @@ class VolcanoTTS:
             ).start()
     
     def _generate_text_audio(self, api_key, voice_id, text):
-        """生成文本直接配音"""
+        """生成文本直接配音：长文本按句子切块并发合成，第一块完成即可开始播放"""
         try:
-            req_data = {
-                "app": {"cluster": "volcano_icl"},
-                "user": {"uid": "豆包语音"},
-                "audio": {
-                    "voice_type": voice_id,
-                    "encoding": "mp3",
-                    "speed_ratio": self.speed_ratio  # 使用选择的语速
-                },
-                "request": {
-                    "reqid": str(uuid.uuid4()).replace("-", ""),
-                    "text": text,
-                    "operation": "query"
-                }
-            }
-            
-            headers = {
-                "x-api-key": api_key,
-                "Content-Type": "application/json"
-            }
+            self.engine.backend.api_key = api_key
+            options = SynthesisOptions(voice_id, speed=self.speed_ratio, encoding=self.encoding)  # 使用选择的语速和格式
+            chunks = split_sentences(text, VOLCANO_MAX_TEXT_BYTES)
+            req_data = self.engine.backend.build_request(chunks[0], options)
             
             self._log(f"请求参数：{json.dumps(req_data, ensure_ascii=False)[:150]}...")
+            if len(chunks) > 1:
+                self._log(f"文本超过单次请求上限，按句子分为 {len(chunks)} 段并发合成")
+            
+            self.text_chunks = [None] * len(chunks)
+            self.text_generating = True
+            errors = {}
+            
+            def on_item(index, result, error):
+                if error is not None:
+                    errors[index] = error
+                elif result is not None:
+                    self.text_chunks[index] = result
+                    if index == 0:
+                        self.root.after(0, self._enable_play)
             
             # 发送请求
-            response = requests.post(
-                url="https://openspeech.bytedance.com/api/v1/tts",
-                headers=headers,
-                json=req_data,
-                timeout=30
-            )
+            job = self.engine.new_job("text")
+            try:
+                results = self.engine.synthesize_many(chunks, options, on_item=on_item, job=job)
+            finally:
+                self.text_generating = False
+                self.engine.metrics.end_job(job)
+                self._log(format_rollup(self.engine.metrics.rollup(job)))
             
-            self.raw_response = response.text
+            self.raw_response = "\n\n".join(result.raw for result in results if result is not None and result.raw)
+            if errors:
+                index = min(errors)
+                error = errors[index]
+                self.raw_response = getattr(error, 'raw', None) or self.raw_response
+                if self.raw_response:
+                    self.root.after(0, lambda: self.show_log_btn.config(state="normal"))
+                where = f"第 {index + 1}/{len(chunks)} 段" if len(chunks) > 1 else ""
+                self._log(f"错误：{where}{str(error)}")
+                return
             self.root.after(0, lambda: self.show_log_btn.config(state="normal"))
             
-            self._log(f"API响应：状态码{response.status_code}")
-            
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                except json.JSONDecodeError:
-                    self._log("错误：API返回数据不是有效的JSON格式")
-                    return
-                    
-                if result.get("code") == 3000 and result.get("message") == "Success":
-                    self.base64_audio = result.get("data")
-                    if self.base64_audio:
-                        # 解码音频数据用于播放
-                        try:
-                            self.audio_data = base64.b64decode(self.base64_audio)
-                            self._log(f"成功提取Base64音频！长度：{len(self.base64_audio)//1024}KB")
-                            self.root.after(0, lambda: self.save_btn.config(state="normal"))
-                            self.root.after(0, lambda: self.play_btn.config(state="normal"))
-                        except base64.binascii.Error:
-                            self._log("错误：Base64解码失败，音频数据格式错误")
-                    else:
-                        self._log("错误：response.data为空，无音频数据")
-                else:
-                    self._log(f"业务失败：code={result.get('code')}，message={result.get('message')}")
-            else:
-                self._log(f"API请求失败：状态码{response.status_code}")
+            # 按顺序拼接各块
+            first = results[0]
+            audio = self.engine.merge(results)
+            self.audio_result = SynthesisResult(audio, first.encoding, raw=self.raw_response,
+                                                cached=all(result.cached for result in results),
+                                                sample_rate=first.sample_rate)
+            self.audio_data = audio
+            self._log(f"成功提取音频！长度：{len(self.audio_data)//1024}KB" + ("（缓存）" if self.audio_result.cached else ""))
+            self.root.after(0, lambda: self.save_btn.config(state="normal"))
+            self.root.after(0, self._enable_play)
         except Exception as e:
             self._log(f"生成语音失败：{str(e)}")
         finally:
             self.root.after(0, lambda: self.gen_btn.config(state="normal"))
     
+    def _enable_play(self):
+        """第一块音频就绪后允许播放（正在播放时不变）"""
+        if not self.is_playing:
+            self.play_btn.config(state="normal")
+    
+    def _prepare_preview(self):
+        """生成前建立边合成边预览的时间轴和按播放位置的调度器（主线程）"""
+        cues = sorted(self.subtitles, key=lambda cue: cue['start'])
+        self.live_positions = {id(cue): position for position, cue in enumerate(cues)}
+        self.live_segments = [None] * len(cues)
+        self.live_index = CueIndex(
+            [cue['start'] for cue in cues],
+            [cue['end'] - cue['start'] for cue in cues],
+            [cue['index'] for cue in cues]
+        )
+        self.cue_index = None
+        self.subtitle_generating = True
+        self._reset_seek()
+        self.scheduler = CueScheduler(self.subtitles)
+        self.scheduler.move(self.seek_var.get())  # 从进度条所在位置开始合成
+        self.cue_list.reset()
+        self.cue_list.start()
+    
     def _generate_subtitle_audio(self, api_key, voice_id):
         """生成字幕文件配音"""
         try:
             self.audio_segments = []  # 重置音频段列表
+            self.engine.backend.api_key = api_key
+            options = SynthesisOptions(voice_id, speed=self.speed_ratio, encoding=self.encoding)  # 使用选择的语速和格式
+            self.subtitle_options = options  # 分轨清单记录音色与缓存键
             
-            for i, subtitle in enumerate(self.subtitles):
-                # 更新进度条
-                self.root.after(0, lambda val=i+1: self.progress.config(value=val))
-                
-                text = subtitle['text']
-                if not text:
+            def on_cue(subtitle, result, error):
+                position = self.live_positions[id(subtitle)]
+                if result is None:
+                    self.live_segments[position] = False
+                    self.cue_list.mark(subtitle, FAILED if error is not None else SKIPPED)
+                else:
+                    self.live_segments[position] = {'data': result.audio, 'subtitle': subtitle, 'result': result}
+                    self.cue_list.mark(subtitle, CACHED if result.cached else DONE,
+                                       duration_ms(result.audio, result.encoding, result.sample_rate))
+                    self.root.after(0, self._enable_play)  # 第一条就绪即可开始预览
+                if result is None and error is None:
                     self._log(f"跳过空字幕 #{subtitle['index']}")
-                    continue
-                    
-                self._log(f"正在处理字幕 #{subtitle['index']}: {text[:30]}...")
-                
-                req_data = {
-                    "app": {"cluster": "volcano_icl"},
-                    "user": {"uid": "豆包语音"},
-                    "audio": {
-                        "voice_type": voice_id,
-                        "encoding": "mp3",
-                        "speed_ratio": self.speed_ratio  # 使用选择的语速
-                    },
-                    "request": {
-                        "reqid": str(uuid.uuid4()).replace("-", ""),
-                        "text": text,
-                        "operation": "query"
-                    }
-                }
-                
-                headers = {
-                    "x-api-key": api_key,
-                    "Content-Type": "application/json"
-                }
-                
+                elif error is not None:
+                    raw = getattr(error, 'raw', None)
+                    if raw:
+                        self.raw_responses.append(f"字幕 #{subtitle['index']} 响应:\n{raw}")
+                    self._log(f"处理字幕 #{subtitle['index']} 出错: {str(error)}")
+                else:
+                    if result.raw:
+                        self.raw_responses.append(f"字幕 #{subtitle['index']} 响应:\n{result.raw}")
+                    self._log(f"成功生成字幕 #{subtitle['index']} 音频")
+            
+            self._log(format_estimate(self.engine.estimate([cue['text'] for cue in self.subtitles], options, dedupe=True)))
+            job = self.engine.new_job("subtitle")
+            try:
                 try:
-                    response = requests.post(
-                        url="https://openspeech.bytedance.com/api/v1/tts",
-                        headers=headers,
-                        json=req_data,
-                        timeout=30
+                    self.audio_segments = self.engine.synthesize_cues(
+                        self.subtitles, options, on_cue, job=job, progress=self.progress_model,
+                        scheduler=self.scheduler
                     )
-                    
-                    self.raw_responses.append(f"字幕 #{subtitle['index']} 响应:\n{response.text}")
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get("code") == 3000 and result.get("message") == "Success":
-                            base64_audio = result.get("data")
-                            if base64_audio:
-                                audio_data = base64.b64decode(base64_audio)
-                                self.audio_segments.append({
-                                    'data': audio_data,
-                                    'subtitle': subtitle
-                                })
-                                self._log(f"成功生成字幕 #{subtitle['index']} 音频")
-                            else:
-                                self._log(f"字幕 #{subtitle['index']} 无音频数据")
-                        else:
-                            self._log(f"字幕 #{subtitle['index']} 业务失败: {result.get('message')}")
-                    else:
-                        self._log(f"字幕 #{subtitle['index']} 请求失败: 状态码{response.status_code}")
-                        
-                except Exception as e:
-                    self._log(f"处理字幕 #{subtitle['index']} 出错: {str(e)}")
-                
-                # 避免请求过于频繁
-                time.sleep(0.5)
+                finally:
+                    self.subtitle_generating = False
+                # 先后处理再适配：裁掉首尾静音后需要压缩或重新请求的段更少
+                postprocess = self.audio_segments and self.postprocessor.should_process(options.encoding, self._log)
+                if postprocess:
+                    self._postprocess_segments(self.audio_segments)
+                if self.audio_segments and self.fit_timing:
+                    stats = self.fitter.fit(self.engine, self.audio_segments, options, job=job)
+                    self._log(f"时长适配：本地压缩 {stats['stretched']} 段，重新请求 {stats['requested']} 段，"
+                              f"仍超出 {stats['unfit']} 段")
+                    refetched = [segment for segment in self.audio_segments if 'options' in segment]
+                    if postprocess and refetched:
+                        self._postprocess_segments(refetched)  # 重新请求的段替换了已处理的音频
+            finally:
+                self.engine.metrics.end_job(job)
+            self._build_cue_index()
             
             self._log(f"字幕配音生成完成，共成功生成 {len(self.audio_segments)}/{len(self.subtitles)} 段音频")
+            self._log(format_rollup(self.engine.metrics.rollup(job)))
+            if self.engine.quota is not None:  # 作为服务客户端时用量由服务统计
+                self._log(f"当前API密钥累计用量 {self.engine.quota.ledger.usage(api_key)['total']} 字符")
             self.root.after(0, lambda: self.show_log_btn.config(state="normal"))
             if self.audio_segments:
-                self.root.after(0, lambda: self.play_btn.config(state="normal"))
+                self.root.after(0, self._enable_play)
                 self.root.after(0, lambda: self.save_btn.config(state="normal"))
+                self.root.after(0, lambda: self.stems_btn.config(state="normal"))
                 
         except Exception as e:
             self._log(f"生成字幕配音失败：{str(e)}")
         finally:
+            self.subtitle_generating = False
+            self.scheduler = None
+            self.root.after(0, self.progress_view.stop)
+            self.root.after(0, self.cue_list.stop)
             self.root.after(0, lambda: self.gen_btn.config(state="normal"))
     
+    def _postprocess_segments(self, segments):
+        """放到时间轴之前，批量裁剪各段首尾静音、统一响度并加淡入淡出"""
+        start = time.perf_counter()
+        self.postprocessor.process_segments(segments)
+        self._log(f"音频后处理完成：{len(segments)} 段，耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+    
+    def _export_metrics(self):
+        """导出请求计时指标（JSON Lines + Prometheus文本格式）"""
+        if not self.engine.metrics.jobs():
+            messagebox.showinfo("提示", "暂无指标数据")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("所有文件", "*.*")],
+            title="导出指标"
+        )
+        if file_path:
+            try:
+                prom_path = self.engine.metrics.export(file_path)
+                self._log(f"指标已导出到：{file_path} 和 {prom_path}")
+            except Exception as e:
+                self._log(f"导出指标失败：{str(e)}")
+                messagebox.showerror("错误", f"导出指标失败：{str(e)}")
+    
     def _play_audio(self):
         """播放音频（根据模式选择不同播放方式）"""
         if self.mode_var.get() == "text":
@@ -627,18 +815,21 @@ class VolcanoTTS:
             self._play_subtitle_audio()
     
     def _play_text_audio(self):
-        """播放文本生成的音频"""
-        if not self.audio_data:
+        """播放文本生成的音频（合成尚未完成时边合成边播放）"""
+        if not self.text_chunks or self.text_chunks[0] is None:
             messagebox.showinfo("提示", "没有可播放的音频数据")
             return
             
+        pygame = self._audio()
+        if pygame is None:
+            messagebox.showerror("错误", "音频播放器不可用")
+            return
+            
         try:
             # 停止当前播放
             pygame.mixer.stop()
-            
-            # 加载音频数据
-            sound = pygame.mixer.Sound(BytesIO(self.audio_data))
-            sound.play()
+            self.play_chunk = 0
+            self.text_channel = None
             
             # 更新状态
             self.is_playing = True
@@ -646,31 +837,58 @@ class VolcanoTTS:
             self.stop_btn.config(state="normal")
             self._log("开始播放音频...")
             
-            # 检查播放状态的定时器
+            # 检查播放状态的定时器（同时把后续分块排入声道）
             self._check_playback_status()
             
         except Exception as e:
             self._log(f"播放失败：{str(e)}")
             self.is_playing = False
     
-    def _play_subtitle_audio(self):
-        """播放字幕生成的分段音频"""
-        if not self.audio_segments:
+    def _play_subtitle_audio(self, from_ms=None):
+        """播放字幕生成的分段音频，from_ms为开始位置（默认为进度条所在位置）
+
+        生成过程中播放预览列表：尚未合成的条目到点时暂停时间轴等待（缓冲），
+        调度器始终优先合成播放头之后的条目。
+        """
+        timeline = self._timeline()
+        segments = self.audio_segments if timeline is self.cue_index else self.live_segments
+        if timeline is None or not any(segments):
             messagebox.showinfo("提示", "没有可播放的音频段")
             return
             
+        pygame = self._audio()
+        if pygame is None:
+            messagebox.showerror("错误", "音频播放器不可用")
+            return
+            
         try:
             # 停止当前播放
             pygame.mixer.stop()
+            self._cancel_playback()
             
-            self.current_segment = 0
+            if from_ms is None:
+                from_ms = self.seek_var.get()
+                if from_ms >= timeline.duration:
+                    from_ms = 0
+            from_ms = int(from_ms)
+            position, offset = timeline.locate(from_ms)
+            
+            self.play_segments, self.play_index = segments, timeline
+            self._buffering = False
+            if self.scheduler is not None:
+                self.scheduler.move(from_ms)
+            self.current_segment = position
             self.is_playing = True
             self.play_btn.config(state="disabled")
             self.stop_btn.config(state="normal")
-            self.playback_start_time = time.time() * 1000  # 记录开始时间（毫秒）
+            self.playback_start_time = time.time() * 1000 - from_ms  # 时间轴零点对应的系统时间（毫秒）
             
-            self._log("开始播放字幕音频...")
-            self._play_next_segment()
+            self._log(f"开始播放字幕音频（{ms_to_time(from_ms)}）...")
+            if offset > 0:
+                self._play_current_segment(offset)  # 从条目中间继续
+            else:
+                self._play_next_segment()
+            self._update_seek_position()
             
         except Exception as e:
             self._log(f"播放失败：{str(e)}")
@@ -678,68 +896,235 @@ class VolcanoTTS:
     
     def _play_next_segment(self):
         """播放下一段音频"""
-        if not self.is_playing or self.current_segment >= len(self.audio_segments):
+        if not self.is_playing or self.current_segment >= len(self.play_segments):
             self._stop_audio()
             self._log("字幕音频播放完成")
             return
             
-        # 获取当前段
-        segment = self.audio_segments[self.current_segment]
-        subtitle = segment['subtitle']
-        
         # 计算需要等待的时间（根据字幕时间戳）
         current_time = time.time() * 1000 - self.playback_start_time
-        wait_time = max(0, subtitle['start'] - current_time)
+        wait_time = max(0, self.play_index.starts[self.current_segment] - current_time)
         
         self._log(f"准备播放第 {self.current_segment + 1} 段字幕（等待 {wait_time:.0f}ms）")
         
         # 延迟播放当前段
-        self.root.after(int(wait_time), self._play_current_segment)
+        self._playback_job = self.root.after(int(wait_time), self._play_current_segment)
     
-    def _play_current_segment(self):
-        """播放当前段音频"""
+    def _play_current_segment(self, offset=0):
+        """播放当前段音频，offset为从该段第几毫秒开始"""
         if not self.is_playing:
             return
             
-        segment = self.audio_segments[self.current_segment]
+        segment = self.play_segments[self.current_segment]
+        if segment is None and self.subtitle_generating:
+            # 尚未合成：时间轴零点后移，播放位置停在原处，等待该条合成完成
+            if not self._buffering:
+                self._buffering = True
+                self._log(f"等待第 {self.play_index.numbers[self.current_segment]} 条字幕合成（缓冲中）...")
+            self.playback_start_time += 50
+            self._playback_job = self.root.after(50, lambda: self._play_current_segment(offset))
+            return
+        self._buffering = False
+        if not segment:
+            # 没有音频（空字幕或合成失败）
+            self.current_segment += 1
+            self._playback_job = self.root.after(0, self._play_next_segment)
+            return
         subtitle = segment['subtitle']
         
         try:
             # 加载并播放音频
-            sound = pygame.mixer.Sound(BytesIO(segment['data']))
+            result = segment['result']
+            sound = self._pygame.mixer.Sound(BytesIO(to_file_bytes(segment['data'], result.encoding, result.sample_rate)))
+            if offset > 0:
+                sound = self._slice_sound(sound, offset)
             sound.play()
             self._log(f"正在播放第 {self.current_segment + 1} 段: {subtitle['text'][:30]}...")
             
-            # 计算当前段播放时长（毫秒）
-            play_length = int(len(segment['data']) / 3.5)  # 粗略估算，实际应根据音频本身计算
+            # 当前段剩余的播放时长（毫秒）；预览索引中只有字幕时长，按解码后的实际长度计算
+            play_length = sound.get_length() * 1000
             
             # 准备播放下一段
             self.current_segment += 1
-            self.root.after(play_length, self._play_next_segment)
+            self._playback_job = self.root.after(int(play_length), self._play_next_segment)
             
         except Exception as e:
             self._log(f"播放第 {self.current_segment + 1} 段失败：{str(e)}")
             self.current_segment += 1
-            self.root.after(100, self._play_next_segment)
+            self._playback_job = self.root.after(100, self._play_next_segment)
+    
+    def _slice_sound(self, sound, offset):
+        """截去已解码音频的前offset毫秒（按混音器的采样格式计算字节位置）"""
+        frequency, size, channels = self._pygame.mixer.get_init()
+        frame = abs(size) // 8 * channels
+        raw = sound.get_raw()
+        return self._pygame.mixer.Sound(buffer=raw[int(offset * frequency / 1000) * frame:])
+    
+    def _cancel_playback(self):
+        """取消已安排的下一段播放"""
+        if self._playback_job is not None:
+            self.root.after_cancel(self._playback_job)
+            self._playback_job = None
+    
+    def _build_cue_index(self):
+        """按开始时间排序各段并建立时间轴索引（工作线程）"""
+        self.audio_segments.sort(key=lambda segment: segment['subtitle']['start'])
+        lengths = []
+        for segment in self.audio_segments:
+            result = segment['result']
+            length = duration_ms(segment['data'], result.encoding, result.sample_rate)
+            lengths.append(length if length is not None else int(len(segment['data']) / 3.5))
+            if length is not None:
+                self.cue_list.mark(segment['subtitle'], audio_ms=length)  # 后处理和时长适配后的实际时长
+        self.cue_index = CueIndex(
+            [segment['subtitle']['start'] for segment in self.audio_segments],
+            lengths,
+            [segment['subtitle']['index'] for segment in self.audio_segments]
+        )
+        self.root.after(0, self._reset_seek)
+    
+    def _reset_seek(self):
+        """时间轴变化后更新进度条范围（播放中不移动进度条）"""
+        duration = self._timeline().duration
+        self.seek_scale.config(to=max(1, duration))
+        if not self.is_playing:
+            position = min(self.seek_var.get(), duration)
+            self.seek_var.set(position)
+            self._update_seek_label(position)
+    
+    def _timeline(self):
+        """可跳转的时间轴：生成完成后为实际音频的索引，生成中为按字幕时间的预览索引"""
+        return self.cue_index if self.cue_index is not None else self.live_index
+    
+    def _playback_position(self):
+        """当前时间轴位置（毫秒）：播放中按系统时间推算，否则为进度条位置"""
+        if self.is_playing and self.mode_var.get() == "subtitle":
+            return time.time() * 1000 - self.playback_start_time
+        return self.seek_var.get()
+    
+    def _update_seek_position(self):
+        """播放期间定时刷新进度条（拖动时不刷新）"""
+        if self._seek_job is not None:
+            self.root.after_cancel(self._seek_job)
+            self._seek_job = None
+        if not self.is_playing or self.play_index is None:
+            return
+        if not self._scrubbing:
+            position = min(self._playback_position(), self._timeline().duration)
+            self.seek_var.set(position)
+            self._update_seek_label(position)
+            if self.scheduler is not None:
+                self.scheduler.move(position)
+        self._seek_job = self.root.after(200, self._update_seek_position)
+    
+    def _update_seek_label(self, value):
+        timeline = self._timeline()
+        total = timeline.duration if timeline is not None else 0
+        self.seek_label.config(text=f"{ms_to_time(float(value))[:8]} / {ms_to_time(total)[:8]}")
+    
+    def _on_scrub_start(self, event):
+        self._scrubbing = True
+    
+    def _on_scrub_end(self, event):
+        self._scrubbing = False
+        self._seek(self.seek_var.get())
+    
+    def _seek(self, ms):
+        """跳转到时间轴上的某一时刻；播放中时从该处继续播放，生成中时优先合成该处之后的条目"""
+        timeline = self._timeline()
+        if timeline is None:
+            return
+        ms = max(0, min(int(ms), timeline.duration))
+        self.seek_var.set(ms)
+        self._update_seek_label(ms)
+        position, _ = timeline.locate(ms)
+        if position < len(timeline):
+            self._log(f"跳转到 {ms_to_time(ms)}（第 {timeline.numbers[position]} 条字幕）")
+        if self.scheduler is not None:
+            self.scheduler.move(ms)
+        if self.is_playing and self.mode_var.get() == "subtitle":
+            self._play_subtitle_audio(ms)
+    
+    def _seek_cue(self):
+        """跳转到输入的字幕序号"""
+        timeline = self._timeline()
+        if timeline is None:
+            messagebox.showinfo("提示", "请先生成字幕配音")
+            return
+        number = self.seek_cue_entry.get().strip()
+        position = timeline.position(number)
+        if position is None:
+            messagebox.showerror("错误", f"没有第 {number} 条字幕的音频")
+            return
+        self._seek(timeline.starts[position])
+    
+    def _seek_to_cue(self, cue):
+        """跳转到字幕列表中选中的条目"""
+        timeline = self._timeline()
+        if timeline is None:
+            return
+        position = timeline.position(cue['index'])
+        if position is None:
+            self._log(f"第 {cue['index']} 条字幕没有音频")
+            return
+        self._seek(timeline.starts[position])
+    
+    def _seek_previous(self):
+        if self._timeline() is not None:
+            self._seek(self._timeline().previous_start(self._playback_position()))
+    
+    def _seek_next(self):
+        if self._timeline() is not None:
+            start = self._timeline().next_start(self._playback_position())
+            if start is not None:
+                self._seek(start)
     
     def _check_playback_status(self):
-        """检查音频播放状态"""
+        """检查音频播放状态，按顺序把已合成的块排入声道队列，块与块之间无间隙"""
         if not self.is_playing:
             return
+        
+        failed = False
+        try:
+            channel = self.text_channel
+            busy = channel is not None and channel.get_busy()
+            if self.play_chunk < len(self.text_chunks) and (not busy or channel.get_queue() is None):
+                result = self.text_chunks[self.play_chunk]
+                if result is not None:
+                    sound = self._pygame.mixer.Sound(BytesIO(to_file_bytes(result.audio, result.encoding, result.sample_rate)))
+                    if busy:
+                        channel.queue(sound)
+                    else:
+                        self.text_channel = sound.play()
+                        busy = self.text_channel is not None
+                    self.play_chunk += 1
+        except Exception as e:
+            self._log(f"播放失败：{str(e)}")
+            busy = False
+            failed = True
             
-        if not pygame.mixer.get_busy():
-            self._log("音频播放完成")
+        # 当前块播完、下一块仍在合成时继续等待；合成已结束而下一块仍缺失说明该块失败
+        finished = self.play_chunk >= len(self.text_chunks)
+        missing = not finished and not self.text_generating and self.text_chunks[self.play_chunk] is None
+        if not busy and (failed or finished or missing):
+            if finished:
+                self._log("音频播放完成")
+            elif missing:
+                self._log(f"第 {self.play_chunk + 1} 段音频不可用，播放中止")
             self.is_playing = False
             self.root.after(0, lambda: self.play_btn.config(state="normal"))
             self.root.after(0, lambda: self.stop_btn.config(state="disabled"))
             return
             
         # 继续检查
-        self.root.after(100, self._check_playback_status)
+        self.root.after(50, self._check_playback_status)
     
     def _stop_audio(self):
         """停止音频播放"""
-        pygame.mixer.stop()
+        pygame = self._audio()
+        if pygame is not None:
+            pygame.mixer.stop()
+        self._cancel_playback()
         self.is_playing = False
         self.root.after(0, lambda: self.play_btn.config(state="normal"))
         self.root.after(0, lambda: self.stop_btn.config(state="disabled"))
@@ -756,42 +1141,109 @@ class VolcanoTTS:
     
     def _save_text_audio(self):
         """保存文本生成的音频"""
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".mp3",
-            filetypes=[("MP3文件", "*.mp3"), ("所有文件", "*.*")],
-            title="保存音频文件"
-        )
+        result = self.audio_result
+        file_path = filedialog.asksaveasfilename(**self._save_dialog_options(result.encoding))
         
         if file_path:
             try:
                 with open(file_path, "wb") as f:
-                    f.write(self.audio_data)
+                    f.write(to_file_bytes(self.audio_data, result.encoding, result.sample_rate))
                 self._log(f"音频已保存到：{file_path}")
                 messagebox.showinfo("成功", f"音频已保存到：{file_path}")
             except Exception as e:
                 self._log(f"保存音频失败：{str(e)}")
                 messagebox.showerror("错误", f"保存音频失败：{str(e)}")
     
+    def _save_dialog_options(self, encoding):
+        """按音频编码生成保存对话框参数"""
+        ext = file_extension(encoding)
+        return {
+            "defaultextension": ext,
+            "filetypes": [(f"{encoding_label(encoding)}文件", f"*{ext}"), ("所有文件", "*.*")],
+            "title": "保存音频文件",
+        }
+    
     def _save_subtitle_audio(self):
-        """保存字幕生成的音频（合并为一个文件）"""
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".mp3",
-            filetypes=[("MP3文件", "*.mp3"), ("所有文件", "*.*")],
-            title="保存音频文件"
-        )
+        """保存字幕生成的音频（PCM/WAV按字幕时间轴放置，压缩格式按顺序合并为一个文件）"""
+        first = self.audio_segments[0]['result']
+        file_path = filedialog.asksaveasfilename(**self._save_dialog_options(first.encoding))
         
-        if file_path:
-            try:
-                # 简单合并（实际应用中可能需要更复杂的处理来保证间隙正确）
-                with open(file_path, "wb") as f:
-                    for segment in self.audio_segments:
-                        f.write(segment['data'])
-                
-                self._log(f"合并音频已保存到：{file_path}")
-                messagebox.showinfo("成功", f"合并音频已保存到：{file_path}")
-            except Exception as e:
-                self._log(f"保存音频失败：{str(e)}")
-                messagebox.showerror("错误", f"保存音频失败：{str(e)}")
+        if not file_path:
+            return
+        if first.encoding in ("pcm", "wav"):
+            # 长节目的时间轴直接写入内存映射的文件，在后台线程进行，不阻塞界面
+            self.save_btn.config(state="disabled")
+            threading.Thread(
+                target=self._export_timeline,
+                args=(file_path, list(self.audio_segments)),
+                daemon=True
+            ).start()
+            return
+        try:
+            # 压缩格式无法按采样位置放置，按帧顺序合并
+            merged = self.engine.merge([segment['result'] for segment in self.audio_segments])
+            with open(file_path, "wb") as f:
+                f.write(to_file_bytes(merged, first.encoding, first.sample_rate))
+            
+            self._log(f"合并音频已保存到：{file_path}")
+            messagebox.showinfo("成功", f"合并音频已保存到：{file_path}")
+        except Exception as e:
+            self._log(f"保存音频失败：{str(e)}")
+            messagebox.showerror("错误", f"保存音频失败：{str(e)}")
+    
+    def _export_stems(self):
+        """每条字幕单独保存为一个文件，并写入manifest.json"""
+        if not self.audio_segments:
+            messagebox.showinfo("提示", "没有可导出的字幕音频")
+            return
+        directory = filedialog.askdirectory(title="选择分轨导出目录")
+        if not directory:
+            return
+        self.stems_btn.config(state="disabled")
+        threading.Thread(
+            target=self._write_stems,
+            args=(directory, list(self.audio_segments), self.subtitle_options),
+            daemon=True
+        ).start()
+    
+    def _write_stems(self, directory, segments, options):
+        try:
+            self.progress_model.begin(len(segments))
+            self.root.after(0, self.progress_view.start)
+            manifest = export_stems(
+                segments, directory, options, self.engine.backend.name,
+                on_item=lambda done, total: self.progress_model.item_done(True)
+            )
+            self._log(f"已导出 {manifest['count']} 条分轨到：{directory}（耗时 {manifest['elapsed_s']:.2f} 秒）")
+        except Exception as e:
+            message = f"导出分轨失败：{str(e)}"
+            self._log(message)
+            self.root.after(0, lambda: messagebox.showerror("错误", message))
+        finally:
+            self.progress_model.finish()
+            self.root.after(0, self.progress_view.stop)
+            self.root.after(0, lambda: self.stems_btn.config(state="normal"))
+    
+    def _export_timeline(self, file_path, segments):
+        """按字幕开始时间把各段写入WAV时间轴"""
+        try:
+            rate = segments[0]['result'].sample_rate
+            duration = max(segment['subtitle']['end'] for segment in segments)
+            skipped = 0
+            with TimelineWriter(file_path, duration, rate) as timeline:
+                for segment in segments:
+                    if not timeline.write_result(segment['subtitle']['start'], segment['result']):
+                        skipped += 1
+            if skipped:
+                self._log(f"{skipped} 段音频的格式或采样率与时间轴不一致，未写入")
+            self._log(f"时间轴音频已保存到：{file_path}（{timeline.duration_ms / 1000:.1f}秒）")
+            self.root.after(0, lambda: messagebox.showinfo("成功", f"时间轴音频已保存到：{file_path}"))
+        except Exception as e:
+            message = f"保存音频失败：{str(e)}"
+            self._log(message)
+            self.root.after(0, lambda: messagebox.showerror("错误", message))
+        finally:
+            self.root.after(0, lambda: self.save_btn.config(state="normal"))
 
 if __name__ == "__main__":
     root = tk.Tk()